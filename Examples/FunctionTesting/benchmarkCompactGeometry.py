@@ -0,0 +1,71 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     benchmarkCompactGeometry.py
+#
+#     Compare memory and time of elements with the default style dictionary and
+#     elements with compactGeometry = True (GeometryStyle), on 100k elements.
+#     The compact style is a memory optimization only: it uses less than half
+#     of the style bytes, but reading and writing the geometry values is slower,
+#     as they go through Python methods instead of the dictionary table.
+#
+import sys
+from time import time
+
+from pagebot.document import Document
+from pagebot.elements.element import Element
+
+ELEMENTS = 100000
+COLUMNS = 400
+
+class CompactElement(Element):
+    compactGeometry = True
+
+def styleSize(style):
+    u"""Answer the approximate number of bytes used by the style, its dictionary and its geometry list."""
+    size = sys.getsizeof(style)
+    for name in ('_values', '_geometry'):
+        value = getattr(style, name, None)
+        if value is not None:
+            size += sys.getsizeof(value)
+    return size
+
+def benchmark(elementClass):
+    doc = Document(w=COLUMNS*10, h=(ELEMENTS/COLUMNS+1)*10, autoPages=1)
+    page = doc[0]
+    t = time()
+    for n in range(ELEMENTS):
+        elementClass(parent=page, x=(n % COLUMNS)*10, y=(n / COLUMNS)*10, w=8.5, h=8.5, mt=0.5, ml=0.5)
+    tCreate = time() - t
+
+    t = time()
+    total = 0
+    for e in page.elements:
+        total += e.x + e.y + e.w + e.h + e.mt + e.ml + e.mLeft + e.mTop
+    tRead = time() - t
+
+    t = time()
+    for e in page.elements:
+        e.x += 1
+        e.h = 9.5
+    tWrite = time() - t
+
+    size = 0
+    for e in page.elements:
+        size += styleSize(e.style)
+    return tCreate, tRead, tWrite, size
+
+print('%d elements' % ELEMENTS)
+print('%-16s %10s %10s %10s %14s' % ('Style', 'Create', 'Read', 'Write', 'Style bytes'))
+for label, elementClass in (('CascadingStyle', Element), ('GeometryStyle', CompactElement)):
+    tCreate, tRead, tWrite, size = benchmark(elementClass)
+    print('%-16s %9.2fs %9.2fs %9.2fs %14d' % (label, tCreate, tRead, tWrite, size))
+print('GeometryStyle saves memory, not time: reads and writes are slower than in CascadingStyle.')
@@ -16,16 +16,21 @@ __doc__ = """PageBot module"""
 
 __version__ = '0.8-beta'
 
-import CoreText
-import AppKit
-import Quartz
-
 import re
-from drawBot import FormattedString, cmykFill, fill, cmykStroke, stroke, strokeWidth, \
-    hyphenation, cmykLinearGradient, linearGradient, cmykRadialGradient, radialGradient,\
-    shadow, textSize
-
-from drawBot.context.baseContext import BaseContext
+import weakref
+from bisect import bisect_left
+try:
+    import CoreText
+    import AppKit
+    import Quartz
+    from drawBot import FormattedString, cmykFill, fill, cmykStroke, stroke, strokeWidth, \
+        hyphenation, cmykLinearGradient, linearGradient, cmykRadialGradient, radialGradient,\
+        shadow, textSize
+    from drawBot.context.baseContext import BaseContext
+except ImportError: # Headless, only the modules that don't need DrawBot can be used, e.g. toolbox.textlayout
+    CoreText = AppKit = Quartz = BaseContext = None
+    FormattedString = cmykFill = fill = cmykStroke = stroke = strokeWidth = hyphenation = None
+    cmykLinearGradient = linearGradient = cmykRadialGradient = radialGradient = shadow = textSize = None
 
 from pagebot.style import NO_COLOR, LEFT
 from pagebot.toolbox.transformer import point2D
@@ -390,10 +395,16 @@ def setShadow(eShadow):
 
 def deepFind(elements, name=None, pattern=None, result=None):
     u"""Perform a dynamic deep find for all elements with the *name*. Don't include self.
-    Either *name* or *pattern* should be defined, otherwise an error is raised."""
+    Either *name* or *pattern* should be defined, otherwise an error is raised.
+    If *elements* are the child elements of a container in a document, then the element index of
+    the document is used by container.deepFind(), instead of a recursive search."""
     assert name or pattern
     if result is None:
         result = []
+        if elements:
+            parent = elements[0].parent
+            if getattr(parent, 'elements', None) is elements and parent.doc is not None:
+                return parent.deepFind(name, pattern)
     for e in elements:
         if pattern is not None and pattern in e.name: # Simple pattern match
             result.append(e)
@@ -430,7 +441,9 @@ def getMarker(markerId, arg=None):
     Note that there is a potential problem of slicing through the argument string at
     the end of a textBox. That is another reason to keep the length of the arguments short.
     And not to use any spaces, etc. inside the markerId.
-    Possible slicing through line-endings is not a problem, as the raw string ignores them."""
+    Possible slicing through line-endings is not a problem, as the raw string ignores them.
+    Text boxes keep their markers in a side-table instead, see TextBox.appendMarker, so they
+    don't need to be scanned by findMarkers."""
     marker = MARKER_PATTERN % (markerId, arg or '')
     return FormattedString(marker, fill=None, stroke=None, fontSize=0.0000000000001)
     ###return FormattedString(marker, fill=(1, 0, 0), stroke=None, fontSize=10)
@@ -441,6 +454,17 @@ def findMarkers(fs, reCompiled=None):
         reCompiled= FIND_FS_MARKERS
     return reCompiled.findall(u'%s' % fs)
 
+def sliceMarkers(markers, start, end=None):
+    u"""Answer the part of the marker side-table *markers*, a sorted list of (index, markerId, arg),
+    with string index from *start* up to *end*, relative to *start*. If *end* is None, then all
+    markers from *start* are answered, including the ones at the end of the string."""
+    first = bisect_left(markers, (start,))
+    if end is None:
+        last = len(markers)
+    else:
+        last = bisect_left(markers, (end,), first)
+    return [(index - start, markerId, arg) for index, markerId, arg in markers[first:last]]
+
 def css(name, e, styles=None, default=None):
     u"""Answer the named style values. Search in optional style dict first, otherwise up the
     parent tree of styles in element e. Both e and style can be None. In that case None is answered."""
@@ -454,115 +478,205 @@ def css(name, e, styles=None, default=None):
         return e.css(name)
     return default
 
+def _relative(sValue, rValue, fontSize):
+    u"""Answer the absolute value of *sValue* plus *rValue* relative to *fontSize*. Answer None if neither
+    of them defines a value."""
+    if sValue or (rValue and fontSize):
+        return (sValue or 0) + (rValue or 0) * (fontSize or 0)
+    return None
+
+class TextStyle(object):
+    u"""Text attributes of element *e* and *style* (a single style or a stack of styles), resolved once
+    by css(). The object is immutable, newFS answers the cached instance for the combination of e and
+    style, see getTextStyle. For every font size the attributes are set once in an empty template
+    FormattedString, so formatting a plain string is one concatenation with the template.
+    Text sizes of strings at the default font size are cached for fitting strings to a width or height."""
+    MAX_SIZES = 256 # Maximum number of cached text sizes.
+    MAX_TEMPLATES = 64 # Maximum number of cached template strings, e.g. fitting makes one per font size.
+
+    def __init__(self, e=None, style=None):
+        def get(name, default=None):
+            return css(name, e, style, default)
+        self.hyphenation = get('hyphenation')
+        self.font = get('font')
+        self.fontSize = get('fontSize') or 16 # Default font size, may be scaled to fit w or h.
+        self.leading = get('leading'), get('rLeading')
+        self.fallbackFont = get('fallbackFont')
+        self.fill = get('textFill')
+        self.cmykFill = get('cmykFill', NO_COLOR)
+        self.stroke = get('textStroke', NO_COLOR)
+        self.strokeWidth = get('textStrokeWidth')
+        self.cmykStroke = get('cmykStroke', NO_COLOR)
+        self.align = get('xTextAlign') # Warning: xAlign is used for element alignment, not text.
+        self.paragraphTopSpacing = get('paragraphTopSpacing'), get('rParagraphTopSpacing')
+        self.paragraphBottomSpacing = get('paragraphBottomSpacing'), get('rParagraphBottomSpacing')
+        self.tracking = get('tracking'), get('rTracking')
+        self.baselineShift = get('baselineShift'), get('rBaselineShift')
+        self.openTypeFeatures = get('openTypeFeatures')
+        self.tabs = get('tabs')
+        self.firstLineIndent = get('firstLineIndent'), get('rFirstLineIndent')
+        # TODO: Use firstParagraphIndent instead, if current tag is different from previous tag.
+        # TODO: Use firstColumnIndent instead, if currently on top of a new string.
+        self.indent = get('indent'), get('rIndent')
+        self.tailIndent = get('tailIndent'), get('rTaildIndent')
+        self.language = get('language')
+        if get('uppercase'):
+            self.textTransform = 'upper'
+        elif get('lowercase'):
+            self.textTransform = 'lower'
+        elif get('capitalized'):
+            self.textTransform = 'capitalize'
+        else:
+            self.textTransform = None
+        self._templates = {} # fontSize --> FormattedString('') with all attributes set.
+        self._sizes = {} # Plain string --> (w, h) at self.fontSize
+
+    def __repr__(self):
+        return '[%s font=%s fontSize=%s]' % (self.__class__.__name__, self.font, self.fontSize)
+
+    def getTemplate(self, fontSize=None):
+        u"""Answer the empty FormattedString with the attributes of self for *fontSize*. The template is
+        shared and must not be altered by the caller."""
+        fontSize = fontSize or self.fontSize
+        fs = self._templates.get(fontSize)
+        if fs is not None:
+            return fs
+        fs = FormattedString('')
+        if self.font is not None:
+            fs.font(self.font)
+        lineHeight = _relative(self.leading[0], self.leading[1], fontSize)
+        if lineHeight:
+            fs.lineHeight(lineHeight)
+        fs.fontSize(fontSize) # For some reason fontSize must be set after leading.
+        if self.fallbackFont is not None:
+            fs.fallbackFont(self.fallbackFont)
+        if self.fill is not NO_COLOR: # Test on this flag, None is valid value
+            setFillColor(self.fill, fs)
+        if self.cmykFill is not NO_COLOR:
+            setFillColor(self.cmykFill, fs, cmyk=True)
+        if self.stroke is not NO_COLOR:
+            setStrokeColor(self.stroke, self.strokeWidth, fs)
+        if self.cmykStroke is not NO_COLOR:
+            setStrokeColor(self.cmykStroke, self.strokeWidth, fs, cmyk=True)
+        if self.align is not None: # yTextAlign must be solved by parent container element.
+            fs.align(self.align)
+        for name in ('paragraphTopSpacing', 'paragraphBottomSpacing', 'tracking', 'baselineShift',
+                'firstLineIndent', 'tailIndent'):
+            value = _relative(getattr(self, name)[0], getattr(self, name)[1], fontSize)
+            if value is not None:
+                getattr(fs, name)(value)
+        if self.openTypeFeatures is not None:
+            fs.openTypeFeatures([], **self.openTypeFeatures)
+        if self.tabs is not None:
+            fs.tabs(*self.tabs)
+        sIndent, rIndent = self.indent
+        if sIndent is not None or rIndent is not None:
+            fs.indent((sIndent or 0) + (rIndent or 0) * fontSize)
+        if self.language is not None:
+            fs.language(self.language)
+        if len(self._templates) >= self.MAX_TEMPLATES:
+            self._templates = {}
+        self._templates[fontSize] = fs
+        return fs
+
+    def transform(self, t):
+        u"""Answer the plain string *t* in the case of self."""
+        if self.textTransform == 'upper':
+            return t.upper()
+        if self.textTransform == 'lower':
+            return t.lower()
+        if self.textTransform == 'capitalize':
+            return t.capitalize()
+        return t
+
+    def apply(self, t, fontSize=None):
+        u"""Answer a new FormattedString of the plain string *t* with the attributes of self."""
+        hyphenation(self.hyphenation) # TODO: Should be text attribute, not global
+        return self.getTemplate(fontSize) + self.transform(t)
+
+    def getTextSize(self, t):
+        u"""Answer the cached (w, h) of the plain string *t* with the attributes of self at self.fontSize."""
+        size = self._sizes.get(t)
+        if size is None:
+            if len(self._sizes) >= self.MAX_SIZES:
+                self._sizes = {}
+            size = self._sizes[t] = textSize(self.apply(t))
+        return size
+
+    def fit(self, t, w=None, h=None):
+        u"""Answer a new FormattedString of the plain string *t*, with the font size scaled from the cached
+        text size, to make it fit the target width *w* or height *h*."""
+        tw, th = self.getTextSize(t)
+        if w is not None:
+            return self.apply(t, w / tw * self.fontSize)
+        return self.apply(t, h / th * self.fontSize)
+
+# Cache of TextStyle instances of elements: e --> (e.cssVersion, {styleIds: (styles, copies, textStyle)})
+TEXT_STYLES = weakref.WeakKeyDictionary()
+TEXT_STYLES_NO_ELEMENT = {} # Cached TextStyle instances for newFS calls without element.
+MAX_TEXT_STYLES = 1024 # Maximum number of cached TextStyle instances per element.
+
+def _copyStyleValue(value):
+    u"""Answer a copy of *value*, including the dictionaries, lists and sets in it, so values that are
+    changed in place are different from their copy."""
+    if isinstance(value, dict):
+        return dict([(name, _copyStyleValue(v)) for name, v in value.items()])
+    if isinstance(value, list):
+        return [_copyStyleValue(v) for v in value]
+    if isinstance(value, tuple):
+        return tuple([_copyStyleValue(v) for v in value])
+    if isinstance(value, set):
+        return set(value)
+    return value
+
+def getTextStyle(e=None, style=None):
+    u"""Answer the TextStyle of element *e* and *style* (a single style dictionary or a stack of style
+    dictionaries). The instance is cached, keyed by the identity of the style dictionaries, and it is
+    valid as long as the dictionaries are equal to their copies made at caching time and as long as
+    the css version of *e* did not change. The copies include the nested dictionaries and lists, such
+    as tabs, so values that are changed in place are noticed too."""
+    if style is None:
+        styles = ()
+    elif isinstance(style, (tuple, list)):
+        styles = tuple(style)
+    else:
+        styles = (style,)
+    for s in styles:
+        if not isinstance(s, dict): # Cannot check other types on changes.
+            return TextStyle(e, style)
+    if e is None:
+        cache = TEXT_STYLES_NO_ELEMENT
+    else:
+        version, cache = TEXT_STYLES.get(e, (None, None))
+        if version != e.cssVersion:
+            cache = {}
+            TEXT_STYLES[e] = e.cssVersion, cache
+    key = tuple([id(s) for s in styles])
+    cached = cache.get(key)
+    if cached is not None and cached[1] == list(styles): # Compare with the copies, style may have changed.
+        return cached[2]
+    if len(cache) >= MAX_TEXT_STYLES:
+        cache.clear()
+    textStyle = TextStyle(e, style)
+    cache[key] = styles, [_copyStyleValue(s) for s in styles], textStyle # Keeps styles alive, so ids stay unique.
+    return textStyle
+
 def newFS(t, e=None, style=None, w=None, h=None, fontSize=None):
     u"""Answer a *FormattedString* instance from valid attributes in *style*. Set all values after testing
     their existence, so they can inherit from previous style formats.
-    If target width *w* or height *h* is defined, then *fontSize* is scaled to make the string fit *w* or *h*."""
-
-    hyphenation(css('hyphenation', e, style)) # TODO: Should be text attribute, not global
-
-    fs = FormattedString('')
-    sFont = css('font', e, style)
-    if sFont is not None:
-        fs.font(sFont)
-    # Forced fontSize, then this overwrites the style['fontSize'] if it is there.
-    sFontSize = fontSize or css('fontSize', e, style) or 16 # May be scaled to fit w or h if target is defined.
-    sLeading = css('leading', e, style)
-    rLeading = css('rLeading', e, style)
-    if sLeading or (rLeading and sFontSize):
-        lineHeight = (sLeading or 0) + (rLeading or 0) * (sFontSize or 0)
-        if lineHeight:
-            fs.lineHeight(lineHeight)
-    if sFontSize is not None:
-        fs.fontSize(sFontSize) # For some reason fontSize must be set after leading.
-    sFallbackFont = css('fallbackFont', e, style)
-    if sFallbackFont is not None:
-        fs.fallbackFont(sFallbackFont)
-    sFill = css('textFill', e, style)
-    if sFill is not NO_COLOR: # Test on this flag, None is valid value
-        setFillColor(sFill, fs)
-    sCmykFill = css('cmykFill', e, style, NO_COLOR)
-    if sCmykFill is not NO_COLOR:
-        setFillColor(sCmykFill, fs, cmyk=True)
-    sStroke = css('textStroke', e, style, NO_COLOR)
-    sStrokeWidth = css('textStrokeWidth', e, style)
-    if sStroke is not NO_COLOR and strokeWidth is not None:
-        setStrokeColor(sStroke, sStrokeWidth, fs)
-    sCmykStroke = css('cmykStroke', e, style, NO_COLOR)
-    if sCmykStroke is not NO_COLOR:
-        setStrokeColor(sCmykStroke, sStrokeWidth, fs, cmyk=True)
-    sAlign = css('xTextAlign', e, style) # Warning: xAlign is used for element alignment, not text.
-    if sAlign is not None: # yTextAlign must be solved by parent container element.
-        fs.align(sAlign)
-    sParagraphTopSpacing = css('paragraphTopSpacing', e, style)
-    rParagraphTopSpacing = css('rParagraphTopSpacing', e, style)
-    if sParagraphTopSpacing or (rParagraphTopSpacing and sFontSize):
-        fs.paragraphTopSpacing((sParagraphTopSpacing or 0) + (rParagraphTopSpacing or 0) * (sFontSize or 0))
-    sParagraphBottomSpacing = css('paragraphBottomSpacing', e, style)
-    rParagraphBottomSpacing = css('rParagraphBottomSpacing', e, style)
-    if sParagraphBottomSpacing or (rParagraphBottomSpacing and sFontSize):
-        fs.paragraphBottomSpacing((sParagraphBottomSpacing or 0) + (rParagraphBottomSpacing or 0) * (sFontSize or 0))
-    sTracking = css('tracking', e, style)
-    rTracking = css('rTracking', e, style)
-    if sTracking or (rTracking and sFontSize):
-        fs.tracking((sTracking or 0) + (rTracking or 0) * (sFontSize or 0))
-    sBaselineShift = css('baselineShift', e, style)
-    rBaselineShift = css('rBaselineShift', e, style)
-    if sBaselineShift or (rBaselineShift and sFontSize):
-        fs.baselineShift((sBaselineShift or 0) + (rBaselineShift or 0) * (sFontSize or 0))
-    sOpenTypeFeatures = css('openTypeFeatures', e, style)
-    if sOpenTypeFeatures is not None:
-        fs.openTypeFeatures([], **sOpenTypeFeatures)
-    sTabs = css('tabs', e, style)
-    if sTabs is not None:
-        fs.tabs(*sTabs)
-    sFirstLineIndent = css('firstLineIndent', e, style)
-    rFirstLineIndent = css('rFirstLineIndent', e, style)
-    # TODO: Use this value instead, if current tag is different from previous tag. How to get this info?
-    # sFirstParagraphIndent = style.get('firstParagraphIndent')
-    # rFirstParagraphIndent = style.get('rFirstParagraphIndent')
-    # TODO: Use this value instead, if currently on top of a new string.
-    sFirstColumnIndent = css('firstColumnIndent', e, style)
-    rFirstColumnIndent = css('rFirstColumnIndent', e, style)
-    if sFirstLineIndent or (rFirstLineIndent and sFontSize):
-        fs.firstLineIndent((sFirstLineIndent or 0) + (rFirstLineIndent or 0) * (sFontSize or 0))
-    sIndent = css('indent', e, style)
-    rIndent = css('rIndent', e, style)
-    if sIndent is not None or (rIndent is not None and sFontSize is not None):
-        fs.indent((sIndent or 0) + (rIndent or 0) * (sFontSize or 0))
-    sTailIndent = css('tailIndent', e, style)
-    rTailIndent = css('rTaildIndent', e, style)
-    if sTailIndent or (rTailIndent and sFontSize):
-        fs.tailIndent((sTailIndent or 0) + (rTailIndent or 0) * (sFontSize or 0))
-    sLanguage = css('language', e, style)
-    if sLanguage is not None:
-        fs.language(sLanguage)
-
-    sUpperCase = css('uppercase', e, style)
-    sLowercase = css('lowercase', e, style)
-    sCapitalized = css('capitalized', e, style)
-    if sUpperCase:
-        t = t.upper()
-    elif sLowercase:
-        t = t.lower()
-    elif sCapitalized:
-        t = t.capitalize()
-
-    newt = fs + t # Format plain string t onto new formatted fs.
-    if w is not None: # There is a target width defined, calculate again with the fontSize ratio correction. 
-        tw, _ = textSize(newt)
-        fontSize = w / tw * sFontSize
-        newt = newFS(t, e, style, fontSize=fontSize)
-    elif h is not None: # There is a target height defined, calculate again with the fontSize ratio correction. 
-        _, th = textSize(newt)
-        fontSize = h / th * sFontSize
-        newt = newFS(t, e, style, fontSize=fontSize)
-
-    return newt
-
-def textBoxBaseLines(txt, box):
+    If target width *w* or height *h* is defined, then *fontSize* is scaled to make the string fit *w* or *h*.
+    The attributes are resolved once for each combination of *e* and *style*, see getTextStyle."""
+    textStyle = getTextStyle(e, style)
+    if w is not None or h is not None:
+        return textStyle.fit(t, w, h)
+    return textStyle.apply(t, fontSize)
+
+def textBoxBaseLines(txt, box, layout=None):
     u"""Answer a list of (x,y) positions of all line starts in the box. This function may become part
-    of standard DrawBot in the near future."""
+    of standard DrawBot in the near future. Optional *layout* is the text layout to use instead of
+    CoreText, see toolbox.textlayout."""
+    if layout is not None:
+        return layout.getBaseLines(txt, box)
     x, y, w, h = box
     attrString = txt.getNSObject()
     setter = CoreText.CTFramesetterCreateWithAttributedString(attrString)
@@ -573,9 +687,12 @@ def textBoxBaseLines(txt, box):
     origins = CoreText.CTFrameGetLineOrigins(box, (0, len(ctLines)), None)
     return [(x + o.x, y + o.y) for o in origins]
 
-def textPositionSearch(fs, w, h, search, xTextAlign=LEFT, hyphenation=True):
-    u"""
-    """
+def textPositionSearch(fs, w, h, search, xTextAlign=LEFT, hyphenation=True, layout=None):
+    u"""Answer the list of (line, (x, y, w, h)) rectangles of the matches of the regular expression
+    *search* in the lines of *fs* in a box of (w, h). Optional *layout* is the text layout to use
+    instead of CoreText, see toolbox.textlayout."""
+    if layout is not None:
+        return layout.textPositionSearch(fs, w, h, search)
     bc = BaseContext()
     path = CoreText.CGPathCreateMutable()
     CoreText.CGPathAddRect(path, None, CoreText.CGRectMake(0, 0, w, h))
@@ -0,0 +1,72 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     incrementalexport.py
+#
+#     Export that reuses the rendered pages of previous builds, used by
+#     View.exportIncremental. Every page is rendered to its own file in the
+#     cache folder, named by the content hash of the page (see
+#     toolbox.pagehash). Pages of which the file already exists are not drawn
+#     again. The page files are merged into one PDF, or copied as numbered
+#     images, in the order of the pages.
+#
+import os
+import shutil
+from time import time
+
+try:
+    from drawBot import saveImage, newDrawing, endDrawing
+except ImportError: # Headless, see pagebot/__init__.py
+    saveImage = newDrawing = endDrawing = None
+
+from pagebot.builders.pagewriter import mergePdfFiles, ImagePageWriter
+from pagebot.toolbox.pagehash import PageHasher
+
+def exportIncremental(view, fileName, cacheFolder, pageSelection=None):
+    u"""Export the sorted pages of view.parent to *fileName*, reusing the page files in *cacheFolder* of pages
+    with the same content hash. Answer the report dictionary with the number of reused and rebuilt pages,
+    the time and the list of (pageName, hash, reused) in the order of the pages."""
+    startTime = time()
+    doc = view.parent
+    if not os.path.exists(cacheFolder):
+        os.makedirs(cacheFolder)
+    extension = os.path.splitext(fileName)[1].lower()
+
+    w, h, _ = doc.getMaxPageSizes(pageSelection)
+    pages = [pnPages[0] for pn, pnPages in doc.getSortedPages(pageSelection)] # Same pages as view.drawPages
+    hashes = PageHasher(view, w, h).getPageHashes(pages)
+
+    paths = []
+    pageReport = []
+    reused = 0
+    for page in pages:
+        path = os.path.join(cacheFolder, hashes[page] + extension)
+        isReused = os.path.exists(path)
+        if isReused:
+            reused += 1
+        else:
+            tmpPath = os.path.join(cacheFolder, 'tmp-' + hashes[page] + extension)
+            newDrawing()
+            view.drawPage(page, w, h)
+            saveImage(tmpPath)
+            endDrawing()
+            view.elementsNeedingInfo = {} # Don't keep references to elements of written pages.
+            os.rename(tmpPath, path) # Only complete files are in the cache.
+        paths.append(path)
+        pageReport.append((page.name or page.eId, hashes[page], isReused))
+
+    if extension == '.pdf':
+        mergePdfFiles(paths, fileName)
+    else:
+        writer = ImagePageWriter(fileName)
+        for pageIndex, path in enumerate(paths):
+            shutil.copyfile(path, writer.getPagePath(pageIndex))
+    return dict(reused=reused, rebuilt=len(pages) - reused, time=time() - startTime, pages=pageReport)
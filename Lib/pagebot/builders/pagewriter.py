@@ -0,0 +1,122 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     pagewriter.py
+#
+#     Incremental writers for streaming export (View.exportStream). Every page
+#     is drawn in its own DrawBot drawing, which is written by the writer and
+#     then ended, so the canvas never holds more than one page.
+#     PdfPageWriter copies each single-page PDF into one output PDF context.
+#     ImagePageWriter saves each page as separate file, numbered by page.
+#     mergePdfFiles combines PDF files that were written separately, e.g. by
+#     the workers of View.exportParallel.
+#
+import os
+import tempfile
+
+try:
+    import Quartz
+    from AppKit import NSURL
+    from drawBot import saveImage
+except ImportError: # Headless, see pagebot/__init__.py
+    Quartz = NSURL = saveImage = None
+
+def newPageWriter(fileName):
+    u"""Answer the page writer for the extension of *fileName*."""
+    if fileName.lower().endswith('.pdf'):
+        return PdfPageWriter(fileName)
+    return ImagePageWriter(fileName)
+
+def _getURL(path):
+    return Quartz.CFURLCreateFromFileSystemRepresentation(None, path, len(path), False)
+
+def mergePdfFiles(paths, fileName):
+    u"""Merge the PDF files of *paths* in their order into fileName. The outlines of all files are
+    appended to the outline of the result, and the document attributes (metadata) are copied from
+    the first file. Answer the number of pages."""
+    merged = Quartz.PDFDocument.alloc().init()
+    outlineRoot = None
+    for path in paths:
+        pdf = Quartz.PDFDocument.alloc().initWithURL_(NSURL.fileURLWithPath_(path))
+        if merged.pageCount() == 0 and pdf.documentAttributes():
+            merged.setDocumentAttributes_(pdf.documentAttributes())
+        pages = [pdf.pageAtIndex_(pageIndex) for pageIndex in range(pdf.pageCount())]
+        for page in pages: # Outline destinations keep referring to the moved pages.
+            merged.insertPage_atIndex_(page, merged.pageCount())
+        pdfOutline = pdf.outlineRoot()
+        if pdfOutline is not None:
+            if outlineRoot is None:
+                outlineRoot = Quartz.PDFOutline.alloc().init()
+            children = [pdfOutline.childAtIndex_(index) for index in range(pdfOutline.numberOfChildren())]
+            for child in children:
+                child.removeFromParent()
+                outlineRoot.insertChild_atIndex_(child, outlineRoot.numberOfChildren())
+    if outlineRoot is not None:
+        merged.setOutlineRoot_(outlineRoot)
+    merged.writeToFile_(fileName)
+    return merged.pageCount()
+
+class PageWriter(object):
+    u"""Abstract writer. Call self.writePage() while the drawing of a page is open, and self.close()
+    after the last page."""
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.pageCount = 0
+
+    def __repr__(self):
+        return '[%s %s pages=%d]' % (self.__class__.__name__, self.fileName, self.pageCount)
+
+    def writePage(self):
+        self.pageCount += 1
+
+    def close(self):
+        pass
+
+class PdfPageWriter(PageWriter):
+    u"""Writes the pages to a single PDF file. Each page is saved by DrawBot as a temporary single-page PDF,
+    which is drawn as page into the PDF context of the output file, then removed."""
+    def __init__(self, fileName):
+        PageWriter.__init__(self, fileName)
+        self._context = Quartz.CGPDFContextCreateWithURL(_getURL(fileName), None, None)
+        handle, self._pagePath = tempfile.mkstemp(suffix='.pdf')
+        os.close(handle)
+
+    def writePage(self):
+        saveImage(self._pagePath)
+        pdf = Quartz.CGPDFDocumentCreateWithURL(_getURL(self._pagePath))
+        for pageIndex in range(1, Quartz.CGPDFDocumentGetNumberOfPages(pdf) + 1):
+            pdfPage = Quartz.CGPDFDocumentGetPage(pdf, pageIndex)
+            mediaBox = Quartz.CGPDFPageGetBoxRect(pdfPage, Quartz.kCGPDFMediaBox)
+            Quartz.CGContextBeginPage(self._context, mediaBox)
+            Quartz.CGContextDrawPDFPage(self._context, pdfPage)
+            Quartz.CGContextEndPage(self._context)
+        PageWriter.writePage(self)
+
+    def close(self):
+        Quartz.CGPDFContextClose(self._context)
+        self._context = None
+        if os.path.exists(self._pagePath):
+            os.remove(self._pagePath)
+
+class ImagePageWriter(PageWriter):
+    u"""Writes every page as separate file, e.g. for fileName 'Doc.png' as 'Doc-0001.png', 'Doc-0002.png', ...
+    The format (png, jpg, svg, gif, ...) follows the extension of fileName."""
+    def __init__(self, fileName):
+        PageWriter.__init__(self, fileName)
+        self._root, self._extension = os.path.splitext(fileName)
+
+    def getPagePath(self, pageIndex):
+        u"""Answer the file path of the page with *pageIndex* (starting at 0)."""
+        return '%s-%04d%s' % (self._root, pageIndex + 1, self._extension)
+
+    def writePage(self):
+        saveImage(self.getPagePath(self.pageCount))
+        PageWriter.writePage(self)
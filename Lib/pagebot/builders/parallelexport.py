@@ -0,0 +1,130 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     parallelexport.py
+#
+#     Rendering the pages of a solved Document to PDF in worker processes,
+#     used by View.exportParallel. The workers are new processes that restore
+#     the document and the view from a snapshot (see toolbox.workers). The
+#     sorted pages are split into ranges, every worker renders a range to its
+#     own PDF file, and the files are merged in page order.
+#     Pages in groups with flows (see toolbox.parallelsolve.getPageGroups)
+#     are rendered by the main process, in their own ranges. So are the pages
+#     with values that the snapshot cannot keep, such as drawing hooks of
+#     elements or attributes of formatted strings (see the lost list of
+#     Document.saveSnapshot), as the workers cannot draw them. If the view
+#     itself has lost values, all pages are rendered by the main process.
+#
+from __future__ import division
+import os
+import shutil
+import tempfile
+from time import time
+
+try:
+    from drawBot import saveImage, newDrawing, endDrawing
+except ImportError: # Headless, see pagebot/__init__.py
+    saveImage = newDrawing = endDrawing = None
+
+from pagebot.builders.pagewriter import mergePdfFiles
+from pagebot.toolbox.parallelsolve import getPageGroups
+from pagebot.toolbox.snapshot import element2Snapshot, snapshot2Element, document2Snapshot, getLostPages
+from pagebot.toolbox.workers import runWorkers
+
+def _drawRange(view, pages, w, h, path):
+    u"""Draw the *pages* by *view* to the PDF file *path*. Answer (path, pages, seconds, pid)."""
+    startTime = time()
+    newDrawing()
+    for page in pages:
+        view.drawPage(page, w, h)
+    saveImage(path)
+    endDrawing()
+    return path, len(pages), time() - startTime, os.getpid()
+
+def _renderRange(doc, job):
+    u"""Render the pages of *job* in the copy *doc* of a worker process, by the view restored from its
+    snapshot data. Answer (path, pages, seconds, pid)."""
+    pageKeys, w, h, path, viewData = job
+    view = snapshot2Element(viewData)
+    doc.appendElement(view) # Replaces the default view with the same viewId.
+    return _drawRange(view, [doc.pages[pn][index] for pn, index in pageKeys], w, h, path)
+
+def getPageRanges(doc, pages, workers, lostPages=None):
+    u"""Answer the list of (start, end, isSerial) ranges of the list of *pages*. Consecutive pages that are
+    not in a flow group or in the set *lostPages* are split in ranges of at most len(pages)/workers pages.
+    Other consecutive pages are one range, to be rendered serially by the main process."""
+    serialPages = set(lostPages or ())
+    for pageKeys, isFlow in getPageGroups(doc):
+        if isFlow:
+            for pn, index in pageKeys:
+                serialPages.add(doc.pages[pn][index])
+    rangeSize = max(1, (len(pages) + workers - 1) // workers)
+    ranges = []
+    start = 0
+    for index, page in enumerate(pages):
+        isSerial = page in serialPages
+        if index > start and (isSerial != (pages[start] in serialPages) or not isSerial and index - start >= rangeSize):
+            ranges.append((start, index, pages[start] in serialPages))
+            start = index
+    if start < len(pages):
+        ranges.append((start, len(pages), pages[start] in serialPages))
+    return ranges
+
+def exportParallel(view, fileName, workers, pageSelection=None):
+    u"""Render the sorted pages of view.parent to the PDF *fileName* with a pool of *workers* processes.
+    Answer the list of throughput statistics per process: dict(pid, ranges, pages, time, pagesPerSecond),
+    where the main process is included for the flow pages and pages with lost values it rendered."""
+    doc = view.parent
+    w, h, _ = doc.getMaxPageSizes(pageSelection)
+    pages = [pnPages[0] for pn, pnPages in doc.getSortedPages(pageSelection)] # Same pages as view.drawPages
+    snapshot = document2Snapshot(doc)
+    viewLost = []
+    viewData = element2Snapshot(view, viewLost)
+    if viewLost: # The workers cannot draw as the view, render all pages here.
+        lostPages = set(pages)
+    else:
+        lostPages = getLostPages(doc, snapshot['lost'])
+    ranges = getPageRanges(doc, pages, workers, lostPages)
+
+    keys = {} # Page --> (pn, index), as pages are found in the copies of doc in the workers.
+    for pn, pnPages in doc.pages.items():
+        for index, page in enumerate(pnPages):
+            keys[page] = pn, index
+    folder = tempfile.mkdtemp()
+    results = {} # Range index --> (path, pages, seconds, pid)
+    try:
+        paths = [os.path.join(folder, 'range-%04d.pdf' % rangeIndex) for rangeIndex in range(len(ranges))]
+        workerRanges = [rangeIndex for rangeIndex, (start, end, isSerial) in enumerate(ranges) if not isSerial]
+        workerJobs = []
+        for rangeIndex in workerRanges:
+            start, end, _ = ranges[rangeIndex]
+            workerJobs.append(([keys[page] for page in pages[start:end]], w, h, paths[rangeIndex], viewData))
+        for rangeIndex, result in zip(workerRanges, runWorkers(_renderRange, workerJobs, workers, doc, snapshot)):
+            results[rangeIndex] = result
+        for rangeIndex, (start, end, isSerial) in enumerate(ranges):
+            # Flows need the state of previous pages and lost values cannot be drawn by the workers,
+            # render serially in the main process. The paths keep the ranges in page order for merging.
+            if isSerial:
+                results[rangeIndex] = _drawRange(view, pages[start:end], w, h, paths[rangeIndex])
+        mergePdfFiles(paths, fileName)
+    finally:
+        shutil.rmtree(folder)
+
+    statistics = {} # pid --> dict
+    for path, pageCount, seconds, pid in results.values():
+        if not pid in statistics:
+            statistics[pid] = dict(pid=pid, ranges=0, pages=0, time=0)
+        statistics[pid]['ranges'] += 1
+        statistics[pid]['pages'] += pageCount
+        statistics[pid]['time'] += seconds
+    for s in statistics.values():
+        s['pagesPerSecond'] = s['pages'] / (s['time'] or 1)
+    return [s for pid, s in sorted(statistics.items())]
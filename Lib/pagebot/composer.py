@@ -11,7 +11,8 @@
 #
 #     composer.py
 #
-from drawBot import FormattedString
+from pagebot.toolbox.profiling import profiled
+from pagebot.toolbox.textflow import TextFlow
 
 class Composer(object):
     u"""A Composer takes a galley and tries to make a “nice” layout (on existing or new document pages),
@@ -27,6 +28,7 @@ class Composer(object):
         value for the quality if their status."""
         self.makeNewPage = makeNewPage
         
+    @profiled('compose')
     def compose(self, galley, page, flowId=None):
         u"""Compose the galley element, starting with the flowId text box on page.
         The composer negotiates between what the galley needs a sequential space
@@ -38,34 +40,37 @@ class Composer(object):
             flowId, _ = sorted(flows.keys()) # Arbitrary which one, if there are multiple entries.
         tb = page.getElementByName(flowId) # Find the seed flow box on the page, as derived from template.
         assert tb is not None # Make sure, otherwise there is a template error.
-        fs = None
-        # Keeping overflow of text boxes here while iterating.
+        # The text of the galley flows through the boxes by string offset, see toolbox.textflow.
+        flow = TextFlow(tb.fs, tb.markers)
+        boxStart = 0 # String index in flow where the text of tb starts.
+        usedBoxes = set([id(tb)]) # Boxes filled by this flow, to stop if the flow definition is circular.
         for element in galley.elements:
+            if tb is None: # All boxes of the flow are full, ignore the rest of the galley.
+                break
             if not element.isText: # This is a non-text element. Try to find placement.
                 self.tryPlacement(page, tb, element)
                 continue
-            if fs is None:
-                fs = element.fs
-            else:
-                fs += element.fs
+            flow.append(element.fs, getattr(element, 'markers', None))
             # As long as where is text, try to fit into the boxes on the page.
             # Otherwise go to the next page, following the flow, creating new pages if necessary.
-            for n in range(1000): # Safety here, "while fs:" seems to be a dangerous method.
-                if fs is None:
+            end = flow.fill(tb, boxStart)
+            while end < len(flow):
+                if end == boxStart:
+                    print(u'NOT ABLE TO PLACE %s' % flow.getSlice(boxStart, len(flow)))
+                    tb = None
                     break
-                overflow = tb.appendString(fs)
-                if fs == overflow:
-                    print(u'NOT ABLE TO PLACE %s' % overflow)
+                # Overflow in this text box, find new from (page, tbFlow)
+                page, tb = page.getNextFlowBox(tb, self.makeNewPage)
+                if tb is None: # In case here is overflow, but no next box defined in the flow.
+                    print 'Overflow in text, but no next flow column defined.', flowId
                     break
-                fs = overflow
-                if fs: # Can be None or empty
-                    # Overflow in this text box, find new from (page, tbFlow)
-                    page, tb = page.getNextFlowBox(tb, self.makeNewPage)
-                    if tb is None: # In case here is overflow, but no next box defined in the flow.
-                        print 'Overflow in text, but no next flow column defined.', flowId
-                        break
-                else:
+                if id(tb) in usedBoxes:
+                    print 'Overflow in text, but the flow returns to a filled column.', flowId
+                    tb = None
                     break
+                usedBoxes.add(id(tb))
+                boxStart = end
+                end = flow.fill(tb, boxStart)
 
     def tryPlacement(self, page, tb, element):
         u"""Try to place the element on page, in relation to the current filling of tb.
@@ -0,0 +1,436 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     batch.py
+#
+#     Batch evaluation of conditions. The geometry of all child elements of a
+#     container is gathered once into NumPy arrays, and the alignment, fitting and
+#     floating tests are answered for all children at once. Conditions that cannot
+#     be vectorized are evaluated by their own scalar Condition.evaluate.
+#     The scores and fails are identical (and in the same order) as Element.evaluate.
+#
+from __future__ import division
+
+try:
+    import numpy
+except ImportError:
+    numpy = None # Batch evaluation falls back to Element.evaluate.
+
+from pagebot.style import LEFT, RIGHT, CENTER, MIDDLE, TOP, BOTTOM
+from pagebot.conditions.score import Score
+from pagebot.conditions.align import *
+from pagebot.conditions.floating import *
+
+FLOAT_BLOCK_SIZE = 256 # Number of elements in a block of rows for the sibling matrices of floating.
+
+# Condition class --> names of the Element.isXxxOnYyy test methods, that all must be True.
+# Only exact classes are matched, so inheriting conditions with their own test use the scalar path.
+BATCH_TESTS = {
+    Fit2Left: ('isLeftOnLeft',),
+    Fit2Right: ('isRightOnRight',),
+    Fit2Width: ('isLeftOnLeft', 'isRightOnRight'),
+    Fit2Height: ('isTopOnTop', 'isBottomOnBottom'),
+    Fit2Top: ('isTopOnTop',),
+    Fit2Bottom: ('isBottomOnBottom',),
+    Fit2WidthSides: ('isLeftOnLeftSide', 'isRightOnRightSide'),
+    Fit2LeftSide: ('isLeftOnLeftSide',),
+    Fit2RightSide: ('isRightOnRightSide',),
+    Fit2HeightSides: ('isTopOnTopSide', 'isBottomOnBottomSide'),
+    Fit2TopSide: ('isTopOnTopSide',),
+    Fit2BottomSide: ('isBottomOnBottomSide',),
+
+    Center2Center: ('isCenterOnCenter',),
+    Left2Center: ('isLeftOnCenter',),
+    Right2Center: ('isRightOnCenter',),
+    Origin2Center: ('isOriginOnCenter',),
+    Center2CenterSides: ('isCenterOnCenterSides',),
+    Left2CenterSides: ('isLeftOnCenterSides',),
+    Right2CenterSides: ('isRightOnCenterSides',),
+    Origin2CenterSides: ('isOriginOnCenterSides',),
+    Center2Left: ('isCenterOnLeft',),
+    Left2Left: ('isLeftOnLeft',),
+    Right2Left: ('isRightOnLeft',),
+    Origin2Left: ('isOriginOnLeft',),
+    Left2LeftSide: ('isLeftOnLeftSide',),
+    Origin2LeftSide: ('isOriginOnLeftSide',),
+    Center2Right: ('isCenterOnRight',),
+    Left2Right: ('isLeftOnRight',),
+    Right2Right: ('isRightOnRight',),
+    Origin2Right: ('isOriginOnRight',),
+    Center2RightSide: ('isCenterOnRightSide',),
+    Right2RightSide: ('isRightOnRightSide',),
+    Origin2RightSide: ('isOriginOnRightSide',),
+
+    Middle2Middle: ('isMiddleOnMiddle',),
+    Middle2MiddleSides: ('isMiddleOnMiddleSides',),
+    Top2Middle: ('isTopOnMiddle',),
+    Top2MiddleSides: ('isTopOnMiddleSides',),
+    Bottom2Middle: ('isBottomOnMiddle',),
+    Bottom2MiddleSides: ('isBottomOnMiddleSides',),
+    Origin2MiddleSides: ('isOriginOnMiddleSides',),
+    Origin2Top: ('isOriginOnTop',),
+    Middle2Top: ('isMiddleOnTop',),
+    Middle2TopSide: ('isMiddleOnTopSide',),
+    Top2TopSide: ('isTopOnTopSide',),
+    Top2Top: ('isTopOnTop',),
+    Bottom2Top: ('isBottomOnTop',),
+    Origin2TopSide: ('isOriginOnTopSide',),
+    Middle2Bottom: ('isMiddleOnBottom',),
+    Top2Bottom: ('isTopOnBottom',),
+    Bottom2Bottom: ('isBottomOnBottom',),
+    Origin2Bottom: ('isOriginOnBottom',),
+    Middle2BottomSide: ('isMiddleOnBottomSide',),
+    Bottom2BottomSide: ('isBottomOnBottomSide',),
+    Origin2BottomSide: ('isOriginOnBottomSide',),
+
+    Float2Left: ('isFloatOnLeft',),
+    Float2Right: ('isFloatOnRight',),
+    Float2Top: ('isFloatOnTop',),
+    Float2Bottom: ('isFloatOnBottom',),
+    Float2LeftSide: ('isFloatOnLeftSide',),
+    Float2RightSide: ('isFloatOnRightSide',),
+    Float2TopSide: ('isFloatOnTopSide',),
+    Float2BottomSide: ('isFloatOnBottomSide',),
+    Float2LeftTop: ('isFloatOnLeft', 'isFloatOnTop'),
+    Float2TopLeft: ('isFloatOnTop', 'isFloatOnLeft'),
+    Float2RightTop: ('isFloatOnRight', 'isFloatOnTop'),
+    Float2TopRight: ('isFloatOnTop', 'isFloatOnRight'),
+    Float2LeftBottom: ('isFloatOnLeft', 'isFloatOnBottom'),
+    Float2BottomLeft: ('isFloatOnBottom', 'isFloatOnLeft'),
+    Float2RightBottom: ('isFloatOnRight', 'isFloatOnBottom'),
+    Float2BottomRight: ('isFloatOnBottom', 'isFloatOnRight'),
+    Float2LeftTopSides: ('isFloatOnLeftSide', 'isFloatOnTopSide'),
+    Float2TopLeftSides: ('isFloatOnTopSide', 'isFloatOnLeftSide'),
+    Float2RightTopSides: ('isFloatOnRightSide', 'isFloatOnTopSide'),
+    Float2TopRightSides: ('isFloatOnTopSide', 'isFloatOnRightSide'),
+    Float2LeftBottomSides: ('isFloatOnLeftSide', 'isFloatOnBottomSide'),
+    Float2BottomLeftSides: ('isFloatOnBottomSide', 'isFloatOnLeftSide'),
+    Float2RightBottomSides: ('isFloatOnRightSide', 'isFloatOnBottomSide'),
+    Float2BottomRightSides: ('isFloatOnBottomSide', 'isFloatOnRightSide'),
+}
+
+class BatchGeometry(object):
+    u"""Geometry of the *elements* (children of *parent*) as NumPy arrays. The values are read once
+    through the element properties, the derived positions (left, center, top, margin sides, ...) are
+    calculated in vector form, following the alignment rules of the Element properties.
+    Results of the tests are cached by (name, tolerance), so the geometry must not change during
+    the lifetime of the instance."""
+    def __init__(self, parent, elements):
+        self.parent = parent
+        self.elements = elements
+        self.pl = parent.pl
+        self.pr = parent.pr
+        self.pt = parent.pt
+        self.pb = parent.pb
+        self.pw = parent.w
+        self.ph = parent.h
+        rows = []
+        for e in elements:
+            xAlign = e.xAlign
+            yAlign = e.yAlign
+            rows.append((e.x, e.y, e.z, e.w, e.h, e.css('ml'), e.mr, e.mt, e.mb,
+                xAlign == LEFT, xAlign == CENTER, xAlign == RIGHT,
+                yAlign == TOP, yAlign == MIDDLE, yAlign == BOTTOM, bool(e.originTop)))
+        a = numpy.array(rows, dtype=float).reshape(len(elements), 16)
+        x, y, self.z, w, h, ml, mr, mt, mb = a[:,:9].T
+        xLeft, xCenter, xRight, yTop, yMiddle, yBottom, originTop = a[:,9:].T.astype(bool)
+        self.x = x
+        self.y = y
+        self.originTop = originTop
+
+        self.left = numpy.where(xCenter, x - w/2, numpy.where(xRight, x - w, x))
+        self.center = numpy.where(xLeft, x + w/2, numpy.where(xRight, x + w, x))
+        self.right = numpy.where(xLeft, x + w, numpy.where(xCenter, x + w/2, x))
+        self.top = numpy.where(yMiddle, y - h/2,
+            numpy.where(yBottom, numpy.where(originTop, y - h, y + h), y))
+        self.middle = numpy.where(yTop, numpy.where(originTop, y + h/2, y - h/2),
+            numpy.where(yBottom, numpy.where(originTop, y - h/2, y + h/2), y))
+        self.bottom = numpy.where(yTop, numpy.where(originTop, y + h, y - h),
+            numpy.where(yMiddle, y + h/2, y))
+        self.mLeft = self.left - ml
+        self.mRight = self.right - mr
+        self.mTop = numpy.where(originTop, self.top - mt, self.top + mt)
+        self.mBottom = numpy.where(originTop, self.bottom + mb, self.bottom - mb)
+
+        self._results = {} # (name, tolerance) --> boolean array
+        self._floatSides = None # (top, bottom, left, right) arrays, calculated on first float test.
+
+    def __len__(self):
+        return len(self.elements)
+
+    def test(self, name, tolerance):
+        u"""Answer the boolean array with the result of test *name* for all elements."""
+        key = name, tolerance
+        result = self._results.get(key)
+        if result is None:
+            result = self._results[key] = getattr(self, name)(tolerance)
+        return result
+
+    def _fromTop(self, top, bottom):
+        u"""Answer the array of *top* values for originTop elements, *bottom* values for the others."""
+        return numpy.where(self.originTop, top, bottom)
+
+    # Horizontal
+
+    def isCenterOnCenter(self, tolerance):
+        return abs(self.pl + (self.pw - self.pr - self.pl)/2 - self.center) <= tolerance
+
+    def isCenterOnCenterSides(self, tolerance):
+        return abs(self.pw/2 - self.center) <= tolerance
+
+    def isCenterOnLeft(self, tolerance):
+        return abs(self.pl - self.center) <= tolerance
+
+    def isCenterOnRight(self, tolerance):
+        return abs(self.pw - self.pr - self.center) <= tolerance
+
+    def isCenterOnRightSide(self, tolerance):
+        return abs(self.pw - self.center) <= tolerance
+
+    def isLeftOnCenter(self, tolerance):
+        return abs(self.pl + (self.pw - self.pr - self.pl)/2 - self.left) <= tolerance
+
+    def isLeftOnCenterSides(self, tolerance):
+        return abs(self.pw/2 - self.left) <= tolerance
+
+    def isLeftOnLeft(self, tolerance):
+        return abs(self.pl - self.left) <= tolerance
+
+    def isLeftOnLeftSide(self, tolerance):
+        return abs(self.left) <= tolerance
+
+    def isLeftOnRight(self, tolerance):
+        return abs(self.pw - self.pr - self.left) <= tolerance
+
+    def isOriginOnCenter(self, tolerance):
+        return abs(self.pl + (self.pw - self.pr - self.pl)/2 - self.x) <= tolerance
+
+    def isOriginOnCenterSides(self, tolerance):
+        return abs(self.pw/2 - self.x) <= tolerance
+
+    def isOriginOnLeft(self, tolerance):
+        return abs(self.pl - self.x) <= tolerance
+
+    def isOriginOnLeftSide(self, tolerance):
+        return abs(self.x) <= tolerance
+
+    def isOriginOnRight(self, tolerance):
+        return abs(self.pw - self.pr - self.x) <= tolerance
+
+    def isOriginOnRightSide(self, tolerance):
+        return abs(self.pw - self.x) <= tolerance
+
+    def isRightOnCenter(self, tolerance):
+        return abs(self.pw - self.x) <= tolerance # Same as Element.isRightOnCenter
+
+    def isRightOnCenterSides(self, tolerance):
+        return abs(self.pw/2 - self.right) <= tolerance
+
+    def isRightOnLeft(self, tolerance):
+        return abs(self.pl - self.right) <= tolerance
+
+    def isRightOnRight(self, tolerance):
+        return abs(self.pw - self.pr - self.right) <= tolerance
+
+    def isRightOnRightSide(self, tolerance):
+        return abs(self.pw - self.right) <= tolerance
+
+    # Vertical
+
+    def isBottomOnBottom(self, tolerance):
+        return abs(self._fromTop(self.ph - self.pb, self.pb) - self.bottom) <= tolerance
+
+    def isBottomOnBottomSide(self, tolerance):
+        return abs(self._fromTop(self.ph, 0) - self.bottom) <= tolerance
+
+    def isBottomOnTop(self, tolerance):
+        return abs(self._fromTop(self.pt, self.ph - self.pt) - self.bottom) <= tolerance
+
+    def isBottomOnMiddle(self, tolerance):
+        middle = (self.ph - self.pb - self.pt)/2
+        return abs(self._fromTop(self.pt, self.pb) + middle - self.bottom) <= tolerance
+
+    def isBottomOnMiddleSides(self, tolerance):
+        return abs(self.ph/2 - self.bottom) <= tolerance
+
+    def isMiddleOnBottom(self, tolerance):
+        return abs(self._fromTop(self.ph - self.pb, self.pb) - self.middle) <= tolerance
+
+    def isMiddleOnBottomSide(self, tolerance):
+        return abs(self._fromTop(self.ph, 0) - self.middle) <= tolerance
+
+    def isMiddleOnTop(self, tolerance):
+        return abs(self._fromTop(self.pt, self.ph - self.pt) - self.middle) <= tolerance
+
+    def isMiddleOnTopSide(self, tolerance):
+        return abs(self._fromTop(0, self.ph) - self.middle) <= tolerance
+
+    def isMiddleOnMiddle(self, tolerance):
+        middle = (self.ph - self.pt - self.pb)/2
+        return abs(self._fromTop(self.pt, self.pb) + middle - self.middle) <= tolerance
+
+    def isMiddleOnMiddleSides(self, tolerance):
+        return abs(self._fromTop(0, self.ph) - self.middle) <= tolerance # Same as Element.isMiddleOnMiddleSides
+
+    def isOriginOnBottom(self, tolerance):
+        return abs(self._fromTop(self.ph - self.pb, self.pb) - self.y) <= tolerance
+
+    def isOriginOnBottomSide(self, tolerance):
+        return abs(self._fromTop(self.ph, 0) - self.y) <= tolerance
+
+    def isOriginOnTop(self, tolerance):
+        return abs(self._fromTop(self.pt, self.ph - self.pt) - self.y) <= tolerance
+
+    def isOriginOnTopSide(self, tolerance):
+        return abs(self._fromTop(0, self.ph) - self.y) <= tolerance
+
+    def isOriginOnMiddleSides(self, tolerance):
+        return abs(self.ph/2 - self.y) <= tolerance
+
+    def isTopOnBottom(self, tolerance):
+        return abs(self._fromTop(self.ph - self.pb, self.pb) - self.top) <= tolerance
+
+    def isTopOnTop(self, tolerance):
+        return abs(self._fromTop(self.pt, self.ph - self.pt) - self.top) <= tolerance
+
+    def isTopOnTopSide(self, tolerance):
+        return abs(self._fromTop(0, self.ph) - self.top) <= tolerance
+
+    def isTopOnMiddle(self, tolerance):
+        middle = (self.ph - self.pb - self.pt)/2
+        return abs(self._fromTop(self.pt, self.pb) + middle - self.top) <= tolerance
+
+    def isTopOnMiddleSides(self, tolerance):
+        return abs(self.ph/2 - self.top) <= tolerance
+
+    # Float
+
+    def getFloatSides(self):
+        u"""Answer the (top, bottom, left, right) arrays of the positions where the elements can float to,
+        without overlapping previous siblings in the same z-layer. Same as Element.getFloatTopSide,
+        getFloatBottomSide, getFloatLeftSide and getFloatRightSide, but comparing all pairs of elements
+        as matrices. Rows are calculated in blocks of FLOAT_BLOCK_SIZE elements to limit the memory
+        to FLOAT_BLOCK_SIZE * len(self) per matrix."""
+        if self._floatSides is None:
+            n = len(self)
+            top = numpy.empty(n)
+            bottom = numpy.empty(n)
+            left = numpy.empty(n)
+            right = numpy.empty(n)
+            for start in range(0, n, FLOAT_BLOCK_SIZE):
+                end = min(n, start + FLOAT_BLOCK_SIZE)
+                rows = slice(start, end)
+                # Only previous siblings (j < i) in the same z-layer can block the element in row i.
+                i = numpy.arange(start, end)[:, None]
+                j = numpy.arange(end)[None, :]
+                previous = (j < i) & (self.z[None, :end] == self.z[rows, None])
+                originTop = self.originTop[rows]
+                smLeft, smRight = self.mLeft[rows, None], self.mRight[rows, None]
+                smTop, smBottom = self.mTop[rows, None], self.mBottom[rows, None]
+                emLeft, emRight = self.mLeft[None, :end], self.mRight[None, :end]
+                emTop, emBottom = self.mTop[None, :end], self.mBottom[None, :end]
+                # Vertical projection (self.left, self.right)
+                vertical = previous & ~((emRight < smLeft) | (smRight < emLeft))
+                maxBottom = numpy.where(vertical, emBottom, -numpy.inf).max(axis=1)
+                minBottom = numpy.where(vertical, emBottom, numpy.inf).min(axis=1)
+                maxTop = numpy.where(vertical, emTop, -numpy.inf).max(axis=1)
+                minTop = numpy.where(vertical, emTop, numpy.inf).min(axis=1)
+                top[rows] = numpy.where(originTop, numpy.maximum(0, maxBottom), numpy.minimum(self.ph, minBottom))
+                bottom[rows] = numpy.where(originTop, numpy.minimum(self.ph, minTop), numpy.maximum(0, maxTop))
+                # Horizontal projection (self.top, self.bottom), using the test of getFloatLeftSide.
+                outsideTop = (emBottom <= smTop) | (smBottom <= emTop)
+                outsideBottom = (emBottom >= smTop) | (smBottom >= emTop)
+                horizontal = previous & ~numpy.where(originTop[:, None], outsideTop, outsideBottom)
+                left[rows] = numpy.maximum(0, numpy.where(horizontal, emRight, -numpy.inf).max(axis=1))
+                # getFloatRightSide uses its own projection test.
+                horizontal = previous & ~((emBottom < smTop) | (smBottom < emTop))
+                right[rows] = numpy.minimum(self.pw, numpy.where(horizontal, emLeft, numpy.inf).min(axis=1))
+            self._floatSides = top, bottom, left, right
+        return self._floatSides
+
+    def isFloatOnTop(self, tolerance):
+        top = self.getFloatSides()[0]
+        return abs(self._fromTop(numpy.maximum(top, self.pt), numpy.minimum(top, self.ph - self.pt)) - self.mTop) <= tolerance
+
+    def isFloatOnTopSide(self, tolerance):
+        return abs(self.getFloatSides()[0] - self.mTop) <= tolerance
+
+    def isFloatOnBottom(self, tolerance):
+        bottom = self.getFloatSides()[1]
+        return abs(self._fromTop(numpy.minimum(bottom, self.ph - self.pb), numpy.maximum(bottom, self.pb)) - self.mBottom) <= tolerance
+
+    def isFloatOnBottomSide(self, tolerance):
+        return abs(self.getFloatSides()[1] - self.mBottom) <= tolerance
+
+    def isFloatOnLeft(self, tolerance):
+        return abs(numpy.maximum(self.getFloatSides()[2], self.pl) - self.mLeft) <= tolerance
+
+    def isFloatOnLeftSide(self, tolerance):
+        return abs(self.getFloatSides()[2] - self.mLeft) <= tolerance
+
+    def isFloatOnRight(self, tolerance):
+        return abs(numpy.minimum(self.getFloatSides()[3], self.pw - self.pr) - self.mRight) <= tolerance
+
+    def isFloatOnRightSide(self, tolerance):
+        return abs(self.getFloatSides()[3] - self.mRight) <= tolerance
+
+def expandConditions(conditions):
+    u"""Answer the flat list of conditions, where composite conditions that evaluate a list of
+    other conditions (Fit, Fit2Sides, Shrink, ...) are replaced by these conditions, created
+    with the same value, tolerance, error and verbose, as Condition.evaluateAll does."""
+    expanded = []
+    for condition in conditions:
+        if hasattr(condition, '_getConditions'):
+            expanded += expandConditions([conditionClass(condition.value, condition.tolerance, condition.error,
+                condition.verbose) for conditionClass in condition._getConditions()])
+        else:
+            expanded.append(condition)
+    return expanded
+
+def evaluateBatch(e, score=None):
+    u"""Evaluate the conditions of e and its descendants, answering the same score as e.evaluate(score).
+    The conditions of the children of every container are tested in vector form on a BatchGeometry,
+    if they are in BATCH_TESTS. Other conditions use their scalar Condition.evaluate.
+    If NumPy is not installed, then e.evaluate(score) is used."""
+    if score is None:
+        score = Score()
+    if numpy is None:
+        return e.evaluate(score)
+    if e.conditions: # Can be None or empty
+        for condition in e.conditions:
+            condition.evaluate(e, score)
+    _evaluateChildren(e, score)
+    return score
+
+def _evaluateChildren(parent, score):
+    u"""Evaluate the conditions of the showing children of *parent* and then recursively their children,
+    in the same order as Element.evaluate, so score.fails answers the same list. The geometry includes
+    the hidden children, as they block floating in Element.getFloatTopSide and the other scalar tests."""
+    elements = parent.elements
+    geometry = None # Created on the first vectorizable condition.
+    for index, e in enumerate(elements):
+        if not e.show:
+            continue
+        if e.conditions: # Can be None or empty
+            for condition in expandConditions(e.conditions):
+                testNames = BATCH_TESTS.get(condition.__class__)
+                if testNames is None:
+                    condition.evaluate(e, score)
+                    continue
+                if geometry is None:
+                    geometry = BatchGeometry(parent, elements)
+                success = True
+                for testName in testNames:
+                    if not geometry.test(testName, condition.tolerance)[index]:
+                        success = False
+                        break
+                condition.addScore(success, e, score)
+        _evaluateChildren(e, score)
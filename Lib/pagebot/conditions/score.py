@@ -15,6 +15,11 @@ class Score(object):
     def __init__(self):
         self.result = 0
         self.fails = []
+        # Statistics of incremental solving.
+        self.solvedElements = 0 # Number of elements for which the conditions were solved.
+        self.solvedConditions = 0 # Number of conditions that were solved.
+        self.passes = [] # Statistics dictionary of every pass of Document.solve(incremental=True)
+        self.converged = None # Set to True if incremental solving reached a state without changes.
 
     def __repr__(self):
         return 'Score: %s Fails: %d' % (self.result, len(self.fails))
@@ -11,13 +11,38 @@
 #
 #     document.py
 #
-from drawBot import newPage, installedFonts, installFont
+import weakref
+from time import time
+
+try:
+    from drawBot import newPage, installedFonts, installFont
+except ImportError: # Headless, documents can be built, solved and saved as snapshot, but not drawn.
+    newPage = installedFonts = installFont = None
 
 from pagebot.conditions.score import Score
+from pagebot.elements.element import getGeometryTime
 from pagebot.elements.pbpage import Page
 from pagebot.elements.views import View, DefaultView, SingleView, ThumbView
-from pagebot.style import makeStyle, getRootStyle, TOP, BOTTOM
+from pagebot.style import makeStyle, getRootStyle, CascadingStyle, TOP, BOTTOM
 from pagebot.toolbox.transformer import obj2StyleId
+from pagebot.toolbox.elementindex import ElementIndex
+from pagebot.toolbox.pageindex import PageIndex
+from pagebot.toolbox.selectorindex import SelectorIndex
+from pagebot.toolbox.parallelsolve import solveParallel
+from pagebot.toolbox.snapshot import document2Snapshot, snapshot2Document, writeSnapshot, readSnapshot
+
+DEFAULT_SOLVE_PASSES = 10 # Maximum number of passes for incremental solving.
+
+class NamedStylesOwner(object):
+    u"""Owner of the named styles of a Document, which are CascadingStyle instances. Changes of their
+    values increment the styles version of the document, so typesetters merge the changed styles again."""
+    def __init__(self, doc):
+        self._doc = weakref.ref(doc)
+
+    def styleChanged(self, name=None):
+        doc = self._doc()
+        if doc is not None:
+            doc.stylesChanged()
 
 class Document(object):
     u"""A Document is just another kind of container."""
@@ -29,6 +54,13 @@ class Document(object):
             pageTemplate=None,  originTop=True, startPage=0, w=None, h=None, **kwargs):
         u"""Contains a set of Page elements and other elements used for display in thumbnail mode. Allows to compose the pages
         without the need to send them directly to the output for "asynchronic" page filling."""
+        self._pageIndex = PageIndex() # Ordered sequence of pages for navigation and page number queries.
+        self.pages = self._pageIndex.rows # Key is pageNumber, Value is row list of pages: self.pages[pn][index] = page
+        self._elementIndex = ElementIndex(self) # Index of all elements in pages and views by eId and name.
+        self.views = {} # Key is name or eId of View instance.
+        self._selectorIndex = None # Trie of the names in self.styles, created by self.getSelectorIndex()
+        self._stylesVersion = 0 # Incremented on every change of self.styles, see self.stylesChanged()
+        self._namedStylesOwner = NamedStylesOwner(self) # Reports changes of the named styles to self.
         if rootStyle is None:
             rootStyle = getRootStyle()
         self.rootStyle = rootStyle
@@ -43,8 +75,6 @@ class Document(object):
         # Used as default document master template if undefined in pages.
         self.pageTemplate = pageTemplate 
 
-        self.pages = {} # Key is pageNumber, Value is row list of pages: self.pages[pn][index] = page
-
         # Initialize some basic views.
         self.initializeViews(views)
 
@@ -66,6 +96,30 @@ class Document(object):
         return self
     doc = property(_get_doc)
 
+    def _get_elementIndex(self):
+        u"""Answer the ElementIndex with all elements of the document by eId and by name."""
+        return self._elementIndex
+    elementIndex = property(_get_elementIndex)
+
+    def _get_pageIndex(self):
+        u"""Answer the PageIndex with the ordered sequence of pages. Pages are added by self[pn] = page."""
+        return self._pageIndex
+    pageIndex = property(_get_pageIndex)
+
+    def getElementByEId(self, eId):
+        u"""Answer the element in the document with *eId*. Answer None if it does not exist."""
+        return self._elementIndex.getElementByEId(eId)
+
+    def findMarkers(self, markerId, arg=None):
+        u"""Answer the list of (page, textBox, index, arg) of the markers with *markerId* (and *arg* if
+        defined) in the text boxes of the document, in document order. See TextBox.appendMarker."""
+        return self._elementIndex.findMarkers(markerId, arg)
+
+    def findElements(self, name=None, pattern=None, prefix=None, page=None):
+        u"""Answer the list of elements in the document with *name* and the elements of which the name
+        contains *pattern* or starts with *prefix*. If *page* is defined, then only search on that page."""
+        return self._elementIndex.findElements(name=name, pattern=pattern, prefix=prefix, page=page)
+
     # Document[12] answers a list of pages where page.y == 12
     # This behaviour is different from regular elements, who want the page.eId as key.
     def __getitem__(self, pnIndex):
@@ -76,9 +130,7 @@ class Document(object):
             pn, index = pnIndex, 0 # Default is left page on pn row.
         return self.pages[pn][index]
     def __setitem__(self, pn, page):
-        if not pn in self.pages:
-            self.pages[pn] = []
-        self.pages[pn].append(page)
+        self._pageIndex.appendPage(pn, page) # Adds the page to the row self.pages[pn]
    
     def _get_ancestors(self):
         return []
@@ -87,14 +139,74 @@ class Document(object):
     def _get_parent(self):
         return None
     parent = property(_get_parent)
+
+    # End of the chain of absolute element positions. The document is the root origin.
+
+    def _get_rootX(self):
+        return 0
+    rootX = property(_get_rootX)
+
+    def _get_rootY(self):
+        return 0
+    rootY = property(_get_rootY)
+
+    def _get_rootZ(self):
+        return 0
+    rootZ = property(_get_rootZ)
  
     #   S T Y L E
 
+    def _get_rootStyle(self):
+        return self._rootStyle
+    def _set_rootStyle(self, rootStyle):
+        # Changes in the CascadingStyle are reported back by self.styleChanged(name)
+        self._rootStyle = CascadingStyle(rootStyle, self)
+        self.invalidateCss()
+    rootStyle = property(_get_rootStyle, _set_rootStyle)
+
+    def styleChanged(self, name=None):
+        u"""Called by self.rootStyle if the value of *name* changed. If *name* is None, then
+        any value may have changed."""
+        self.invalidateCss(name)
+        self._selectorIndex = None # New index, so typesetters merge the changed root style again.
+        self._stylesVersion += 1
+
+    def stylesChanged(self):
+        u"""Called if the named styles of self changed, including changes of values in a named style."""
+        self._stylesVersion += 1
+
+    def _get_stylesVersion(self):
+        u"""Answer the version counter of the root style and the named styles. The counter is increased
+        whenever a style is added, replaced or removed, or a value of a style changed, so typesetters
+        can use it as key for their merged styles."""
+        return self._stylesVersion
+    stylesVersion = property(_get_stylesVersion)
+
+    def _ownStyle(self, style):
+        u"""Answer *style* as CascadingStyle that reports its changes to self. The root style is
+        already owned by self."""
+        if isinstance(style, CascadingStyle):
+            return style
+        return CascadingStyle(style, self._namedStylesOwner)
+
+    def invalidateCss(self, name=None):
+        u"""Clear the cached css values of *name* (or all values if *name* is None) in the pages
+        and views, as they may have inherited them from the root style."""
+        for pnPages in self.pages.values():
+            for page in pnPages:
+                page.invalidateCss(name)
+        for view in self.views.values():
+            view.invalidateCss(name)
+
     def initializeStyles(self, styles):
         u"""Make sure that the default styles always exist."""
         if styles is None:
             styles = {}
+        for name, style in styles.items(): # Report changes of values in the styles to self.
+            styles[name] = self._ownStyle(style)
         self.styles = styles # Dictionary of styles. Key is XML tag name value is Style instance.
+        self._selectorIndex = None
+        self.stylesChanged()
         # Make sure that the default styles for document and page are always there.
         name = 'root'
         self.addStyle(name, self.rootStyle)
@@ -133,13 +245,18 @@ class Document(object):
         ('main h1', 'h1 b')"""
         if styleId is None:
             return None
-        styleId = obj2StyleId(styleId)
-        while styleId and not ' '.join(styleId) in self.styles:
-            styleId = styleId[1:]
-        if styleId:
-            return self.styles[styleId]
+        styleName = self.getSelectorIndex().findLongest(obj2StyleId(styleId).split(' '))
+        if styleName is not None:
+            return self.styles[styleName]
         return None
 
+    def getSelectorIndex(self):
+        u"""Answer the SelectorIndex of the names in self.styles, to find the styles that match the end of
+        a sequence of tags. The index is created again if the names of the styles changed."""
+        if self._selectorIndex is None or not self._selectorIndex.isValid(self.styles):
+            self._selectorIndex = SelectorIndex(self.styles)
+        return self._selectorIndex
+
     def getNamedStyle(self, styleName):
         u"""In case we are looking for a named style (e.g. used by the Typesetter to build a stack
         of cascading tag style, then query the ancestors for the named style. Default behavior
@@ -161,23 +278,32 @@ class Document(object):
         style = self.styles[name]
         for key, value in addStyle.items():
             style[key] = value
+        self._selectorIndex = None # New index, so typesetters merge the changed style again.
+        self.stylesChanged()
         return style
 
     def addStyle(self, name, style):
         u"""Add the style to the self.styles dictionary.  Make sure that styles don't get overwritten. Remove them first
         with *self.removeStyle* or use *self.replaceStyle(name, style)* instead."""
         assert not name in self.styles
-        self.styles[name] = style
+        style = self.styles[name] = self._ownStyle(style)
+        self._selectorIndex = None
+        self.stylesChanged()
         # Force the name of the style to synchronize with the requested key.
         style['name'] = name
+        return style # Answer the owned style, changes of its values are reported to self.
     
     def removeStyle(self, name):
         u"""Remove the style *name* if it exists. Raise an error if is does not exist."""
         del self.styles[name]
+        self._selectorIndex = None
+        self.stylesChanged()
 
     def replaceStyle(self, name, style):
         u"""Set the style by name. Overwrite the style with that name if it already exists."""
-        self.styles[name] = style
+        style = self.styles[name] = self._ownStyle(style)
+        self._selectorIndex = None
+        self.stylesChanged()
         # Force the name of the style to synchronize with the requested key.
         style['name'] = name
         return style # Answer the style for convenience of tha caller, e.g. when called by self.newStyle(args,...)
@@ -190,8 +316,8 @@ class Document(object):
     
     #   D E F A U L T  A T T R I B U T E S 
 
-    def _get_orjginTop(self):
-        return self.getRootStyle('originTop')
+    def _get_originTop(self):
+        return self.rootStyle['originTop']
     def _set_originTop(self, flag):
         rs = self.getRootStyle()
         if flag:
@@ -200,7 +326,7 @@ class Document(object):
         else:
             rs['originTop'] = False
             rs['yAlign'] = BOTTOM
-    originTop = property(_get_orjginTop, _set_originTop)
+    originTop = property(_get_originTop, _set_originTop)
 
     # CSS property service to children.
     def _get_w(self): # Width
@@ -247,14 +373,38 @@ class Document(object):
         else:
             raise ValueError('Cannot append elements other that Page or View to Document; "%s"' % e)
 
+    def removeElement(self, e):
+        u"""Remove the page or view *e* from the document. Answer the unlinked element for convenience
+        of the caller."""
+        if e.isPage:
+            return self.removePage(e)
+        assert e.parent is self
+        e.setParent(None) # Unlink the parent reference of e, also from the element index.
+        for viewId, view in self.views.items():
+            if view is e:
+                del self.views[viewId]
+        return e
+
+    def removePage(self, page):
+        u"""Remove *page* from its row of pages. The following pages in the row move to the previous index,
+        the page numbers of the other rows don't change. Answer the unlinked page."""
+        assert page.parent is self
+        page.setParent(None) # Unlink the parent reference of page, also from the element index.
+        self._pageIndex.removePage(page)
+        return page
+
     def appendPage(self, page):
-        u"""Append a page to the document. Assert that it is a page element."""
+        u"""Append a page to the document. Assert that it is a page element. If the page already has
+        a parent, then remove it there first."""
         assert page.isPage    
+        if page.parent is not None:
+            page.parent.removeElement(page) # Remove from the current document, if there is one.
         page.setParent(self) # Set parent as weakref, without calling self.appendElement again.
-        if self.pages.keys():
-            pn = max(self.pages.keys())+1
-        else:
+        pn = self._pageIndex.getMaxPageNumber()
+        if pn is None:
             pn = 0
+        else:
+            pn += 1
         self[pn] = page
 
     def getPage(self, pnOrName, index=0):
@@ -263,7 +413,8 @@ class Document(object):
             if index >= len(self.pages[pnOrName]):
                 return None
             return self.pages[pnOrName][index]
-        pages = self.findPages(name=pnOrName) # In case searching by name, there is chance that multiple are answered as list.
+        # In case searching by name, there is chance that multiple are answered, take the first in document order.
+        pages = self._pageIndex.getPagesByName(pnOrName)
         if pages:
             return pages[0]
         return None
@@ -274,16 +425,23 @@ class Document(object):
 
     def findPages(self, eId=None, name=None, pattern=None, pageSelection=None):
         u"""Various ways to find pages from their attributes."""
-        pages = []
-        for pn, pnPages in sorted(self.pages.items()):
-            if not pageSelection is None and not pn in pageSelection:
-                continue
-            for page in pnPages: # List of pages with identical pn
-                if eId == page.eId:
-                    return [page]
-                if (name is not None and name == page.name) or \
-                       pattern is not None and page.name is not None and pattern in page.name:
+        pageIndex = self._pageIndex
+        if eId is not None:
+            page = self._elementIndex.getElementByEId(eId)
+            if page is not None and page in pageIndex and \
+                    (pageSelection is None or pageIndex.getKey(page)[0] in pageSelection):
+                return [page]
+        if pattern is None: # Only by name, use the index.
+            if name is None:
+                return []
+            pages = pageIndex.getPagesByName(name)
+        else:
+            pages = []
+            for page in pageIndex.getPages():
+                if name == page.name or page.name is not None and pattern in page.name:
                     pages.append(page)
+        if pageSelection is not None:
+            pages = [page for page in pages if pageIndex.getKey(page)[0] in pageSelection]
         return pages
 
     def newPage(self, pn=None, template=None, w=None, h=None, name=None, **kwargs):
@@ -296,6 +454,7 @@ class Document(object):
         #if not pn in self.pages:
         #    self.pages[pn] = []
         #self.pages[pn].append(page)
+        return page
 
     def makePages(self, pageCnt, pn=0, template=None, w=None, h=None, name=None, **kwargs):
         u"""
@@ -311,52 +470,48 @@ class Document(object):
         return None
 
     def nextPage(self, page, nextPage=1, makeNew=True):
-        u"""Answer the next page of page. If it does not exist, create a new page."""
-        found = False
-        for pn, pnPages in sorted(self.pages.items()):
-            for index, page in enumerate(pnPages):
-                if found:
-                    return page
-                if eId == page.eId:
-                    found = True
+        u"""Answer the page that is *nextPage* pages after page in the order of the document. If it does
+        not exist, create a new page at the end if *makeNew* is True, otherwise answer None."""
+        pageIndex = self._pageIndex
+        position = pageIndex.getPosition(page)
+        if position is not None:
+            found = pageIndex.getPageAt(position + nextPage)
+            if found is not None:
+                return found
         # Not found, create new one?
         if makeNew:
             return self.newPage()
         return None
 
+    def prevPage(self, page, prevPage=1):
+        u"""Answer the page that is *prevPage* pages before page in the order of the document.
+        Answer None if it does not exist."""
+        return self._pageIndex.getNextPage(page, -prevPage)
+
     def getPageNumber(self, page):
         u"""Answer a string with the page number pn, if the page can be found. If the page has index > 0:
         then answer page format "pn-index". pn and index are incremented by 1.
-        TODO: Make a reversed table if this squential search shows to be slow in the future with large docs.
         """
-        for pn, pnPages in sorted(self.pages.items()):
-            for index, pg in enumerate(pnPages):
-                if pg is page:
-                    if index:
-                        return '%d-%d' % (pn+1, index+1)
-                    return '%d' % (pn+1)
-        return ''
+        key = self._pageIndex.getKey(page)
+        if key is None:
+            return ''
+        pn, index = key
+        if index:
+            return '%d-%d' % (pn+1, index+1)
+        return '%d' % (pn+1)
 
     def getFirstPage(self):
         u"""Answer the list of pages with the lowest sorted page.y. Answer empty list if there are no pages."""
-        for pn, pnPages in sorted(self.pages.items()):
-            for index, page in enumerate(pnPages):
-                return page
-        return None
+        return self._pageIndex.getFirstPage()
 
     def getLastPage(self):
         u"""Answer last page with the highest sorted page.y. Answer empty list if there are no pages."""
-        pn = sorted(self.pages.keys())[-1]
-        return self.pages[pn][-1]
+        return self._pageIndex.getLastPage()
 
     def getSortedPages(self, pageSelection=None):
         u"""Answer the dynamic list of pages, sorted by y, x and index."""
-        pages = [] # List of (pn, pnPages) tuples of pages with the same page number.
-        for pn, pnPages in sorted(self.pages.items()):
-            if pageSelection is not None and not pn in pageSelection:
-                continue
-            pages.append((pn, pnPages))
-        return pages
+        # List of (pn, pnPages) tuples of pages with the same page number.
+        return [(pn, self.pages[pn]) for pn in self._pageIndex.getPageNumbersFrom(pageSelection)]
 
     def getMaxPageSizes(self, pageSelection=None):
         u"""Answer the max (w, h, d) for all pages. If pageSeleciton is defined as list of pageNumbers,
@@ -373,14 +528,74 @@ class Document(object):
                 d = max(page.d, d)
             return w, h, d
 
-    def solve(self, score=None):
-        u"""Evaluate the content of all pages to return the total sum of conditions solving."""
-        score = Score()
+    def evaluate(self, score=None, batch=False):
+        u"""Evaluate the content of all pages to return the total sum of conditions, without changing
+        the elements. If *batch* is True, the conditions of the children of every container are tested
+        together in vector form (see pagebot.conditions.batch), which is faster for scoring many
+        candidate layouts."""
+        if score is None:
+            score = Score()
         for pn, pnPages in sorted(self.pages.items()):
             for page in pnPages: # List of pages with identical pn, step through the pages.
-                page.solve(score)
+                if batch:
+                    page.evaluateBatch(score)
+                else:
+                    page.evaluate(score)
         return score
 
+    def solve(self, score=None, incremental=False, maxPasses=DEFAULT_SOLVE_PASSES, workers=None):
+        u"""Evaluate the content of all pages to return the total sum of conditions solving.
+        If *workers* is larger than 1, then the pages are solved by that number of worker processes.
+        Pages that are connected by flows (nextPage/prevPage) are solved together. See
+        pagebot.toolbox.parallelsolve for details.
+        If *incremental* is True, then only the conditions of elements are solved where the geometry
+        of the element, its parent or its previous siblings changed since their last solve. Passes
+        are repeated until no geometry changes anymore, with a maximum of *maxPasses*. The answered
+        score is the score of the last pass, with statistics of every pass in score.passes and
+        score.converged set to True if the last pass did not change anything."""
+        if workers is not None and workers > 1:
+            assert not incremental, '[%s.solve] Incremental solving cannot be combined with workers' % self.__class__.__name__
+            return solveParallel(self, workers)
+        if not incremental:
+            score = Score()
+            for pn, pnPages in sorted(self.pages.items()):
+                for page in pnPages: # List of pages with identical pn, step through the pages.
+                    page.solve(score)
+            return score
+
+        passes = []
+        for index in range(maxPasses):
+            startTime = time()
+            startGeometryTime = getGeometryTime()
+            score = Score()
+            for pn, pnPages in sorted(self.pages.items()):
+                for page in pnPages:
+                    page.solveChanged(score)
+            changes = getGeometryTime() - startGeometryTime
+            passes.append(dict(index=index, solvedElements=score.solvedElements, 
+                solvedConditions=score.solvedConditions, changes=changes, time=time() - startTime))
+            if not changes: # Fixpoint, next pass would not solve anything.
+                break
+        score.passes = passes
+        score.converged = not changes
+        return score
+
+    #   S N A P S H O T
+
+    def saveSnapshot(self, path):
+        u"""Save the pages, styles and solved geometry of self as compact binary snapshot in *path*.
+        Answer the list of (eId, name) of values that are not plain data and could not be saved,
+        such as drawing hooks. See pagebot.toolbox.snapshot."""
+        data = document2Snapshot(self)
+        writeSnapshot(data, path)
+        return data['lost']
+
+    @classmethod
+    def loadSnapshot(cls, path):
+        u"""Answer a new document from the snapshot in *path*, as saved by doc.saveSnapshot(path).
+        The document is restored as it was saved, without typesetting, composing or solving again."""
+        return snapshot2Document(readSnapshot(path), cls)
+
     #   V I E W S
 
     def initializeViews(self, views):
@@ -414,3 +629,22 @@ class Document(object):
         view = self.getView(viewId) # view.parent is self
         view.export(fileName=fileName, pageSelection=pageSelection, multiPage=multiPage)
 
+    def exportParallel(self, fileName, workers, pageSelection=None, viewId=None):
+        u"""Export the pages to PDF with a pool of *workers* processes. Let the view do the work,
+        see View.exportParallel."""
+        view = self.getView(viewId) # view.parent is self
+        return view.exportParallel(fileName, workers, pageSelection=pageSelection)
+
+    def exportIncremental(self, fileName, cacheFolder, pageSelection=None, viewId=None):
+        u"""Export the pages, reusing the rendered pages in *cacheFolder* of pages that did not change since
+        a previous export. Answer the report of reused and rebuilt pages. Let the view do the work, see
+        View.exportIncremental."""
+        view = self.getView(viewId) # view.parent is self
+        return view.exportIncremental(fileName, cacheFolder, pageSelection=pageSelection)
+
+    def exportStream(self, fileName, pages=None, pageSelection=None, viewId=None, release=False):
+        u"""Export the pages one by one, drawing, writing and optionally releasing each page before
+        the next. Let the view do the work, see View.exportStream."""
+        view = self.getView(viewId) # view.parent is self
+        return view.exportStream(fileName, pages=pages, pageSelection=pageSelection, release=release)
+
@@ -16,19 +16,55 @@ from __future__ import division
 import weakref
 import copy
 
-from drawBot import rect, oval, line, newPath, moveTo, lineTo, lineDash, drawPath, \
-    save, restore, scale, textSize, fill, text, stroke, strokeWidth, shadow
+try:
+    from drawBot import rect, oval, line, newPath, moveTo, lineTo, lineDash, drawPath, \
+        save, restore, scale, textSize, fill, text, stroke, strokeWidth, shadow
+except ImportError: # Headless, elements can be composed and solved, but not drawn.
+    rect = oval = line = newPath = moveTo = lineTo = lineDash = drawPath = save = restore = scale = None
+    textSize = fill = text = stroke = strokeWidth = shadow = None
 
 from pagebot.conditions.score import Score
-from pagebot import newFS, setFillColor, setStrokeColor, setGradient, setShadow,\
+from pagebot.conditions.batch import evaluateBatch
+from pagebot import newFS, deepFind, setFillColor, setStrokeColor, setGradient, setShadow,\
     x2cx, cx2x, y2cy, cy2y, z2cz, cz2z, w2cw, cw2w, h2ch, ch2h, d2cd, cd2d
 from pagebot.toolbox.transformer import point3D, pointOffset, uniqueID, point2D
-from pagebot.style import makeStyle, ORIGIN_POINT, MIDDLE, CENTER, RIGHT, TOP, BOTTOM, LEFT, FRONT, BACK, NO_COLOR, XALIGNS, YALIGNS, ZALIGNS, \
+from pagebot.style import makeStyle, CascadingStyle, CopyOnWriteStyle, GeometryStyle, ORIGIN_POINT, MIDDLE, CENTER, RIGHT, TOP, BOTTOM, LEFT, FRONT, BACK, NO_COLOR, XALIGNS, YALIGNS, ZALIGNS, \
     MIN_WIDTH, MAX_WIDTH, MIN_HEIGHT, MAX_HEIGHT, MIN_DEPTH, MAX_DEPTH, DEFAULT_WIDTH, DEFAULT_HEIGHT, DEFAULT_DEPTH, XXXL, INTERPOLATING_TIME_KEYS,\
     ONLINE, INLINE, OUTLINE
 from pagebot.toolbox.transformer import asFormatted, uniqueID
 from pagebot.toolbox.timemark import TimeMark
+from pagebot.toolbox.spatialindex import SpatialIndex
+from pagebot.toolbox.elementindex import ElementIndex
+from pagebot.toolbox.profiling import profiler, profiled
 
+NOT_FOUND = object() # Marker for css values that cannot be found in the styles of the ancestors.
+
+# Hit/miss counters of all Element.css() calls, to measure the effect of the css cache.
+CSS_CACHE_STATS = dict(hits=0, misses=0)
+
+# Style names that define the absolute position of an element and its children.
+ROOT_POINT_KEYS = set(('x', 'y', 'z', 'originTop'))
+# Style names that define the margin box of an element, as stored in the spatial index of the parent.
+MARGIN_BOX_KEYS = set(('x', 'y', 'z', 'w', 'h', 'minW', 'maxW', 'minH', 'maxH', 'mt', 'mb', 'ml', 'mr',
+    'xAlign', 'yAlign', 'originTop'))
+
+# Counter that is incremented on every change of geometry of any element. The value is used as time stamp
+# by the incremental solver, to compare the time of the last solve of an element with changes of its inputs.
+# The clock starts running at the first incremental solve. Before that, all elements are solved anyway,
+# so changes of geometry don't need a time stamp.
+GEOMETRY_CLOCK = dict(time=0, running=False)
+
+def getGeometryTime():
+    u"""Answer the current time of the geometry clock, the total number of geometry changes of elements."""
+    return GEOMETRY_CLOCK['time']
+
+def getCssCacheStats():
+    u"""Answer a copy of the dictionary with the total hits and misses of the element css caches."""
+    return dict(CSS_CACHE_STATS)
+
+def resetCssCacheStats():
+    u"""Reset the hit/miss counters of the element css caches to 0."""
+    CSS_CACHE_STATS['hits'] = CSS_CACHE_STATS['misses'] = 0
 
 class Element(object):
 
@@ -41,6 +77,7 @@ class Element(object):
     isFlow = False # Value is True if self.next if defined.
     isPage = False # Set to True by Page-like elements.
     isView = False 
+    compactGeometry = False # Set to True to store the geometry values of the style in a GeometryStyle, saves memory, not time.
     
     def __init__(self, point=None, x=0, y=0, z=0, w=DEFAULT_WIDTH, h=DEFAULT_HEIGHT, d=DEFAULT_DEPTH, 
             t=0, parent=None, name=None, title=None, style=None, conditions=None, elements=None, 
@@ -54,7 +91,19 @@ class Element(object):
         Ignore setting of setting eId as attribute, guaranteed to be unique.
         """  
         assert point is None or isinstance(point, (tuple, list))
-        
+
+        self._parent = None # Preset, so it exists for checking when appending parent and changing style.
+        # Cache of resolved cascading css values, cleared by self.invalidateCss()
+        self._cssCache = {}
+        self._cssVersion = 0 # Incremented on every invalidation of this element or its ancestors.
+        # Cached absolute (rootX, rootY, rootZ), cleared by self.invalidateRootPoint()
+        self._rootPoint = None
+        # Optional SpatialIndex of the margin boxes of the child elements, used by the float conditions.
+        self._spatialIndex = None
+        # Time stamps of the geometry clock for the incremental solver.
+        self._geometryTime = 0 # Time of the last change of geometry of self.
+        self.resetSolved()
+        self.clearElements() # Make sure that child elements exist before setting self.style.
         self.style = makeStyle(style, **kwargs) # Make default style for t == 0
         # Initialize style values that are not supposed to inherite from parent styles.
         # Always store point in style as separate (x, y, z) values. Missing values are 0
@@ -90,10 +139,10 @@ class Element(object):
         if margin is not None:
             self.margin = margin
 
+        self._name = None
         self.name = name
         self.title = title or name # Optional to make difference between title name, style property
         self._eId = uniqueID(self) # Direct set property with guaranteed unique persistent value. 
-        self._parent = None # Preset, so it exists for checking when appending parent.
         if parent is not None:
             # Add and set weakref to parent element or None, if it is the root. Caller must add self to its elements separately.
             self.parent = parent # Set referecnes in both directions. Remove any previous parent links
@@ -160,8 +209,9 @@ class Element(object):
                 self.style[name] = value
             # Copy condition list. Does not have to be deepCopy, condition instances are multi-purpose.
             self.conditions = copy.copy(template.conditions)
-            for e in template.elements:
-                self.appendElement(e.deepCopy())
+            for e in template.elements: # Lightweight copies, sharing the style of the template elements.
+                self.appendElement(e.copyOnWrite())
+        self.styleChanged() # Cascading values and position may have changed by the template.
     template = property(_get_template, _set_template)
 
     #   E L E M E N T S
@@ -193,6 +243,16 @@ class Element(object):
         return self._eIds
     elementIds = property(_get_elementIds)
 
+    def _get_spatialIndex(self):
+        return self._spatialIndex
+    def _set_spatialIndex(self, spatialIndex):
+        u"""Set the SpatialIndex that keeps the margin boxes of the child elements, or None to let
+        the float methods scan all siblings again. The index is filled with the current elements."""
+        if spatialIndex is not None:
+            spatialIndex.fill(self._elements)
+        self._spatialIndex = spatialIndex
+    spatialIndex = property(_get_spatialIndex, _set_spatialIndex)
+
     def getElement(self, eId):
         u"""Answer the page element, if it has a unique element Id. Answer None if the eId does not exist as child."""
         return self._eIds.get(eId)
@@ -204,7 +264,14 @@ class Element(object):
         return self.parent.getElementPage()
 
     def getElementByName(self, name):
-        u"""Answer the first element in the offspring list that fits the name. Answer None if it cannot be found"""
+        u"""Answer the first element in the offspring list that fits the name. Answer None if it cannot be found.
+        If self is part of a document, then use the element index of the document, only looking at the page of self."""
+        doc = self.doc
+        if doc is not None:
+            for e in doc.elementIndex.findElements(name=name, page=ElementIndex.getPageOf(self)):
+                if e is self or self.isAncestorOf(e):
+                    return e
+            return None
         if self.name == name:
             return self
         for e in self.elements:
@@ -213,34 +280,101 @@ class Element(object):
                 return found
         return None
 
+    def deepFind(self, name=None, pattern=None):
+        u"""Answer the list of descendants of self (not including self) with *name* or with a name that
+        contains *pattern*. If self is part of a document, then use the element index of the document.
+        Either *name* or *pattern* should be defined, otherwise an error is raised."""
+        assert name or pattern
+        doc = self.doc
+        if doc is None:
+            return deepFind(self.elements, name, pattern)
+        found = []
+        for e in doc.elementIndex.findElements(name=name, pattern=pattern, page=ElementIndex.getPageOf(self)):
+            if self.isAncestorOf(e):
+                found.append(e)
+        return found
+
+    def isAncestorOf(self, e):
+        u"""Answer the boolean flag if self is in the chain of parents of *e*."""
+        e = e.parent
+        while e is not None:
+            if e is self:
+                return True
+            e = e.parent
+        return False
+
     def clearElements(self):
         u"""Properly initializes self._elements and self._eIds. 
         Any existing elements get their parent weakrefs become None and will garbage collect."""
         self._elements = [] 
         self._eIds = {}
+        if self._spatialIndex is not None:
+            self._spatialIndex.clear()
+
+    def releaseElements(self):
+        u"""Remove all child elements of self, also from the element index of the document, so they can be
+        garbage collected. Used by View.exportStream(release=True) for pages that are written."""
+        for e in self.elements:
+            e.setParent(None)
+        self.clearElements()
 
     def deepCopy(self):
         u"""Answer a copy of self, where the "unique" fields are set to default. Also perform a deep copy
         on all child elements."""
+        return self._copyElement(False)
+
+    copy = deepCopy # Make the same as default.
+
+    def copyOnWrite(self):
+        u"""Answer a lightweight copy of self, as used to apply the elements of a template. The copy shares
+        the style of self until the first change of its style. Then only the style of that copy is
+        materialized. Child elements are copied the same way. Use pagebot.style.getCopyOnWriteStats()
+        to see how many copies were materialized."""
+        return self._copyElement(True)
+
+    def _copyElement(self, copyOnWrite):
         e = copy.copy(self)
         e._eId = uniqueID(e) # Guaranteed unique Id for every element.
-        e.nextElement = None
-        e.prevElement = None
-        e.style = copy.copy(self.style)
+        e._parent = None # The copy is not yet placed in a parent.
+        if not copyOnWrite: # Copies of template elements keep their flow, see getNextFlowBox.
+            e.nextElement = None
+            e.prevElement = None
+        e._spatialIndex = None # Don't share the index with self.
+        e.resetSolved()
         e.clearElements()
+        if copyOnWrite:
+            e._style = CopyOnWriteStyle(self._style, e)
+            e.styleChanged()
+        else:
+            e.style = copy.copy(self.style)
         for child in self.elements:
-            e.appendElement(child.deepCopy())
+            e.appendElement(child._copyElement(copyOnWrite))
+        if self._spatialIndex is not None:
+            e.spatialIndex = SpatialIndex(self._spatialIndex.cellSize)
         return e
 
-    copy = deepCopy # Make the same as default.
-
     def setElementByIndex(self, e, index):
         u"""Replace the element, if there is already one at index. Otherwise append it to self.elements
         and answer the index number that it got."""
         if index < len(self.elements):
-            self.elements[index] = e
-            if self.eId:
+            if self._elements[index] is e:
+                return index
+            eParent = e.parent
+            if not eParent is None:
+                eParent.removeElement(e) # Remove from current parent, if there is one.
+            if index >= len(self._elements): # Removed from self, before the index.
+                return self.appendElement(e)
+            old = self._elements[index]
+            old.setParent(None) # Unlink the replaced element, also from the element index of the document.
+            if old.eId in self._eIds:
+                del self._eIds[old.eId]
+            self._elements[index] = e
+            e.setParent(self) # Set parent of element without calling self.appendElement().
+            if e.eId:
                 self._eIds[e.eId] = e
+            if self._spatialIndex is not None:
+                self._spatialIndex.fill(self._elements)
+            self.geometryChanged() # Following siblings have another previous sibling.
             return index
         return self.appendElement(e)
 
@@ -253,6 +387,8 @@ class Element(object):
             eParent.removeElement(e) # Remove from current parent, if there is one.
         self._elements.append(e) # Possibly add to self again, will move it to the top of the element stack.
         e.setParent(self) # Set parent of element without calling this method again.
+        if self._spatialIndex is not None:
+            self._spatialIndex.appendElement(e)
         if e.eId: # Store the element by unique element id, if it is defined.
             self._eIds[e.eId] = e
         return len(self._elements)-1 # Answer the element index for e.
@@ -265,6 +401,9 @@ class Element(object):
             del self._eIds[e.eId]
         if e in self._elements:
             self._elements.remove(e)
+        if self._spatialIndex is not None:
+            self._spatialIndex.removeElement(e)
+        self.geometryChanged() # Following siblings lost a previous sibling, so they need to be solved again.
         return e # Answer the unlinked elements for convenience of the caller.
 
     def _get_show(self): # Set flag for drawing or interpreation with conditional.
@@ -329,29 +468,28 @@ class Element(object):
                 flows[e.next] = [e]
         return flows
 
-    def NOTNOW_getNextFlowBox(self, tb, makeNew=True):
-        u"""Answer the next textBox that tb is pointing to. This can be on the same page or a next
-        page, depending how the page (and probably its template) is defined."""
-        if tb.nextPage: # Page number or name
-            # The flow textBox is pointing to another page. Try to get it, and otherwise create one,
-            # if makeNew is set to True.
-            page = self.doc.getPage(tb.nextPage)
+    def getNextFlowBox(self, tb, makeNew=True):
+        u"""Answer (page, tb) of the next text box in the flow of tb. The next box can be on this page
+        or on another page, as defined by tb.nextElement and tb.nextPage: 0 or None is this page, a number
+        is the relative page in the document and a string is the name of the page. If the page does not
+        exist and makeNew is True, then it is created from the template of this page. Answer (page, None)
+        if there is no next box."""
+        if tb.nextElement is None:
+            return self, None
+        nextPage = tb.nextPage
+        if not nextPage: # Staying on the same page, flowing into another column.
+            page = self
+        elif isinstance(nextPage, (int, long)): # Relative page number.
+            page = self.doc.nextPage(self, nextPage, makeNew=False)
             if page is None and makeNew:
-                page = self.doc.newPage(name=tb.nextPage)
-            # Hard check. Otherwise something must be wrong in the template flow definition.
-            # or there is more content than we can handle, while not allowing to create new pages.
-            assert page is not None
-            assert not page is self # Make sure that we got a another page than self.
-            # Get the element on the next page that
-            tb = page.getElementByName(tb.nextElement)
-            # Hard check. Otherwise something must be wrong in the template flow definition.
-            assert tb is not None and not len(tb)
-        else:
-            page = self # Staying on the same page, flowing into another column.
-            tb = self.getElementByName(tb.nextElement)
-            # Hard check. Make sure that this one is empty, otherwise mistake in template
-            assert not len(tb)
-        return page, tb
+                page = self.doc.newPage(template=self.template)
+        else: # Name of the page.
+            page = self.doc.getPage(nextPage)
+            if page is None and makeNew:
+                page = self.doc.newPage(name=nextPage, template=self.template)
+        if page is None: # More content than pages and not allowed to create new ones.
+            return self, None
+        return page, page.getElementByName(tb.nextElement)
 
     #   If self.nextElement is defined, then check the condition if there is overflow.
 
@@ -399,15 +537,115 @@ class Element(object):
 
     # Answer the cascaded style value, looking up the chain of ancestors, until style value is defined.
 
+    def _get_style(self):
+        return self._style
+    def _set_style(self, style):
+        # Changes in the CascadingStyle are reported back by self.styleChanged(name)
+        if self.compactGeometry:
+            self._style = GeometryStyle(style, self)
+        else:
+            self._style = CascadingStyle(style, self)
+        self.styleChanged()
+    style = property(_get_style, _set_style)
+
+    def styleChanged(self, name=None):
+        u"""Called by self.style if the value of *name* changed. If *name* is None, then any
+        value may have changed. Clear the caches that depend on the value. Style values are written
+        often, e.g. for every new element, so only the caches that are filled are visited."""
+        if name is None:
+            self.invalidateCss()
+            self.invalidateRootPoint()
+            self.geometryChanged()
+            if self._spatialIndex is not None:
+                self._spatialIndex.invalidate()
+            return
+        if name in self._cssCache: # Otherwise self and the child elements did not resolve the value.
+            self.invalidateCss(name)
+        if self._rootPoint is not None and name in ROOT_POINT_KEYS:
+            self.invalidateRootPoint()
+        if name in MARGIN_BOX_KEYS:
+            self.geometryChanged()
+            if self._spatialIndex is not None and name in ('w', 'h'):
+                self._spatialIndex.invalidate() # Max size of the children depends on the size of self.
+
+    def geometryChanged(self):
+        u"""Mark the geometry of self as changed. Stamp self with the next time of the geometry clock
+        for the incremental solver, and update the spatial index of the parent, if there is one."""
+        if GEOMETRY_CLOCK['running']:
+            GEOMETRY_CLOCK['time'] += 1
+            self._geometryTime = GEOMETRY_CLOCK['time']
+        parent = self._parent
+        if parent is not None:
+            index = getattr(parent(), '_spatialIndex', None) # Parent can be a Document.
+            if index is not None:
+                index.elementChanged(self)
+
+    def contentChanged(self):
+        u"""Mark the content of self (e.g. the text of a text box) as changed. Stamp self with the next time
+        of the geometry clock, so the incremental solver solves the conditions of self again."""
+        if GEOMETRY_CLOCK['running']:
+            GEOMETRY_CLOCK['time'] += 1
+            self._geometryTime = GEOMETRY_CLOCK['time']
+
+    def _get_geometryTime(self):
+        u"""Answer the time of the geometry clock when the geometry of self last changed."""
+        return self._geometryTime
+    geometryTime = property(_get_geometryTime)
+
     def css(self, name, default=None):
         u"""In case we are looking for a plain css value, cascading from the main ancestor styles
         of self, then follow the parent links until document or root, if self does not contain
-        the requested value."""
-        if name in self.style:
-            return self.style[name]
-        if self.parent is not None:
-            return self.parent.css(name, default)
-        return default
+        the requested value. The resolved value is cached in self._cssCache, until invalidated
+        by a change of style, parent or template."""
+        cssCache = self._cssCache
+        if name in cssCache:
+            CSS_CACHE_STATS['hits'] += 1
+            value = cssCache[name]
+        else:
+            CSS_CACHE_STATS['misses'] += 1
+            if name in self._style:
+                value = self._style[name]
+            else:
+                parent = self.parent
+                if parent is not None:
+                    value = parent.css(name, NOT_FOUND)
+                else:
+                    value = NOT_FOUND
+            cssCache[name] = value
+        if value is NOT_FOUND:
+            return default
+        return value
+
+    def invalidateCss(self, name=None):
+        u"""Clear the cached css value of *name* in self and in all child elements that
+        inherited the value through self. If *name* is None, then clear all cached values.
+        Child elements that resolved a value through self always have that value cached in self
+        too, so only the children with a filled cache need to be visited."""
+        if name is None:
+            self._cssVersion += 1
+            if not self._cssCache: # Nothing resolved, also not by the child elements through self.
+                return
+            self._cssCache = {}
+            for e in self._elements:
+                if e._cssCache:
+                    e.invalidateCss()
+        elif name in self._cssCache:
+            del self._cssCache[name]
+            self._cssVersion += 1
+            for e in self._elements:
+                if name in e._cssCache:
+                    e.invalidateCss(name)
+        else:
+            return
+        if name is None or name in MARGIN_BOX_KEYS:
+            self.geometryChanged() # Self may have inherited changed alignment from the parent.
+
+    def _get_cssVersion(self):
+        u"""Answer the version counter of the cascading values of self. The counter is increased
+        whenever a value that self inherited (or defined itself) may have changed, so other caches
+        can use it as key."""
+        return self._cssVersion
+    cssVersion = property(_get_cssVersion)
 
     def getNamedStyle(self, styleName):
         u"""In case we are looking for a named style (e.g. used by the Typesetter to build a stack
@@ -435,13 +673,35 @@ class Element(object):
         return None
     doc = property(_get_doc)
 
+    def _get_name(self):
+        return self._name
+    def _set_name(self, name):
+        doc = self.doc
+        if doc is not None: # Update the name in the element index of the document.
+            doc.elementIndex.rename(self, self._name, name)
+            if self.isPage:
+                doc.pageIndex.rename(self, self._name, name)
+        self._name = name
+    name = property(_get_name, _set_name)
+
     # Most common properties
 
     def setParent(self, parent):
-        u"""Set the parent of self as weakref if it is not None. Don't call self.appendElement()."""
+        u"""Set the parent of self as weakref if it is not None. Don't call self.appendElement().
+        Update the element index of the old and new document."""
+        doc = self.doc
+        if doc is not None:
+            doc.elementIndex.removeTree(self)
         if parent is not None:
+            doc = parent.doc
             parent = weakref.ref(parent)
+        else:
+            doc = None
         self._parent = parent # Can be None if self needs to be unlinked from a parent tree. E.g. when moving it.
+        if doc is not None:
+            doc.elementIndex.appendTree(self)
+        self.invalidateCss() # Inherited values are different in the new parent tree.
+        self.invalidateRootPoint() # And so is the absolute position.
 
     def _get_parent(self):
         u"""Answer the parent of the element, if it exists, by weakref reference. Answer None of there
@@ -455,7 +715,7 @@ class Element(object):
             #assert not self in parent.ancestors, '[%s.%s] Cannot set one of the children "%s" as parent.' % (self.__class__.__name__, self.name, parent)
             parent.appendElement(self)
         else:
-            self._parent = None
+            self.setParent(None)
     parent = property(_get_parent, _set_parent)
 
     def _get_siblings(self):
@@ -983,27 +1243,39 @@ class Element(object):
         self.gw, self.gh, self.gd = gutter3D
     gutter3D = property(_get_gutter3D, _set_gutter3D)
 
-    # Absolute positions
+    # Absolute positions, cached in self._rootPoint until the position of self or one of the ancestors changes.
+
+    def _get_rootPoint(self): # Answer the (rootX, rootY, rootZ) of self, from whole tree of ancestors.
+        rootPoint = self._rootPoint
+        if rootPoint is None:
+            parent = self.parent
+            if parent is not None: # Add relative self to parents position.
+                rootPoint = self.x + parent.rootX, self.y + parent.rootY, self.z + parent.rootZ
+            else:
+                rootPoint = self.x, self.y, self.z
+            self._rootPoint = rootPoint
+        return rootPoint
+    rootPoint = property(_get_rootPoint)
+
+    def invalidateRootPoint(self):
+        u"""Clear the cached absolute position of self and of the child elements. A child can only
+        have a cached position if self has one, so the propagation stops at elements that are
+        already cleared."""
+        if self._rootPoint is not None:
+            self._rootPoint = None
+            for e in self._elements:
+                e.invalidateRootPoint()
 
     def _get_rootX(self): # Answer the root value of local self.x, from whole tree of ancestors.
-        parent = self.parent
-        if parent is not None:
-            return self.x + parent.rootX # Add relative self to parents position.
-        return self.x
+        return self._get_rootPoint()[0]
     rootX = property(_get_rootX)
 
     def _get_rootY(self): # Answer the absolute value of local self.y, from whole tree of ancestors.
-        parent = self.parent
-        if parent is not None:
-            return self.y + parent.rootY # Add relative self to parents position.
-        return self.y
+        return self._get_rootPoint()[1]
     rootY = property(_get_rootY)
 
     def _get_rootZ(self): # Answer the absolute value of local self.z, from whole tree of ancestors.
-        parent = self.parent
-        if parent is not None:
-            return self.z + parent.rootZ # Add relative self to parents position.
-        return self.z
+        return self._get_rootPoint()[2]
     rootZ = property(_get_rootZ)
 
     # (w, h, d) size of the element.
@@ -1541,6 +1813,21 @@ class Element(object):
         self.style['scaleZ'] = scaleZ # Set on local style, shielding parent self.css value.
     scaleZ = property(_get_scaleZ, _set_scaleZ)
 
+    def _getFloatSiblings(self, previousOnly, tolerance, axis):
+        u"""Answer the sibling elements that can block self from floating. If *previousOnly* is True,
+        then only the siblings before self in the list are answered. If the parent has a spatial index,
+        then only answer the siblings of which the margin box can overlap with self in the projection
+        on *axis*, instead of all siblings."""
+        parent = self.parent
+        if parent._spatialIndex is not None:
+            return parent._spatialIndex.findSiblings(self, previousOnly, tolerance, axis)
+        siblings = []
+        for e in parent.elements: # All elements that share self.parent.
+            if previousOnly and e is self: # Only look at siblings that are previous in the list.
+                break
+            siblings.append(e)
+        return siblings
+
     def getFloatTopSide(self, previousOnly=True, tolerance=0):
         u"""Answer the max y that can float to top, without overlapping previous sibling elements.
         This means we are just looking at the vertical projection between (self.left, self.right).
@@ -1550,9 +1837,7 @@ class Element(object):
             y = 0
         else:
             y = self.parent.h
-        for e in self.parent.elements: 
-            if previousOnly and e is self: # Only look at siblings that are previous in the list.
-                break 
+        for e in self._getFloatSiblings(previousOnly, tolerance, 'x'):
             if abs(e.z - self.z) > tolerance or e.mRight < self.mLeft or self.mRight < e.mLeft:
                 continue # Not equal z-layer or not in window of vertical projection.
             if self.originTop:
@@ -1570,9 +1855,7 @@ class Element(object):
             y = self.parent.h
         else:
             y = 0
-        for e in self.parent.elements: # All elements that share self.parent, except self.
-            if previousOnly and e is self: # Only look at siblings that are previous in the list.
-                break 
+        for e in self._getFloatSiblings(previousOnly, tolerance, 'x'):
             if abs(e.z - self.z) > tolerance or e.mRight < self.mLeft or self.mRight < e.mLeft:
                 continue # Not equal z-layer or not in window of vertical projection.
             if self.originTop:
@@ -1587,9 +1870,7 @@ class Element(object):
         Note that the x may be outside the parent box. Only elements with identical z-value are compared.
         Comparison of available spave, includes the margins of the elements."""
         x = 0
-        for e in self.parent.elements: # All elements that share self.parent, except self.
-            if previousOnly and e is self: # Only look at siblings that are previous in the list.
-                break 
+        for e in self._getFloatSiblings(previousOnly, tolerance, 'y'):
             if abs(e.z - self.z) > tolerance:
                 continue # Not equal z-layer
             if self.originTop: # not in window of horizontal projection.
@@ -1607,9 +1888,7 @@ class Element(object):
         Note that the y may be outside the parent box. Only elements with identical z-value are compared.
         Comparison of available spave, includes the margins of the elements."""
         x = self.parent.w
-        for e in self.parent.elements: # All elements that share self.parent, except self.
-            if previousOnly and e is self: # Only look at siblings that are previous in the list.
-                break 
+        for e in self._getFloatSiblings(previousOnly, tolerance, 'y'):
             if abs(e.z - self.z) > tolerance or e.mBottom < self.mTop or self.mBottom < e.mTop:
                 continue # Not equal z-layer or not in window of horizontal projection.
             x = min(e.mLeft, x)
@@ -1684,7 +1963,8 @@ class Element(object):
         # Draw all elements relative to this point
         for e in self.elements:
             if e.show:
-                e.draw(origin, view)
+                with profiler.span('draw', e=e):
+                    e.draw(origin, view)
 
     def getElementInfoString(self):
         u"""Answer a single string with info about the element. Default is to show the posiiton
@@ -1908,7 +2188,14 @@ class Element(object):
             if e.show:
                 e.evaluate(score)
         return score
+
+    def evaluateBatch(self, score=None):
+        u"""Answer the same score as self.evaluate(score), testing the conditions of the children of every
+        container in vector form with NumPy. Conditions that cannot be vectorized, or all conditions if NumPy
+        is not installed, are evaluated one by one."""
+        return evaluateBatch(self, score)
          
+    @profiled('solve')
     def solve(self, score=None):
         u"""Evaluate the content of element e with the total sum of conditions."""
         if score is None:
@@ -1920,7 +2207,44 @@ class Element(object):
             if e.show:
                 e.solve(score)
         return score
-         
+
+    def resetSolved(self):
+        u"""Clear the status of the last incremental solve of self, so the conditions of self are solved
+        again on the next call of self.solveChanged()."""
+        self._solveTime = None # Time of the geometry clock at the start of the last incremental solve.
+        self._solveConditions = None # Conditions of self at the last incremental solve.
+        self._solveScore = None # Score of the conditions of self at the last incremental solve.
+
+    def solveChanged(self, score=None, inputTime=0):
+        u"""Incremental version of self.solve(). Only solve the conditions of self if the geometry of self
+        changed since the last solve, or the geometry of one of the inputs: *inputTime* is the latest
+        geometry time of the parent and the previous siblings of self. Otherwise the score of the last
+        solve of self is added. Then do the same for the child elements. The number of solved elements
+        and conditions are counted in score.solvedElements and score.solvedConditions."""
+        if score is None:
+            score = Score()
+        GEOMETRY_CLOCK['running'] = True # From now on, changes of geometry need a time stamp.
+        conditions = self.conditions
+        if conditions: # Can be None or empty
+            solveTime = self._solveTime
+            if solveTime is None or conditions is not self._solveConditions or \
+                    max(inputTime, self._geometryTime) > solveTime:
+                self._solveTime = getGeometryTime() # Changes of self by its own conditions make self dirty.
+                self._solveConditions = conditions
+                self._solveScore = Score()
+                for condition in conditions:
+                    condition.solve(self, self._solveScore)
+                score.solvedElements += 1
+                score.solvedConditions += len(conditions)
+            score.result += self._solveScore.result
+            score.fails += self._solveScore.fails
+        inputTime = self._geometryTime # Parent time of the children
+        for e in self.elements: # Also works if showing element is not a container.
+            if e.show:
+                e.solveChanged(score, inputTime)
+            inputTime = max(inputTime, e._geometryTime) # Include previous siblings.
+        return score
+
     #   C O N D I T I O N S
 
     def isBottomOnBottom(self, tolerance=0):
@@ -11,7 +11,10 @@
 #
 #     path.py
 #
-from drawBot import drawPath, save, restore, transform, scale, fill, stroke, strokeWidth
+try:
+    from drawBot import drawPath, save, restore, transform, scale, fill, stroke, strokeWidth
+except ImportError: # Headless, see pagebot/__init__.py
+    drawPath = save = restore = transform = scale = fill = stroke = strokeWidth = None
 from pbpath import Path
 from pagebot.toolbox.transformer import pointOffset
 from pagebot import setStrokeColor, setFillColor
@@ -11,12 +11,16 @@
 #
 #     galley.py
 #
-from drawBot import rect
+try:
+    from drawBot import rect
+except ImportError: # Headless, see pagebot/__init__.py
+    rect = None
 
 from pagebot.style import NO_COLOR, makeStyle
 from pagebot.elements.element import Element
 from pagebot.toolbox.transformer import pointOffset, int2Color
 from pagebot import newFS, setStrokeColor, setFillColor
+from pagebot.toolbox.profiling import profiler
 
 class Galley(Element):
     u"""A Galley is sticky sequential flow of elements, where the parts can have
@@ -39,12 +43,21 @@ class Galley(Element):
         # Note that in case there is potential clash in the double usage of fill and stroke.
         self.lastTextBox = None
 
-    def appendString(self, fs):
-        u"""Add the string to the laat text box. Create a new textbox if not found."""
+    def appendString(self, fs, markers=None):
+        u"""Add the string to the laat text box. Create a new textbox if not found.
+        Optional *markers* is the marker side-table of *fs*, see TextBox.appendMarker."""
         if self.lastTextBox is None:
-            self.newTextBox(fs) # Also sets self.lastTextBox 
+            tb = self.newTextBox(fs) # Also sets self.lastTextBox 
+            if markers:
+                tb.markers = markers
         else:
-            self.lastTextBox.appendString(fs)
+            self.lastTextBox.appendString(fs, markers)
+
+    def appendMarker(self, markerId, arg=None):
+        u"""Add the marker to the side-table of the last text box. Create a new textbox if not found."""
+        if self.lastTextBox is None:
+            self.newTextBox('')
+        self.lastTextBox.appendMarker(markerId, arg)
 
     def getMinSize(self):
         u"""Cumulation of the maximum minSize of all enclosed elements."""
@@ -127,7 +140,8 @@ class Galley(Element):
         gy = 0
         for element in self.elements:
             # @@@ Find space and do more composition
-            element.draw((px, py + gy), view)
+            with profiler.span('draw', e=element):
+                element.draw((px, py + gy), view)
             gy += element.h
 
         if self.drawAfter is not None: # Call if defined
@@ -14,7 +14,10 @@
 from __future__ import division # Make integer division result in float.
 
 import os
-from drawBot import imageSize, imagePixelColor, save, restore, image, scale
+try:
+    from drawBot import imageSize, imagePixelColor, save, restore, image, scale
+except ImportError: # Headless, see pagebot/__init__.py
+    imageSize = imagePixelColor = save = restore = image = scale = None
 from pagebot.elements.element import Element
 from pagebot.style import DEFAULT_WIDTH, DEFAULT_HEIGHT, NO_COLOR # In case no image is defined.
 from pagebot.toolbox.transformer import pointOffset, point2D
@@ -11,7 +11,10 @@
 #
 #     line.py
 #
-from drawBot import newPath, moveTo, lineTo, drawPath 
+try:
+    from drawBot import newPath, moveTo, lineTo, drawPath
+except ImportError: # Headless, see pagebot/__init__.py
+    newPath = moveTo = lineTo = drawPath = None
 from pagebot.style import NO_COLOR
 from pagebot.toolbox.transformer import pointOffset
 from pagebot.elements.element import Element
@@ -12,7 +12,10 @@
 #     rect.py
 #
 from __future__ import division # Make integer division result in float.
-from drawBot import rect
+try:
+    from drawBot import rect
+except ImportError: # Headless, see pagebot/__init__.py
+    rect = None
 
 from pagebot import setStrokeColor, setFillColor
 from pagebot.style import NO_COLOR
@@ -12,10 +12,13 @@
 #     pbtextbox.py
 #
 import re
-import CoreText
-import Quartz
-
-from drawBot import textOverflow, hyphenation, textBox, rect, textSize, FormattedString, line
+try:
+    import CoreText
+    import Quartz
+    from drawBot import textOverflow, hyphenation, textBox, rect, textSize, FormattedString, line
+except ImportError: # Headless, see pagebot/__init__.py
+    CoreText = Quartz = None
+    textOverflow = hyphenation = textBox = rect = textSize = FormattedString = line = None
 
 from pagebot.style import LEFT, RIGHT, CENTER, NO_COLOR, MIN_WIDTH, MIN_HEIGHT, makeStyle, MIDDLE
 from pagebot.elements.element import Element
@@ -15,7 +15,10 @@
 #     of alugnment, position and leading (in case there are "\n" returns
 #     in the string)
 #
-from drawBot import textSize
+try:
+    from drawBot import textSize
+except ImportError: # Headless, see pagebot/__init__.py
+    textSize = None
 
 from pagebot.elements.pbtextbox import TextBox
 
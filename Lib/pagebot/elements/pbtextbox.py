@@ -12,32 +12,25 @@
 #     textbox.py
 #
 import re
-import CoreText
-import Quartz
-
-from drawBot import textOverflow, hyphenation, textBox, text, rect, textSize, FormattedString, line, fill, \
-    stroke, strokeWidth, save, restore
-
-from pagebot import newFS, setStrokeColor, setFillColor, setGradient, setShadow
+try:
+    import CoreText
+    import Quartz
+    from drawBot import textOverflow, hyphenation, textBox, text, rect, textSize, FormattedString, line, fill, \
+        stroke, strokeWidth, save, restore
+except ImportError: # Headless, see pagebot/__init__.py
+    CoreText = Quartz = None
+    textOverflow = hyphenation = textBox = text = rect = textSize = FormattedString = line = fill = None
+    stroke = strokeWidth = save = restore = None
+
+from pagebot import newFS, setStrokeColor, setFillColor, setGradient, setShadow, sliceMarkers
 from pagebot.style import LEFT, RIGHT, CENTER, NO_COLOR, MIN_WIDTH, MIN_HEIGHT, makeStyle, MIDDLE, BOTTOM, DEFAULT_WIDTH, DEFAULT_HEIGHT
 from pagebot.elements.element import Element
 from pagebot.toolbox.transformer import pointOffset
+from pagebot.toolbox.textmeasure import textMeasureCache, fsHash
+from pagebot.toolbox.textlayout import FoundPattern, BaseTextLine, getTextLayout, fsLength
+from pagebot.toolbox.snapshot import runs2FS
 from pagebot.fonttoolbox.objects.glyph import Glyph
 
-class FoundPattern(object):
-    def __init__(self, s, x, ix, y=None, w=None, h=None, line=None, run=None):
-        self.s = s # Actual found string
-        self.x = x
-        self.ix = ix
-        self.y = y
-        self.w = w
-        self.h = h
-        self.line = line # TextLine instance that this was found in
-        self.run = run # List of  of this strin,g
-    
-    def __repr__(self):
-        return '[Found "%s" @ %d,%d]' % (self.s, self.x, self.y) 
-
 class TextRun(object):
     def __init__(self, ctRun, runIndex):
         self.runIndex = runIndex # Index of the run in the TextLine
@@ -213,7 +206,7 @@ class TextRun(object):
     minimumLineHeight = property(_get_minimumLineHeight)
 
         
-class TextLine(object):
+class TextLine(BaseTextLine):
     def __init__(self, ctLine, p, lineIndex):
         self._ctLine = ctLine
         self.x, self.y = p # Relative position from top of TextBox
@@ -231,9 +224,6 @@ class TextLine(object):
     def __repr__(self):
         return '[TextLine #%d Glyphs:%d Runs:%d]' % (self.lineIndex, self.glyphCount, len(self.runs))
 
-    def __len__(self):
-        return self.glyphCount
-
     def getIndexForPosition(self, (x, y)):
         return CoreText.CTLineGetStringIndexForPosition(self._ctLine, CoreText.CGPoint(x, y))[0]
     
@@ -246,12 +236,6 @@ class TextLine(object):
         return CoreText.CTLineGetStringRange(self._ctLine).location
     stringIndex = property(_get_stringIndex)
  
-    def getGlyphIndex2Run(self, glyphIndex):
-        for run in self.runs:
-            if run.iStart >= glyphIndex:
-                return run
-        return None
-        
     #def _get_alignment(self):
     #    return CoreText.CTTextAlignment(self._ctLine)
     #alignment = property(_get_alignment)
@@ -271,20 +255,6 @@ class TextLine(object):
         return CoreText.CTLineGetTrailingWhitespaceWidth(self._ctLine)
     trailingWhiteSpace = property(_get_trailingWhiteSpace)
 
-    def findPattern(self, pattern):
-        founds = []
-        if isinstance(pattern, basestring):
-            pattern = re.compile(pattern)
-            #pattern = re.compile('([a-ZA-Z0-9\.\-\_]*])
-        for iStart, iEnd in [(m.start(0), m.end(0)) for m in re.finditer(pattern, self.string)]:
-            xStart = self.getOffsetForStringIndex(iStart)
-            xEnd = self.getOffsetForStringIndex(iEnd)
-            #print 'xStart, xEnd', xStart, xEnd
-            run = self.getGlyphIndex2Run(xStart)
-            #print 'iStart, xStart', iStart, xStart, iEnd, xEnd, run
-            founds.append(FoundPattern(self.string[iStart:iEnd], xStart, iStart, line=self, run=run))
-        return founds
-           
 class TextBox(Element):
 
     # Initialize the default behavior tags as different from Element.
@@ -299,24 +269,31 @@ class TextBox(Element):
         # Note that in case there is potential clash in the double usage of fill and stroke.
         self.minW = max(minW or 0, MIN_WIDTH, self.TEXT_MIN_WIDTH)
         self._textLines = self._baseLines = None # Force initiaize upon first usage.
+        self._fsHash = None # Content hash of self.fs for the text measurement cache, reset when fs changes.
+        self._markers = [] # Side-table of markers: sorted list of (string index, markerId, arg)
         self.size = w, h
         if isinstance(fs, basestring):
             fs = newFS(fs, self)
         self.fs = fs # Keep as plain string, in case parent is not set yet.
         self.showBaselines = showBaselines # Force showing of baseline if view.showBaselines is False.
 
+    def _copyElement(self, copyOnWrite):
+        e = Element._copyElement(self, copyOnWrite)
+        e._markers = list(self._markers) # Don't share the side-table, self.appendMarker changes it in place.
+        return e
+
     def _get_w(self): # Width
         return min(self.maxW, max(self.minW, self.style['w'], MIN_WIDTH)) # From self.style, don't inherit.
     def _set_w(self, w):
         self.style['w'] = w or MIN_WIDTH # Overwrite element local style from here, parent css becomes inaccessable.
-        self._textLines = None # Force reset if being called
+        self._textLines = None # Force reset if being called. Measurements are cached by width.
     w = property(_get_w, _set_w)
 
     def _get_h(self):
         u"""Answer the height of the textBox. If self.style['elasticH'] is set, then answer the 
         vertical space that the text needs. This overwrites the setting of self._h."""
         if self.style['h'] is None: # Elastic height
-            h = self.getTextSize(self.w)[1] + self.pt + self.pb # Add paddings
+            h = self.getTextSize(w=self.w)[1] + self.pt + self.pb # Add paddings
         else:
             h = self.style['h']
         return min(self.maxH, max(self.minH, h)) # Should not be 0 or None
@@ -336,29 +313,69 @@ class TextBox(Element):
     def _set_fs(self, fs):
         self._fs = fs
         self._textLines = None # Force reset when called.
+        self._fsHash = None
+        self.textChanged()
     fs = property(_get_fs, _set_fs)
+
+    def textChanged(self):
+        u"""Called when self.fs changed. If the height of self is elastic, then it changes with the text,
+        so the spatial index of the parent is updated. Otherwise only the conditions of self, such as
+        Overflow2Next, need to be solved again by the incremental solver."""
+        if self.style['h'] is None:
+            self.geometryChanged()
+        else:
+            self.contentChanged()
   
+    def _get_markers(self):
+        u"""Answer the marker side-table of self.fs, the sorted list of (string index, markerId, arg).
+        Setting self.fs keeps the markers, the caller sets the markers of the new string."""
+        return self._markers
+    def _set_markers(self, markers):
+        self._markers = list(markers or [])
+        doc = self.doc
+        if doc is not None: # Update the marker lookup of the document.
+            doc.elementIndex.updateMarkers(self)
+    markers = property(_get_markers, _set_markers)
+
     def setText(self, s):
         u"""Set the formatted string to s, using self.style."""
         self.fs = newFS(s, self)
+        self.markers = []
 
-    def appendString(self, fs):
+    def appendString(self, fs, markers=None):
         u"""Append s to the running formatted string of the self. Note that the string
         is already assumed to be styled or can be added as plain string.
         Don't calculate the overflow here, as this is slow/expensive operation.
         Also we don't want to calcualte the textLines/runs for every string appended,
         as we don't know how much more the caller will add. self._textLines is set to None
-        to force recalculation as soon as self.textLines is called again."""
+        to force recalculation as soon as self.textLines is called again.
+        Optional *markers* is the marker side-table of *fs*, added to the markers of self."""
         assert fs is not None
         self._textLines = None # Reset to force call to self.initializeTextLines()
+        self._fsHash = None
+        if markers:
+            offset = fsLength(self.fs)
+            self.markers = self._markers + [(offset + index, markerId, arg) for index, markerId, arg in markers]
         if self.fs is None:
             self.fs = fs
         else:
-            self.fs += fs
+            self.fs += fs # Calls self.textChanged()
         return self.fs # Answer the complete FormattedString as convenience for the caller.
 
     def appendMarker(self, markerId, arg=None):
-        self.appendString(getMarker(markerId, arg=arg))
+        u"""Add the marker with *markerId* and *arg* at the end of the current string to the side-table
+        self.markers, instead of invisible marker text as made by pagebot.getMarker. The side-table is
+        kept by appending and by flowing the text into other boxes, so the page and box of a marker
+        are found by Document.findMarkers without scanning the text."""
+        self._markers.append((fsLength(self.fs), markerId, arg))
+        doc = self.doc
+        if doc is not None:
+            doc.elementIndex.updateMarkers(self)
+
+    def getMarkers(self, markerId=None):
+        u"""Answer the list of (string index, markerId, arg) of the markers in self.fs, all or only the
+        ones with *markerId*."""
+        return [marker for marker in self._markers if markerId is None or marker[1] == markerId]
 
     def _get_textLines(self):
         if self._textLines is None:
@@ -375,6 +392,11 @@ class TextBox(Element):
     def initializeTextLines(self):
         u"""Answer an ordered list of all baseline position, starting at the top."""    
         self._box = 0, 0, self.w, self.h
+        layout = self.getTextLayout()
+        if layout is not None: # Layout without CoreText, see toolbox.textlayout
+            self._ctLines = None
+            self._textLines = layout.getTextLines(self._fs, self.w, self.h, self.originTop)
+            return
         attrString = self._fs.getNSObject()
         setter = CoreText.CTFramesetterCreateWithAttributedString(attrString)
         path = Quartz.CGPathCreateMutable()
@@ -395,19 +417,37 @@ class TextBox(Element):
     def getTextSize(self, fs=None, w=None):
         """Figure out what the width/height of the text self.fs is, with or given width or
         the styled width of this text box. If fs is defined as external attribute, then the
-        size of the string is answers, as if it was already inside the text box."""
+        size of the string is answers, as if it was already inside the text box.
+        Measurements are cached by content hash of the string and width, see toolbox.textmeasure."""
         if fs is None:
-            fs = self.fs
-        return textSize(self.fs, width=w or self.w)
+            return textMeasureCache.textSize(self.fs, w or self.w, self.getFsHash(), self.getTextLayout())
+        return textMeasureCache.textSize(fs, w or self.w, layout=self.getTextLayout())
 
     def getOverflow(self, w=None, h=None):
         """Figure out what the overflow of the text is, with the given (w,h) or styled
         (self.w, self.h) of this text box. If self.style['elasticH'] is True, then by
-        definintion overflow will allways be empty."""
+        definintion overflow will allways be empty. Measurements are cached by content hash of the
+        string and the box size, see toolbox.textmeasure."""
         if self.css('elasticH'): # In case elasticH is True, box will aways fit the content.
             return ''
         # Otherwise test if there is overflow of text in the given size.
-        return textOverflow(self.fs, (0, 0, w or self.w-self.pr-self.pl, h or self.h-self.pt-self.pb), LEFT)
+        return textMeasureCache.textOverflow(self.fs, w or self.w-self.pr-self.pl, h or self.h-self.pt-self.pb,
+            self.getFsHash(), self.getTextLayout())
+
+    def getTextLayout(self):
+        u"""Answer the text layout by the name in css('textLayout'), see toolbox.textlayout.
+        Answer None for the CoreText layout of DrawBot."""
+        name = self.css('textLayout')
+        if name is None:
+            return None
+        return getTextLayout(name)
+
+    def getFsHash(self):
+        u"""Answer the content hash of self.fs, cached until the string is changed by self.fs or
+        self.appendString."""
+        if self._fsHash is None:
+            self._fsHash = fsHash(self.fs)
+        return self._fsHash
 
     def NOTNOW_getBaselinePositions(self, y=0, w=None, h=None):
         u"""Answer the list vertical baseline positions, relative to y (default is 0)
@@ -445,6 +485,9 @@ class TextBox(Element):
                 if nextElement is not None and not nextElement.fs: 
                     # Finally found one empty box on this page or next page?
                     nextElement.fs = overflow
+                    split = fsLength(self.fs) - fsLength(overflow)
+                    nextElement.markers = sliceMarkers(self._markers, split)
+                    self.markers = sliceMarkers(self._markers, 0, split) # The overflow markers moved to nextElement.
                     nextElement.prevPage = page.name
                     nextElement.prevElement = self.name # Remember the back link
                     score = nextElement.solve() # Solve any overflow on the next element.
@@ -468,7 +511,7 @@ class TextBox(Element):
             self.drawBefore(self, p, view)
 
         # Draw the text with horizontal and vertical alignment
-        tw, th = textSize(self.fs)
+        tw, th = textMeasureCache.textSize(self.fs, None, self.getFsHash(), self.getTextLayout()) # Unlimited width
         xOffset = yOffset = 0
         if self.css('yTextAlign') == MIDDLE:
             yOffset = (self.h - self.pb - self.pt - th)/2
@@ -484,8 +527,12 @@ class TextBox(Element):
             save()
             setShadow(textShadow)
 
-        textBox(self.fs, (px + self.pl + xOffset, py + self.pb-yOffset, 
-            self.w-self.pl-self.pr, self.h-self.pb-self.pt))
+        box = (px + self.pl + xOffset, py + self.pb-yOffset, self.w-self.pl-self.pr, self.h-self.pb-self.pt)
+        layout = self.getTextLayout()
+        if layout is None:
+            textBox(self.fs, box)
+        else: # Draw the lines as measured by the layout, not broken again by CoreText.
+            self._drawLayoutRuns(layout, box)
 
         if textShadow:
             restore()
@@ -505,6 +552,13 @@ class TextBox(Element):
         self._restoreScale()
         view.drawElementMetaInfo(self, origin) # Depends on css flag 'showElementInfo'
 
+    def _drawLayoutRuns(self, layout, box):
+        u"""Draw the runs of self.fs at the positions of the text *layout* in *box*, see
+        toolbox.textlayout.FontToolsLayout.getDrawRuns."""
+        bx, by, bw, bh = box
+        for x, y, s, attributes in layout.getDrawRuns(self.fs, bw, bh):
+            text(runs2FS([(s, attributes)]), (bx + x, by + y))
+
     def _drawBaselines(self, px, py, view):
         # Let's see if we can draw over them in exactly the same position.
         if not view.showTextBoxBaselines and not self.showBaselines:
@@ -11,9 +11,13 @@
 #
 #     spreadview.py
 #
-from drawBot import newPage, rect, fill, stroke, strokeWidth
+try:
+    from drawBot import newPage, rect, fill, stroke, strokeWidth
+except ImportError: # Headless, see pagebot/__init__.py
+    newPage = rect = fill = stroke = strokeWidth = None
 from pagebot import setFillColor, setStrokeColor
 from view import View
+from pagebot.toolbox.profiling import profiler, profiled
 
 class SpreadView(View):
     u"""A View is just another kind of container, kept by document to make a certain presentation of the page tree."""
@@ -29,6 +33,7 @@ class SpreadView(View):
             rect(origin[0], origin[1], page.w, page.h)
             #page.drawFrame(origin, self)
 
+    @profiled('draw')
     def drawPages(self, pageSelection=None):
         u"""Draw the selected pages. pageSelection is an optional set of y-pageNumbers to draw."""
         doc = self.parent
@@ -72,7 +77,8 @@ class SpreadView(View):
             self.drawPageFrame(page, origin)
 
             # Use the (docW, docH) as offset, in case cropmarks need to be displayed.
-            page.draw(origin, self)
+            with profiler.span('draw', e=page):
+                page.draw(origin, self)
 
             if self.drawAfter is not None: # Call if defined
                 self.drawAfter(page, origin, self)
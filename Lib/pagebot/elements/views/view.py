@@ -16,15 +16,24 @@ from datetime import datetime
 from math import atan2, radians, degrees, cos, sin
 import os, os.path
 
-from drawBot import saveImage, newPage, rect, oval, line, newPath, moveTo, lineTo, drawPath,\
-    save, restore, scale, textSize, FormattedString, cmykStroke, text, fill, stroke,\
-    strokeWidth, curveTo, closePath
+try:
+    from drawBot import saveImage, newPage, newDrawing, endDrawing, rect, oval, line, newPath, moveTo, lineTo, drawPath,\
+        save, restore, scale, textSize, FormattedString, cmykStroke, text, fill, stroke,\
+        strokeWidth, curveTo, closePath
+except ImportError: # Headless, see pagebot/__init__.py
+    saveImage = newPage = newDrawing = endDrawing = rect = oval = line = newPath = moveTo = lineTo = None
+    drawPath = save = restore = scale = textSize = FormattedString = cmykStroke = text = fill = stroke = None
+    strokeWidth = curveTo = closePath = None
 
 from pagebot import setFillColor, setStrokeColor, newFS
 from pagebot.elements.element import Element
 from pagebot.style import makeStyle, getRootStyle, NO_COLOR, RIGHT
 from pagebot.toolbox.transformer import *
 from pagebot.builders.cssbuilder import CssBuilder
+from pagebot.builders.pagewriter import newPageWriter
+from pagebot.builders.parallelexport import exportParallel
+from pagebot.builders.incrementalexport import exportIncremental
+from pagebot.toolbox.profiling import profiler, profiled
 
 class View(Element):
     u"""A View is just another kind of container, kept by document to make a certain presentation of the page tree."""
@@ -81,6 +90,7 @@ class View(Element):
 
     MIN_PADDING = 20 # Minimum padding needed to show meta info. Otherwise truncated to 0 and not showing meta info.
 
+    @profiled('draw')
     def drawPages(self, pageSelection=None):
         u"""Draw the selected pages. pageSelection is an optional set of y-pageNumbers to draw."""
         doc = self.parent
@@ -89,44 +99,50 @@ class View(Element):
         for pn, pages in doc.getSortedPages():
             #if pageSelection is not None and not page.y in pageSelection:
             #    continue
-            # Create a new DrawBot viewport page to draw template + page, if not already done.
-            # In case the document is oversized, then make all pages the size of the document, so the
-            # pages can draw their crop-marks. Otherwise make DrawBot pages of the size of each page.
-            # Size depends on the size of the larges pages + optional decument padding.
             page = pages[0] # TODO: make this work for pages that share the same page number
-            pw, ph = w, h  # Copy from main (w, h), since they may be altered.
-            if self.pl > self.MIN_PADDING and self.pt > self.MIN_PADDING and self.pb > self.MIN_PADDING and self.pr > self.MIN_PADDING:
-                pw += self.pl + self.pr
-                ph += self.pt + self.pb
-                if self.originTop:
-                    origin = self.pl, self.pt, 0
-                else:
-                    origin = self.pl, self.pb, 0
+            self.drawPage(page, w, h)
+
+    def drawPage(self, page, w, h):
+        u"""Draw a single page in a new DrawBot page. (w, h) is the size of the largest page in the document."""
+        # Create a new DrawBot viewport page to draw template + page, if not already done.
+        # In case the document is oversized, then make all pages the size of the document, so the
+        # pages can draw their crop-marks. Otherwise make DrawBot pages of the size of each page.
+        # Size depends on the size of the larges pages + optional decument padding.
+        pw, ph = w, h  # Copy from main (w, h), since they may be altered.
+        if self.pl > self.MIN_PADDING and self.pt > self.MIN_PADDING and self.pb > self.MIN_PADDING and self.pr > self.MIN_PADDING:
+            pw += self.pl + self.pr
+            ph += self.pt + self.pb
+            if self.originTop:
+                origin = self.pl, self.pt, 0
             else:
-                pw = page.w # No padding defined, follow the size of the page.
-                ph = page.h
-                origin = (0, 0, 0)
+                origin = self.pl, self.pb, 0
+        else:
+            pw = page.w # No padding defined, follow the size of the page.
+            ph = page.h
+            origin = (0, 0, 0)
 
-            newPage(pw, ph) #  Make page in DrawBot of self size, actual page may be smaller if showing cropmarks.
-            # View may have defined a background
-            if self.style.get('fill') is not None:
-                setFillColor(self.style['fill'])
-                rect(0, 0, pw, ph)
+        newPage(pw, ph) #  Make page in DrawBot of self size, actual page may be smaller if showing cropmarks.
+        # View may have defined a background
+        if self.style.get('fill') is not None:
+            setFillColor(self.style['fill'])
+            rect(0, 0, pw, ph)
 
-            if self.drawBefore is not None: # Call if defined
-                self.drawBefore(page, origin, self)
+        if self.drawBefore is not None: # Call if defined
+            self.drawBefore(page, origin, self)
 
-            # Use the (docW, docH) as offset, in case cropmarks need to be displayed.
+        # Use the (docW, docH) as offset, in case cropmarks need to be displayed.
+        with profiler.span('draw', e=page):
             page.draw(origin, self)
 
-            if self.drawAfter is not None: # Call if defined
-                self.drawAfter(page, origin, self)
+        if self.drawAfter is not None: # Call if defined
+            self.drawAfter(page, origin, self)
 
-            # Self.infoElements now may have collected elements needed info to be drawn, after all drawing is done.
-            # So the info boxes don't get covered by regular page content.
-            for e in self.elementsNeedingInfo.values():
-                self._drawElementsNeedingInfo()
+        # Self.infoElements now may have collected elements needed info to be drawn, after all drawing is done.
+        # So the info boxes don't get covered by regular page content.
+        for e in self.elementsNeedingInfo.values():
+            self._drawElementsNeedingInfo()
 
+    @profiled('export')
     def export(self, fileName, pageSelection=None, multiPage=True):
         u"""Export the document to fileName for all pages in sequential order.
         If pageSelection is defined, it must be a list with page numbers to
@@ -165,6 +181,59 @@ class View(Element):
             # http://www.drawbot.com/content/canvas/saveImage.html
             saveImage(fileName, multipage=multiPage)
 
+    @profiled('export')
+    def exportStream(self, fileName, pages=None, pageSelection=None, release=False):
+        u"""Export the pages one by one to fileName, without keeping the drawing of all pages in the canvas.
+        Every page is drawn in a new DrawBot drawing, written by the page writer for the extension of fileName
+        (see pagebot.builders.pagewriter) and the drawing is ended before the next page. PDF is written as one
+        file, other formats as numbered file per page. *pages* is an optional iterable of pages, e.g. a generator
+        that composes each page when it is needed. Default is the pages of the document, filtered by the optional
+        *pageSelection* of page numbers. If *release* is True, then the child elements of each page are removed
+        after the page is written, so they can be garbage collected. Answer the number of written pages."""
+        doc = self.parent
+        folder = path2ParentPath(fileName)
+        if not os.path.exists(folder):
+            os.mkdir(folder)
+
+        w, h, _ = doc.getMaxPageSizes(pageSelection)
+        if pages is None:
+            pages = [pnPages[0] for pn, pnPages in doc.getSortedPages(pageSelection)]
+
+        writer = newPageWriter(fileName)
+        try:
+            for page in pages:
+                newDrawing()
+                self.drawPage(page, w, h)
+                writer.writePage()
+                endDrawing()
+                self.elementsNeedingInfo = {} # Don't keep references to elements of written pages.
+                if release:
+                    page.releaseElements()
+        finally:
+            writer.close()
+        return writer.pageCount
+
+    @profiled('export')
+    def exportParallel(self, fileName, workers, pageSelection=None):
+        u"""Export the solved pages to the PDF fileName, rendered by *workers* processes in page ranges that
+        are merged in page order, keeping outlines and metadata. Pages with flows or with values that are
+        lost in a snapshot are rendered serially.
+        Answer the list of throughput statistics per process. See pagebot.builders.parallelexport."""
+        folder = path2ParentPath(fileName)
+        if not os.path.exists(folder):
+            os.mkdir(folder)
+        return exportParallel(self, fileName, workers, pageSelection)
+
+    @profiled('export')
+    def exportIncremental(self, fileName, cacheFolder, pageSelection=None):
+        u"""Export the solved pages to fileName, reusing the rendered pages in *cacheFolder* of previous exports
+        for pages with the same content hash. PDF is merged as one file, other formats are written as numbered
+        file per page. Answer the report of reused and rebuilt pages. See pagebot.builders.incrementalexport."""
+        folder = path2ParentPath(fileName)
+        if not os.path.exists(folder):
+            os.mkdir(folder)
+        return exportIncremental(self, fileName, cacheFolder, pageSelection)
+
     #   D R A W I N G  P A G E  M E T A  I N F O
 
     def drawPageMetaInfo(self, page, origin):
@@ -203,6 +272,16 @@ class View(Element):
             else:
                 rect(px+pr, py+pb, page.w-pl-pr, page.h-pt-pb)
 
+    def getPageNameInfo(self, page):
+        u"""Answer the string with the page number, date, document title and page name, as drawn by
+        self.drawPageNameInfo. It is part of the content hash of the page, see toolbox.pagehash."""
+        dt = datetime.datetime.now()
+        d = dt.strftime("%A, %d. %B %Y %I:%M%p")
+        s = 'Page %s | %s | %s' % (page.parent.getPageNumber(page), d, page.parent.title or 'Untitled')
+        if page.name:
+            s += ' | ' + page.name
+        return s
+
     def drawPageNameInfo(self, page, origin):
         u"""Draw additional document information, color markers, page number, date, version, etc.
         outside the page frame, if drawing crop marks."""
@@ -210,12 +289,8 @@ class View(Element):
             bleed = self.css('bleed')
             cms = self.css('viewCropMarkSize') - bleed
             fontSize = self.css('viewPageNameFontSize')
-            dt = datetime.datetime.now()
-            d = dt.strftime("%A, %d. %B %Y %I:%M%p")
-            s = 'Page %s | %s | %s' % (page.parent.getPageNumber(page), d, page.parent.title or 'Untitled')
-            if page.name:
-                s += ' | ' + page.name
-            fs = FormattedString(s, font=self.css('viewPageNameFont'), fill=0, fontSize=fontSize)
+            fs = FormattedString(self.getPageNameInfo(page), font=self.css('viewPageNameFont'), fill=0,
+                fontSize=fontSize)
             text(fs, (self.pl + bleed, self.pb + page.h + cms - fontSize*2)) # Draw on top of page.
 
     #   D R A W I N G  F L O W S
@@ -19,9 +19,12 @@
 #     We'll call this class "Font" instead of "Style" (as in other TypeNetwerk tool code),
 #     to avoid confusion with the PageBot style dictionary, which hold style parameters.
 #
-from AppKit import NSFont
 from fontTools.ttLib import TTFont, TTLibError
-from CoreText import CTFontDescriptorCreateWithNameAndSize, CTFontDescriptorCopyAttribute, kCTFontURLAttribute
+try:
+    from AppKit import NSFont
+    from CoreText import CTFontDescriptorCreateWithNameAndSize, CTFontDescriptorCopyAttribute, kCTFontURLAttribute
+except ImportError: # Headless, fonts can only be opened by path.
+    NSFont = None
 try:
     from drawBot import installFont, listOpenTypeFeatures, installedFonts
 except ImportError:
@@ -33,6 +36,8 @@ from pagebot.fonttoolbox.variablefontaxes import axisDefinitions
 from pagebot.contributions.adobe.kerndump.getKerningPairsFromOTF import OTFKernReader
 
 def getFontPathOfFont(fontName):
+    if NSFont is None: # Headless, installed fonts cannot be found.
+        return None
     font = NSFont.fontWithName_size_(fontName, 25)
     if font is not None:
         fontRef = CTFontDescriptorCreateWithNameAndSize(font.fontName(), font.pointSize())
@@ -14,9 +14,11 @@
 #     Implements a PageBot font classes to get info from a TTFont.
 #
 import weakref
-from AppKit import NSFont
 from fontTools.ttLib import TTFont, TTLibError
-from drawBot import BezierPath
+try:
+    from drawBot import BezierPath
+except ImportError: # Headless, glyph paths are not available.
+    BezierPath = None
 from fontinfo import FontInfo
 from pagebot.fonttoolbox.analyzers.glyphanalyzer import GlyphAnalyzer
 from pagebot.toolbox.transformer import point2D
@@ -12,5 +12,5 @@
 #     pagebot/readers/__init__.py
 #
 from rereader import readRE
-from mdreader import readMD
-from xmlreader import readXML, readHTML
\ No newline at end of file
+from mdreader import readMD, iterMD
+from xmlreader import readXML, readHTML, iterXML, iterNodeEvents
\ No newline at end of file
@@ -11,10 +11,12 @@
 #
 #     mdreader.py
 #
-#     Read markdown files from path or url and answer the etree.
+#     Read markdown files from path or url and answer the etree, or the stream
+#     of (event, node) events.
 #
 import codecs
-from xmlreader import readXML
+from cStringIO import StringIO
+import xml.etree.ElementTree as ET
 
 try:
     import markdown
@@ -25,10 +27,8 @@ except ImportError:
     print 'Typesetter: Install Python markdown from https://pypi.python.org/pypi/Markdown'
     markdown = None
 
-def markDown2XMLFile(path):
-    u"""If fileName is pointing to a non-XML file, then try to convert. This needs to be
-    extended in the future e.g. to support Word documents or other text resources.
-    If the document is already an XML document, then ignore."""
+def markDown2XML(path):
+    u"""Answer the XML (XHTML) string of the markdown file *path*, with <document> as root node."""
     fileExtension = path.split('.')[-1].lower()
     assert fileExtension.lower() == 'md'
     # If we have MarkDown content, convert to XML (XHTML)
@@ -37,10 +37,14 @@ def markDown2XMLFile(path):
     f.close()
     mdExtensions = [FootnoteExtension(), LiteratureExtension(), Nl2BrExtension()]
     xml = u'<?xml version="1.0" encoding="UTF-8"?>\n<document>%s</document>' % markdown.markdown(mdText, extensions=mdExtensions)
-    xml = xml.replace('&nbsp;', ' ')
+    return xml.replace('&nbsp;', ' ')
 
+def markDown2XMLFile(path):
+    u"""If fileName is pointing to a non-XML file, then try to convert. This needs to be
+    extended in the future e.g. to support Word documents or other text resources.
+    If the document is already an XML document, then ignore."""
+    xml = markDown2XML(path)
     xmlPath = path + '.xml'
-    print xmlPath
     f = codecs.open(xmlPath, mode="w", encoding="utf-8")
     f.write(xml)
     f.close()
@@ -48,6 +52,9 @@ def markDown2XMLFile(path):
 
 def readMD(path):
     u"""Read the markdown from path and answer the compiled etree."""
-    xmlPath = markDown2XMLFile(path)
-    return readXML(xmlPath)
+    return ET.fromstring(markDown2XML(path).encode('utf-8'))
 
+def iterMD(path):
+    u"""Answer the iterator of ('start', node) and ('end', node) events of the markdown file *path*, as
+    iterXML does for XML files. The converted XML is parsed from memory, without writing a file."""
+    return ET.iterparse(StringIO(markDown2XML(path).encode('utf-8')), events=('start', 'end'))
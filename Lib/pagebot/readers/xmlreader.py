@@ -11,7 +11,8 @@
 #
 #     xmlreader.py
 #
-#     Read XML files from path or url and answer the etree.
+#     Read XML files from path or url and answer the etree, or the stream of
+#     (event, node) events, to typeset without keeping the whole tree.
 #
 import codecs
 import xml.etree.ElementTree as ET
@@ -29,4 +30,24 @@ def readXML(path, xPath=None):
 
 def readHTML(path, xPath=None):
     u"""Read the HTML body tag from path and answer the compiled etree."""
-    return readXML(path, xPath='body')
\ No newline at end of file
+    return readXML(path, xPath='body')
+
+def iterXML(path):
+    u"""Answer the iterator of ('start', node) and ('end', node) events of the XML file *path*, parsed
+    incrementally. The text of a node is complete at the start of its first child node or at its end."""
+    return ET.iterparse(path, events=('start', 'end'))
+
+def iterNodeEvents(node):
+    u"""Answer the generator of ('start', node) and ('end', node) events of the etree *node* and its
+    descendants in document order, walking the tree with a stack instead of recursion."""
+    stack = [(node, iter(node))]
+    yield 'start', node
+    while stack:
+        node, children = stack[-1]
+        child = next(children, None)
+        if child is None:
+            stack.pop()
+            yield 'end', node
+        else:
+            stack.append((child, iter(child)))
+            yield 'start', child
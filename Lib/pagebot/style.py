@@ -14,7 +14,14 @@
 #     Holds the main style definintion and constants of PageBot.
 #
 import sys
-from drawBot import sizes
+import weakref
+try:
+    from drawBot import sizes
+except ImportError: # Headless, the paper sizes of DrawBot are not available.
+    def sizes(name=None):
+        if name is None:
+            return {}
+        return None
 import copy
 
 NO_COLOR = -1
@@ -138,6 +145,395 @@ INTERPOLATING_TIME_KEYS = ('x', 'y', 'z', 'w', 'h', 'd', 'g', 'fill', 'stroke',
 def newStyle(**kwargs):
     return dict(**kwargs)
 
+class StyleOwnership(object):
+    u"""Methods of the style classes to report changes to the owner of the style, and to give the
+    copy-on-write clones of a style their own values before the style is changed."""
+    __slots__ = ()
+
+    def _changed(self, name=None):
+        if self._owner is not None:
+            owner = self._owner()
+            if owner is not None:
+                owner.styleChanged(name)
+
+    def _addClone(self, clone):
+        u"""Remember the CopyOnWriteStyle *clone* that shares the values of self."""
+        clones = self._clones
+        if clones is None:
+            clones = self._clones = []
+        elif len(clones) % 1024 == 0: # Remove the clones of deleted elements now and then.
+            clones[:] = [ref for ref in clones if ref() is not None]
+        clones.append(weakref.ref(clone))
+
+    def _materializeClones(self):
+        u"""Copy the values of self into the clones that share them, before the values of self are changed.
+        Otherwise the clones would see the changed value, while their owners keep the cached old value."""
+        clones = self._clones
+        if clones:
+            self._clones = None
+            for ref in clones:
+                clone = ref()
+                if clone is not None:
+                    clone.materialize()
+
+class CascadingStyle(dict, StyleOwnership):
+    u"""Style dictionary that is owned by an element (or document). Every change of a value is
+    reported to the owner by *owner.styleChanged(name)*, so the owner can clear cached
+    values (such as cascading css values) of itself and its child elements.
+    Copies of a CascadingStyle are plain dictionaries, not bound to the owner."""
+    __slots__ = ('_owner', '_clones') # No instance dictionary needed, saves memory for every element.
+
+    def __init__(self, style=None, owner=None):
+        if isinstance(style, CascadingStyle):
+            style = style.items() # Subclasses may keep values outside the dictionary table.
+        dict.__init__(self, style or {})
+        if owner is not None:
+            owner = weakref.ref(owner)
+        self._owner = owner
+        self._clones = None # Weak references to the CopyOnWriteStyle instances that share the values of self.
+
+    def __setitem__(self, name, value):
+        changed = isChangedValue(self, name, value)
+        if changed: # Setting an equal value does not need to clear cached values.
+            if self._clones:
+                self._materializeClones()
+            dict.__setitem__(self, name, value)
+            self._changed(name)
+        else:
+            dict.__setitem__(self, name, value)
+
+    def __delitem__(self, name):
+        self._materializeClones()
+        dict.__delitem__(self, name)
+        self._changed(name)
+
+    def setdefault(self, name, value=None):
+        if not name in self:
+            self[name] = value
+        return self[name]
+
+    def pop(self, name, *args):
+        self._materializeClones()
+        value = dict.pop(self, name, *args)
+        self._changed(name)
+        return value
+
+    def popitem(self):
+        self._materializeClones()
+        name, value = dict.popitem(self)
+        self._changed(name)
+        return name, value
+
+    def update(self, *args, **kwargs):
+        self._materializeClones()
+        dict.update(self, *args, **kwargs)
+        self._changed()
+
+    def clear(self):
+        self._materializeClones()
+        dict.clear(self)
+        self._changed()
+
+    def copy(self):
+        return dict(self)
+
+    def __copy__(self):
+        return dict(self)
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+def isChangedValue(style, name, value):
+    u"""Answer True if setting *value* for *name* changes the dictionary *style*. Setting the same list,
+    dictionary or set again is a change, as it may have been changed in place. A mutable value that is
+    changed in place without setting it again is not noticed."""
+    if not name in style:
+        return True
+    oldValue = style[name]
+    if oldValue is value:
+        return isinstance(value, (list, dict, set))
+    return oldValue != value
+
+class StyleMapping(StyleOwnership):
+    u"""Base class of the styles that keep their values outside the table of a dictionary. It is not a
+    dict subclass: Python 2 copies the table of a dict subclass directly in dict(style), d.update(style)
+    and f(**style), without calling keys or items, so the values kept elsewhere would be missing.
+    Subclasses implement the reading methods and _write, _remove and _clearValues. Changes are reported
+    to the owner, as in CascadingStyle."""
+    __slots__ = ('_owner', '_clones', '__weakref__')
+    __hash__ = None # Mutable, same as dict.
+
+    def __init__(self, owner=None):
+        if owner is not None:
+            owner = weakref.ref(owner)
+        self._owner = owner
+        self._clones = None
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    # Reading
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def has_key(self, name):
+        return name in self
+
+    def values(self):
+        return [value for name, value in self.items()]
+
+    def iterkeys(self):
+        return iter(self.keys())
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, StyleMapping):
+            other = dict(other.items())
+        return dict(self.items()) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def copy(self):
+        return dict(self.items())
+
+    def __copy__(self):
+        return dict(self.items())
+
+    def __reduce__(self):
+        return dict, (dict(self.items()),)
+
+    # Writing
+
+    def __setitem__(self, name, value):
+        if isChangedValue(self, name, value): # Setting an equal value does not need to clear cached values.
+            self._materializeClones()
+            self._write(name, value)
+            self._changed(name)
+
+    def __delitem__(self, name):
+        if not name in self:
+            raise KeyError(name)
+        self._materializeClones()
+        self._remove(name)
+        self._changed(name)
+
+    def setdefault(self, name, value=None):
+        if not name in self:
+            self[name] = value
+        return self[name]
+
+    def pop(self, name, *args):
+        if not name in self:
+            if args:
+                return args[0]
+            raise KeyError(name)
+        value = self[name]
+        del self[name]
+        return value
+
+    def popitem(self):
+        for name, value in self.items():
+            del self[name]
+            return name, value
+        raise KeyError('popitem(): dictionary is empty')
+
+    def update(self, *args, **kwargs):
+        u"""Same as dict.update, with the change check of __setitem__ for every value."""
+        changedNames = []
+        for name, value in dict(*args, **kwargs).items():
+            if isChangedValue(self, name, value):
+                changedNames.append((name, value))
+        if changedNames:
+            self._materializeClones()
+            for name, value in changedNames:
+                self._write(name, value)
+            if len(changedNames) == 1:
+                self._changed(changedNames[0][0])
+            else:
+                self._changed()
+
+    def clear(self):
+        self._materializeClones()
+        self._clearValues()
+        self._changed()
+
+# Counters of copy-on-write styles, to measure how many template clones needed a style of their own.
+COPY_ON_WRITE_STATS = dict(clones=0, materialized=0)
+
+def getCopyOnWriteStats():
+    u"""Answer a copy of the dictionary with the total of created and materialized copy-on-write styles."""
+    return dict(COPY_ON_WRITE_STATS)
+
+def resetCopyOnWriteStats():
+    u"""Reset the counters of the copy-on-write styles to 0."""
+    COPY_ON_WRITE_STATS['clones'] = COPY_ON_WRITE_STATS['materialized'] = 0
+
+class CopyOnWriteStyle(StyleMapping):
+    u"""Style that shares the values of a *base* style (e.g. the style of a template element), until the
+    first change. Then the values of the base are copied into self and the style continues as a normal
+    style. The base materializes its clones before it changes, so a clone keeps the values of the base
+    at cloning time, the same as a copy."""
+    __slots__ = ('_base', '_values')
+
+    def __init__(self, base, owner=None):
+        StyleMapping.__init__(self, owner)
+        if isinstance(base, CopyOnWriteStyle) and base._base is not None:
+            base = base._base # Clone of a clone, share the same base.
+        self._base = base
+        self._values = None # Dictionary with the values of self, after materializing.
+        base._addClone(self)
+        COPY_ON_WRITE_STATS['clones'] += 1
+
+    def _get_materialized(self):
+        u"""Answer the boolean flag if self has its own copy of the values."""
+        return self._base is None
+    materialized = property(_get_materialized)
+
+    def materialize(self):
+        u"""Copy the values of the base style into self, if that did not happen already."""
+        base = self._base
+        if base is not None:
+            self._values = dict(base.items()) # Base can keep values outside the dictionary table.
+            self._base = None
+            COPY_ON_WRITE_STATS['materialized'] += 1
+
+    # Reading, answer from the base while not materialized.
+
+    def __getitem__(self, name):
+        if self._base is None:
+            return self._values[name]
+        return self._base[name]
+
+    def __contains__(self, name):
+        if self._base is None:
+            return name in self._values
+        return name in self._base
+
+    def get(self, name, default=None):
+        if self._base is None:
+            return self._values.get(name, default)
+        return self._base.get(name, default)
+
+    def __len__(self):
+        if self._base is None:
+            return len(self._values)
+        return len(self._base)
+
+    def keys(self):
+        if self._base is None:
+            return self._values.keys()
+        return self._base.keys()
+
+    def items(self):
+        if self._base is None:
+            return self._values.items()
+        return self._base.items()
+
+    # Writing, materialize first.
+
+    def _write(self, name, value):
+        self.materialize()
+        self._values[name] = value
+
+    def _remove(self, name):
+        self.materialize()
+        del self._values[name]
+
+    def _clearValues(self):
+        self.materialize()
+        self._values.clear()
+
+# Names of the geometry values that a GeometryStyle stores in a compact list, instead of the dictionary table.
+GEOMETRY_KEYS = ('x', 'y', 'z', 'w', 'h', 'd', 'pt', 'pr', 'pb', 'pl', 'pzf', 'pzb', 'mt', 'mr', 'mb', 'ml', 'mzf', 'mzb')
+GEOMETRY_INDEX = dict([(name, index) for index, name in enumerate(GEOMETRY_KEYS)])
+NO_VALUE = object() # Marker for geometry values that are not defined in the style.
+
+class GeometryStyle(StyleMapping):
+    u"""Compact style, used by elements with compactGeometry set to True. The geometry values (position,
+    size, padding and margin) are stored in a list of fixed length, the other values in a dictionary.
+    Otherwise it behaves as a CascadingStyle, including dict(style) and f(**style). The compact style
+    saves memory only: reading and writing values go through Python methods instead of the dictionary
+    table, so they are slower than in a CascadingStyle. Use it for documents with many elements that
+    would not fit in memory otherwise."""
+    __slots__ = ('_values', '_geometry')
+
+    def __init__(self, style=None, owner=None):
+        StyleMapping.__init__(self, owner)
+        self._values = values = {}
+        self._geometry = geometry = [NO_VALUE] * len(GEOMETRY_KEYS)
+        if style:
+            for name, value in style.items():
+                index = GEOMETRY_INDEX.get(name)
+                if index is None:
+                    values[name] = value
+                else:
+                    geometry[index] = value
+
+    def _geometryItems(self):
+        return [(name, value) for name, value in zip(GEOMETRY_KEYS, self._geometry) if value is not NO_VALUE]
+
+    # Reading
+
+    def __getitem__(self, name):
+        index = GEOMETRY_INDEX.get(name)
+        if index is None:
+            return self._values[name]
+        value = self._geometry[index]
+        if value is NO_VALUE:
+            raise KeyError(name)
+        return value
+
+    def __contains__(self, name):
+        index = GEOMETRY_INDEX.get(name)
+        if index is None:
+            return name in self._values
+        return self._geometry[index] is not NO_VALUE
+
+    def get(self, name, default=None):
+        index = GEOMETRY_INDEX.get(name)
+        if index is None:
+            return self._values.get(name, default)
+        value = self._geometry[index]
+        if value is NO_VALUE:
+            return default
+        return value
+
+    def __len__(self):
+        return len(self._values) + len(self._geometryItems())
+
+    def keys(self):
+        return self._values.keys() + [name for name, value in self._geometryItems()]
+
+    def items(self):
+        return self._values.items() + self._geometryItems()
+
+    # Writing
+
+    def _write(self, name, value):
+        index = GEOMETRY_INDEX.get(name)
+        if index is None:
+            self._values[name] = value
+        else:
+            self._geometry[index] = value
+
+    def _remove(self, name):
+        index = GEOMETRY_INDEX.get(name)
+        if index is None:
+            del self._values[name]
+        else:
+            self._geometry[index] = NO_VALUE
+
+    def _clearValues(self):
+        self._values.clear()
+        self._geometry = [NO_VALUE] * len(GEOMETRY_KEYS)
+
 def makeStyle(style=None, **kwargs):
     u"""Make style from a copy of style dict (providing all necessary default values for the
     element to operate) and then overwrite these values with any specific arguments.
@@ -335,6 +731,8 @@ def getRootStyle(u=U, w=W, h=H, **kwargs):
         # Language and hyphenation
         language = 'en', # Language for hyphenation and spelling. Can be altered per style in FormattedString.
         hyphenation = True,
+        # Name of the text layout of text boxes, see toolbox.textlayout. None is the CoreText layout of DrawBot.
+        textLayout = None,
         # Strip pre/post white space from e.text and e.tail and substitute by respectively prefix and postfix
         # if they are not None. Set to e.g. newline(s) "\n" or empty string, if tags need to glue together.
         # Make None for no stripping
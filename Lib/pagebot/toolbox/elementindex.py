@@ -0,0 +1,224 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     elementindex.py
+#
+#     Live index of all elements in a Document by eId and by name, so searching
+#     for (flow) elements does not need a recursive walk through the element tree.
+#     Text boxes with markers in their side-table (see TextBox.appendMarker) are
+#     indexed too, so finding the page and box of a marker is a dictionary lookup.
+#
+import weakref
+from bisect import bisect_left
+
+NO_PAGE_ORDER = (float('inf'),) # Sort key for elements that are not on a page of the document, after all pages.
+
+class ElementIndex(object):
+    u"""Index of the elements in a document by eId and by name. Names are also indexed per page,
+    so lookups can be limited to the scope of a single page. The index is kept up to date by
+    Element.setParent, by changing element names and by changing the markers of text boxes."""
+    def __init__(self, doc):
+        self._doc = weakref.ref(doc)
+        self.clear()
+
+    def __repr__(self):
+        return '[%s elements=%d names=%d]' % (self.__class__.__name__, len(self._eIds), len(self._names))
+
+    def __len__(self):
+        return len(self._eIds)
+
+    def clear(self):
+        u"""Remove all elements from the index."""
+        self._eIds = {} # eId --> element
+        self._pageIds = {} # eId --> eId of the page that contains the element, or None
+        self._names = {} # name --> {page eId or None: list of elements with that name}
+        self._sortedNames = None # Sorted list of names for prefix search. None if it needs to be rebuilt.
+        self._markerElements = {} # eId --> element with markers in its side-table
+        self._markers = None # markerId and (markerId, arg) --> list of markers. None if it needs to be rebuilt.
+
+    @classmethod
+    def getPageOf(cls, e):
+        u"""Answer the page that contains *e* (or *e* itself if it is a page). Answer None if *e*
+        is not placed on a page, such as a view."""
+        while e is not None and not getattr(e, 'isPage', False): # Document is not an element.
+            e = e.parent
+        return e
+
+    def appendTree(self, e):
+        u"""Add *e* and all its descendants to the index."""
+        page = self.getPageOf(e)
+        if page is not None:
+            pageId = page.eId
+        else:
+            pageId = None
+        stack = [(e, pageId)]
+        while stack:
+            e, pageId = stack.pop()
+            if e.isPage:
+                pageId = e.eId
+            self._eIds[e.eId] = e
+            self._pageIds[e.eId] = pageId
+            self._addName(e, e.name, pageId)
+            if getattr(e, '_markers', None):
+                self._markerElements[e.eId] = e
+                self._markers = None
+            for child in e.elements:
+                stack.append((child, pageId))
+
+    def removeTree(self, e):
+        u"""Remove *e* and all its descendants from the index, if they are there."""
+        stack = [e]
+        while stack:
+            e = stack.pop()
+            if self._eIds.get(e.eId) is e: # Only if e is indexed.
+                self._removeName(e, e.name, self._pageIds[e.eId])
+                del self._eIds[e.eId]
+                del self._pageIds[e.eId]
+                if self._markerElements.pop(e.eId, None) is not None:
+                    self._markers = None
+            stack += e.elements
+
+    def rename(self, e, oldName, newName):
+        u"""Move *e* from *oldName* to *newName* in the index, if *e* is indexed."""
+        if self._eIds.get(e.eId) is e:
+            pageId = self._pageIds[e.eId]
+            self._removeName(e, oldName, pageId)
+            self._addName(e, newName, pageId)
+
+    def _addName(self, e, name, pageId):
+        if name is None:
+            return
+        if not name in self._names:
+            self._names[name] = {}
+            self._sortedNames = None
+        scopes = self._names[name]
+        if not pageId in scopes:
+            scopes[pageId] = []
+        scopes[pageId].append(e)
+
+    def _removeName(self, e, name, pageId):
+        scopes = self._names.get(name)
+        if scopes is None or not pageId in scopes:
+            return
+        elements = scopes[pageId]
+        for index, element in enumerate(elements):
+            if element is e:
+                del elements[index]
+                break
+        if not elements:
+            del scopes[pageId]
+            if not scopes:
+                del self._names[name]
+                self._sortedNames = None
+
+    def updateMarkers(self, e):
+        u"""Update the index after the markers of text box *e* changed, if *e* is indexed."""
+        if self._eIds.get(e.eId) is e:
+            if e.markers:
+                self._markerElements[e.eId] = e
+            else:
+                self._markerElements.pop(e.eId, None)
+            self._markers = None
+
+    def findMarkers(self, markerId, arg=None):
+        u"""Answer the list of (page, e, index, arg) of the markers with *markerId* in the side-tables of
+        the text boxes, in document order. If *arg* is defined, then only answer the markers with that
+        argument. Page is None if the text box is not on a page."""
+        if self._markers is None:
+            markers = {}
+            for e in self.sortDocumentOrder(self._markerElements.values()):
+                page = self._eIds.get(self._pageIds[e.eId])
+                for index, eMarkerId, eArg in e.markers:
+                    marker = page, e, index, eArg
+                    markers.setdefault(eMarkerId, []).append(marker)
+                    markers.setdefault((eMarkerId, eArg), []).append(marker)
+            self._markers = markers
+        if arg is None:
+            return list(self._markers.get(markerId, []))
+        return list(self._markers.get((markerId, arg), []))
+
+    def getElementByEId(self, eId):
+        u"""Answer the element with *eId*. Answer None if it is not in the document."""
+        return self._eIds.get(eId)
+
+    def getNames(self, prefix=None, pattern=None):
+        u"""Answer the sorted list of indexed names, starting with *prefix* and containing *pattern*, if defined.
+        Prefix search is done by bisection of the sorted names."""
+        if self._sortedNames is None:
+            self._sortedNames = sorted(self._names.keys())
+        names = self._sortedNames
+        if prefix is not None:
+            index = bisect_left(names, prefix)
+            prefixNames = []
+            while index < len(names) and isinstance(names[index], basestring) and names[index].startswith(prefix):
+                prefixNames.append(names[index])
+                index += 1
+            names = prefixNames
+        if pattern is not None:
+            names = [name for name in names if isinstance(name, basestring) and pattern in name]
+        return list(names)
+
+    def findElements(self, name=None, pattern=None, prefix=None, page=None):
+        u"""Answer the list of elements with *name*, and the elements with a name that contains *pattern*
+        or starts with *prefix*. If *page* is defined, then only answer the elements on that page. The elements
+        are answered in document order."""
+        names = []
+        if pattern is not None or prefix is not None:
+            names = self.getNames(prefix, pattern)
+        if name is not None and not name in names:
+            names.append(name)
+        if page is not None:
+            pageId = page.eId
+        found = []
+        for name in names:
+            scopes = self._names.get(name)
+            if not scopes:
+                continue
+            if page is None:
+                for elements in scopes.values():
+                    found += elements
+            elif pageId in scopes:
+                found += scopes[pageId]
+        return self.sortDocumentOrder(found)
+
+    def sortDocumentOrder(self, elements):
+        u"""Answer the list of *elements* sorted in order of the document: by page number, then in
+        depth-first order of the element tree, as a recursive search would find them. The sibling
+        indices of the children of a parent and the path of every ancestor are made once per call,
+        so sorting does not search the sibling list at every level of every element."""
+        if len(elements) < 2:
+            return list(elements)
+        doc = self._doc()
+        siblingIndices = {} # id(parent) --> {id(child): index in parent.elements}
+        paths = {} # id(e) --> (page key, tuple of sibling indices from the page down to e)
+        def orderKey(e):
+            key = paths.get(id(e))
+            if key is not None:
+                return key
+            if e.isPage:
+                pageKey = None
+                if doc is not None:
+                    pageKey = doc.pageIndex.getKey(e)
+                key = (pageKey or NO_PAGE_ORDER, ())
+            else:
+                parent = e.parent
+                if parent is None or parent is doc: # Not on a page, e.g. a view.
+                    key = (NO_PAGE_ORDER, ())
+                else:
+                    indices = siblingIndices.get(id(parent))
+                    if indices is None:
+                        indices = dict([(id(child), index) for index, child in enumerate(parent.elements)])
+                        siblingIndices[id(parent)] = indices
+                    pageKey, path = orderKey(parent)
+                    key = (pageKey, path + (indices[id(e)],))
+            paths[id(e)] = key
+            return key
+        return sorted(elements, key=orderKey)
@@ -0,0 +1,333 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     hyphenation.py
+#
+#     Hyphenation with Liang's algorithm from TeX pattern files, independent
+#     of the hyphenation of the OS, used by the FontToolsLayout (see
+#     toolbox.textlayout) for the runs with hyphenation and a language.
+#     The patterns of a language are read from a file as in the hyph-utf8
+#     package (hyph-en-us.pat.txt or hyph-en-us.tex, with \patterns{...} and
+#     optional \hyphenation{...} exceptions) and compiled into a packed trie:
+#     the trie nodes are overlapped in the base/check arrays, so finding the
+#     child of a node is a single array lookup. The compiled trie and the
+#     exceptions are cached on disk by the md5 of the pattern file, so the file
+#     is only parsed once. Hyphenation points are memoized per word.
+#     Pattern files are not included. They are found by language in
+#     HYPHENATION_PATTERNS, or as hyph-<language>.pat.txt or .tex in the
+#     folder Resources/hyphenation of the pagebot root.
+#
+#     hyphenator = getHyphenator('en-us')
+#     hyphenator.hyphenate(u'hyphenation') --> [u'hy', u'phen', u'ation']
+#
+import os
+import re
+import errno
+import marshal
+import hashlib
+import tempfile
+from array import array
+from time import time
+
+VERSION = 2 # Increment if the structure of the cached tries changes.
+TRIE_CACHE_FOLDER = os.path.join(tempfile.gettempdir(), 'pagebot-hyphenation')
+
+HYPHENATION_PATTERNS = {} # Language --> path of the pattern file.
+HYPHENATORS = {} # Language --> Hyphenator or None if there are no patterns.
+
+FIND_WORDS = re.compile(r'[^\W\d_]+', re.UNICODE)
+
+def getPatternsFolder():
+    u"""Answer the default folder of the pattern files."""
+    from pagebot import getRootPath
+    return os.path.join(getRootPath(), 'Resources', 'hyphenation')
+
+def readPatterns(path):
+    u"""Answer (patterns, exceptions) from the TeX pattern file *path*. If the file has no \\patterns{}
+    block, then all words of the file are patterns. Lines are comments after %."""
+    f = open(path, 'rb')
+    source = f.read().decode('utf-8')
+    f.close()
+    source = u'\n'.join([line.split(u'%')[0] for line in source.splitlines()])
+    exceptions = []
+    match = re.search(r'\\hyphenation\s*\{([^}]*)\}', source)
+    if match is not None:
+        exceptions = match.group(1).split()
+    match = re.search(r'\\patterns\s*\{([^}]*)\}', source)
+    if match is not None:
+        source = match.group(1)
+    elif '\\' in source: # TeX file without patterns.
+        source = u''
+    return source.split(), exceptions
+
+class PackedTrie(object):
+    u"""Trie of the hyphenation patterns, packed in arrays. The child of *node* for the character with
+    code c is index base[node] + c, if check[that index] == node. Characters that are not in the patterns
+    have no code. values[node] is the index in self.points of the digits of the pattern that ends at node,
+    0 if no pattern ends there."""
+    def __init__(self, codes, base, check, values, points):
+        self.codes = codes # char --> code, starting at 1
+        self.base = base
+        self.check = check
+        self.values = values
+        self.points = points # List of digit tuples, self.points[0] is None.
+
+    def __repr__(self):
+        return '[%s nodes=%d size=%d]' % (self.__class__.__name__, len(self.base), len(self.check))
+
+    @classmethod
+    def fromPatterns(cls, patterns):
+        u"""Answer a new PackedTrie compiled from the list of Liang *patterns*, such as '.hy3p' or 'a1b'."""
+        # Plain trie of nested dictionaries: char --> [children, pointsIndex]
+        root = [{}, 0]
+        points = [None]
+        pointsIndices = {}
+        codes = {}
+        for pattern in patterns:
+            chars = []
+            digits = [0]
+            for c in pattern:
+                if c.isdigit():
+                    digits[-1] = int(c)
+                else:
+                    chars.append(c)
+                    digits.append(0)
+                    if not c in codes:
+                        codes[c] = len(codes) + 1
+            node = root
+            for c in chars:
+                node = node[0].setdefault(c, [{}, 0])
+            digits = tuple(digits)
+            if not digits in pointsIndices:
+                pointsIndices[digits] = len(points)
+                points.append(digits)
+            node[1] = pointsIndices[digits]
+        # Pack the nodes: the children of every node get the first free slots at base + code.
+        base = [0]
+        values = [root[1]]
+        check = [-1] # Slot 0 is the root.
+        free = 1 # All slots before this index are used.
+        queue = [(0, root)]
+        for nodeIndex, node in queue: # Breadth first, the queue grows while iterating.
+            children = sorted([(codes[c], child) for c, child in node[0].items()])
+            if not children:
+                continue
+            childCodes = [code for code, _ in children]
+            b = max(1, free - childCodes[0])
+            while True:
+                for code in childCodes:
+                    if b + code < len(check) and check[b + code] != -2:
+                        break
+                else:
+                    break
+                b += 1
+            base[nodeIndex] = b
+            for code, child in children:
+                slot = b + code
+                while len(check) <= slot:
+                    check.append(-2) # Free slot
+                    base.append(0)
+                    values.append(0)
+                check[slot] = nodeIndex
+                values[slot] = child[1]
+                queue.append((slot, child))
+            while free < len(check) and check[free] != -2:
+                free += 1
+        return cls(codes, array('l', base), array('l', check), array('l', values), points)
+
+    def getPoints(self, word):
+        u"""Answer the list of the maximum pattern digits between the characters of '.word.'."""
+        s = u'.' + word + u'.'
+        result = [0] * (len(s) + 1)
+        codes = self.codes
+        base = self.base
+        check = self.check
+        values = self.values
+        size = len(check)
+        for start in range(len(s)):
+            node = 0
+            for index in range(start, len(s)):
+                code = codes.get(s[index])
+                if code is None:
+                    break
+                slot = base[node] + code
+                if slot >= size or check[slot] != node:
+                    break
+                node = slot
+                value = values[node]
+                if value:
+                    for offset, digit in enumerate(self.points[value]):
+                        if digit > result[start + offset]:
+                            result[start + offset] = digit
+        return result
+
+    def dumps(self):
+        u"""Answer the trie as marshalled string."""
+        return marshal.dumps((VERSION, self.codes, self.base.tostring(), self.check.tostring(),
+            self.values.tostring(), self.points))
+
+    @classmethod
+    def loads(cls, data):
+        u"""Answer the trie from the marshalled string *data*. Answer None if the version is different."""
+        version, codes, base, check, values, points = marshal.loads(data)
+        if version != VERSION:
+            return None
+        return cls(codes, array('l', base), array('l', check), array('l', values), points)
+
+def getExceptionPositions(exceptionWords):
+    u"""Answer the dictionary of word --> tuple of hyphenation positions of the hyphenated *exceptionWords*,
+    e.g. u'ta-ble' --> {u'table': (2,)}."""
+    exceptions = {}
+    for exceptionWord in exceptionWords:
+        parts = exceptionWord.split(u'-')
+        positions = []
+        for part in parts[:-1]:
+            positions.append((positions[-1] if positions else 0) + len(part))
+        exceptions[u''.join(parts).lower()] = tuple(positions)
+    return exceptions
+
+class Hyphenator(object):
+    u"""Hyphenates words by the compiled *trie* and the dictionary of *exceptions* (word --> positions).
+    Words are not hyphenated in the first *leftMin* or last *rightMin* characters. The positions of
+    at most *maxWords* words are memoized."""
+    def __init__(self, trie, exceptions=None, leftMin=2, rightMin=3, maxWords=100000):
+        self.trie = trie
+        self.exceptions = exceptions or {}
+        self.leftMin = leftMin
+        self.rightMin = rightMin
+        self.maxWords = maxWords
+        self._words = {} # word --> tuple of positions
+        self.resetStats()
+
+    def __repr__(self):
+        return '[%s words=%d]' % (self.__class__.__name__, len(self._words))
+
+    @classmethod
+    def fromFile(cls, path, cacheFolder=None, **kwargs):
+        u"""Answer a new Hyphenator from the TeX pattern file *path*. The compiled trie and the exceptions
+        are cached in *cacheFolder* (default is TRIE_CACHE_FOLDER), by the md5 of the pattern file.
+        Processes that compile the same file at the same time write their own temporary file."""
+        f = open(path, 'rb')
+        digest = hashlib.md5(f.read()).hexdigest()
+        f.close()
+        cacheFolder = cacheFolder or TRIE_CACHE_FOLDER
+        cachePath = os.path.join(cacheFolder, '%s-%d.trie' % (digest, VERSION))
+        trie = None
+        if os.path.exists(cachePath):
+            f = open(cachePath, 'rb')
+            version, trieData, exceptions = marshal.loads(f.read())
+            f.close()
+            if version == VERSION:
+                trie = PackedTrie.loads(trieData)
+        if trie is None:
+            patterns, exceptionWords = readPatterns(path)
+            trie = PackedTrie.fromPatterns(patterns)
+            exceptions = getExceptionPositions(exceptionWords)
+            try:
+                os.makedirs(cacheFolder)
+            except OSError, e: # Folder exists, possibly made by another process.
+                if e.errno != errno.EEXIST:
+                    raise
+            fd, tmpPath = tempfile.mkstemp(suffix='.tmp', dir=cacheFolder)
+            f = os.fdopen(fd, 'wb')
+            f.write(marshal.dumps((VERSION, trie.dumps(), exceptions)))
+            f.close()
+            os.rename(tmpPath, cachePath) # Only complete files are in the cache.
+        return cls(trie, exceptions, **kwargs)
+
+    def resetStats(self):
+        u"""Reset the counters of the word memoization."""
+        self.stats = dict(hits=0, misses=0)
+
+    def getPositions(self, word):
+        u"""Answer the tuple of indices in *word* where it can be hyphenated."""
+        positions = self._words.get(word)
+        if positions is not None:
+            self.stats['hits'] += 1
+            return positions
+        self.stats['misses'] += 1
+        positions = self.findPositions(word)
+        if len(self._words) >= self.maxWords:
+            self._words = {}
+        self._words[word] = positions
+        return positions
+
+    def findPositions(self, word):
+        u"""Answer the tuple of hyphenation positions of *word* from the exceptions and the patterns,
+        without memoization. Odd pattern values are hyphenation points."""
+        lowerWord = word.lower()
+        positions = self.exceptions.get(lowerWord)
+        if positions is None:
+            positions = ()
+            if len(word) >= self.leftMin + self.rightMin:
+                points = self.trie.getPoints(lowerWord)
+                positions = tuple([index for index in range(self.leftMin, len(word) - self.rightMin + 1)
+                    if points[index + 1] % 2])
+        return positions
+
+    def hyphenate(self, word):
+        u"""Answer the list of parts of *word*, split at the hyphenation positions."""
+        parts = []
+        start = 0
+        for position in self.getPositions(word):
+            parts.append(word[start:position])
+            start = position
+        parts.append(word[start:])
+        return parts
+
+    def getTextPositions(self, text, start=0, end=None):
+        u"""Answer the list of the string indices in text[start:end] where words can be hyphenated."""
+        positions = []
+        for match in FIND_WORDS.finditer(text, start, len(text) if end is None else end):
+            wordStart = match.start()
+            for position in self.getPositions(match.group()):
+                positions.append(wordStart + position)
+        return positions
+
+def registerHyphenationPatterns(language, path):
+    u"""Use the TeX pattern file *path* for *language*."""
+    HYPHENATION_PATTERNS[language] = path
+    HYPHENATORS.pop(language, None)
+
+def getHyphenator(language):
+    u"""Answer the cached Hyphenator of *language*, such as 'en' or 'en-us'. Answer None if there is no
+    pattern file for the language."""
+    if language in HYPHENATORS:
+        return HYPHENATORS[language]
+    path = HYPHENATION_PATTERNS.get(language)
+    if path is None:
+        folder = getPatternsFolder()
+        for fileName in ('hyph-%s.pat.txt' % language, 'hyph-%s.tex' % language):
+            if os.path.exists(os.path.join(folder, fileName)):
+                path = os.path.join(folder, fileName)
+                break
+    hyphenator = None
+    if path is not None:
+        hyphenator = Hyphenator.fromFile(path)
+    HYPHENATORS[language] = hyphenator
+    return hyphenator
+
+def benchmarkHyphenation(hyphenator, text):
+    u"""Hyphenate all words in *text* by *hyphenator*, with the patterns only and with the memoization
+    of words, starting empty. Answer dict(words, uniqueWords, patterns, memoized) with the number of
+    words and the words per second."""
+    words = FIND_WORDS.findall(text)
+    startTime = time()
+    for word in words:
+        hyphenator.findPositions(word)
+    patterns = time() - startTime
+    hyphenator._words = {}
+    startTime = time()
+    for word in words:
+        hyphenator.getPositions(word)
+    memoized = time() - startTime
+    return dict(words=len(words), uniqueWords=len(set(words)), patterns=len(words) / max(patterns, 1e-9),
+        memoized=len(words) / max(memoized, 1e-9))
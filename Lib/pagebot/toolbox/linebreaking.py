@@ -0,0 +1,365 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     linebreaking.py
+#
+#     Line breakers of the FontToolsLayout (see toolbox.textlayout), working on the
+#     cached glyph advances of the text. GreedyBreaker fills every line as far as
+#     possible. TotalFitBreaker is the Knuth-Plass total-fit algorithm, which
+#     chooses the breaks of the whole paragraph with the least demerits, so the
+#     spacing of justified text is even over all lines.
+#     TotalFitBreaker keeps a table per paragraph (the box, glue and penalty
+#     items with their cumulative widths) and the breaks per line width. If the
+#     width of a text box changes, e.g. by the Fit2Width or Shrink2Block
+#     conditions, only the breaks are calculated again from the tables. If the
+#     text changes, only the changed paragraphs get new tables.
+#     Both breakers optionally break inside words at hyphenation points (see
+#     toolbox.hyphenation), passed as (positions, hyphenWidth).
+#
+#     layout = FontToolsLayout(lineBreaker=TotalFitBreaker())
+#     print benchmarkLineBreaking(runs, 300)
+#
+from __future__ import division
+from time import time
+
+WHITE_SPACE = set(u' \t')
+NEW_LINES = set(u'\n\u2029')
+BREAK_AFTER = set(u'-\u2010\u2013\u2014/') # Lines can be broken after these characters.
+
+INFINITY = 10000 # Penalty that forbids (positive) or forces (negative) a break.
+
+# Types of the paragraph items.
+BOX = 0
+GLUE = 1
+PENALTY = 2
+
+class GreedyBreaker(object):
+    u"""Breaks lines on the last white space or hyphen that fits the width, like CoreText does."""
+    totalFit = False # Line breaks only depend on the text before them.
+
+    def __repr__(self):
+        return '[%s]' % self.__class__.__name__
+
+    def breakParagraph(self, text, advances, start, end, getWidth, hyphenation=None):
+        u"""Answer the list of (lineStart, lineEnd) of the paragraph text[start:end], broken greedy on the
+        available width answered by getWidth(isFirstLine). White space at the end of a line may exceed
+        the width. Optional *hyphenation* is (positions, hyphenWidth), the string indices where words can
+        be hyphenated and the width of the hyphen at the end of a hyphenated line."""
+        if hyphenation is not None:
+            hyphenPositions, hyphenWidth = set(hyphenation[0]), hyphenation[1]
+        else:
+            hyphenPositions, hyphenWidth = (), 0
+        lines = []
+        lineStart = start
+        lastBreak = None # String index where the current line can be broken.
+        maxW = getWidth(True)
+        x = 0
+        for index in range(start, end):
+            c = text[index]
+            if c in WHITE_SPACE or c in NEW_LINES:
+                x += advances[index]
+                lastBreak = index + 1
+                continue
+            if index in hyphenPositions and x + hyphenWidth <= maxW:
+                lastBreak = index # Hyphenated line still fits.
+            if x + advances[index] > maxW and index > lineStart:
+                if lastBreak is not None and lastBreak > lineStart:
+                    breakIndex = lastBreak
+                else:
+                    breakIndex = index # No break opportunity, break inside the word.
+                lines.append((lineStart, breakIndex))
+                lineStart = breakIndex
+                lastBreak = None
+                maxW = getWidth(False)
+                x = sum(advances[lineStart:index])
+            x += advances[index]
+            if c in BREAK_AFTER:
+                lastBreak = index + 1
+        lines.append((lineStart, end))
+        return lines
+
+class ParagraphTable(object):
+    u"""Items of a paragraph for the total-fit breaker, with the cumulative width, stretch and shrink.
+    String indices are relative to the start of the paragraph. Optional *hyphenPositions* are the relative
+    string indices where words can be hyphenated, adding a penalty item with *hyphenWidth*. The breaks
+    are cached per (firstLineWidth, lineWidth)."""
+    def __init__(self, text, advances, stretch, shrink, hyphenPenalty, hyphenPositions=(), hyphenWidth=0):
+        spaces = WHITE_SPACE | NEW_LINES # New line at the end of the paragraph is white space too.
+        types = self.types = []
+        widths = []
+        stretches = []
+        shrinks = []
+        self.penalties = []
+        self.penaltyWidths = [] # Width added to the line if broken at the penalty item.
+        self.breakIndices = [] # String index where the line ends if broken at the item.
+        self.nextIndices = [] # String index where the next line starts if broken at the item.
+        length = len(text)
+        hyphenPositions = set(hyphenPositions)
+        index = 0
+        while index < length:
+            c = text[index]
+            if c in spaces:
+                w = 0
+                nextIndex = index
+                while nextIndex < length and text[nextIndex] in spaces:
+                    w += advances[nextIndex]
+                    nextIndex += 1
+                self._add(GLUE, w, w * stretch, w * shrink, 0, nextIndex, nextIndex, widths, stretches, shrinks)
+                index = nextIndex
+                continue
+            w = 0 # Box of the characters up to the next white space or hyphen.
+            while index < length and not text[index] in spaces:
+                w += advances[index]
+                index += 1
+                if text[index-1] in BREAK_AFTER and index < length and not text[index] in spaces:
+                    break
+                if index in hyphenPositions: # Box of the syllable, followed by the hyphenation penalty.
+                    self._add(BOX, w, 0, 0, 0, index, index, widths, stretches, shrinks)
+                    self._add(PENALTY, hyphenWidth, 0, 0, hyphenPenalty, index, index, widths, stretches,
+                        shrinks)
+                    w = 0
+            self._add(BOX, w, 0, 0, 0, index, index, widths, stretches, shrinks)
+            if index < length and not text[index] in spaces: # Break after a hyphen.
+                self._add(PENALTY, 0, 0, 0, hyphenPenalty, index, index, widths, stretches, shrinks)
+        # Finishing glue and forced break of the paragraph end.
+        self._add(GLUE, 0, INFINITY * INFINITY, 0, 0, length, length, widths, stretches, shrinks)
+        self._add(PENALTY, 0, 0, 0, -INFINITY, length, length, widths, stretches, shrinks)
+        # Cumulative sums, self.totalWidths[i] is the sum of the items before item i.
+        self.totalWidths = totalWidths = [0]
+        self.totalStretches = totalStretches = [0]
+        self.totalShrinks = totalShrinks = [0]
+        for itemType, w, y, z in zip(types, widths, stretches, shrinks):
+            if itemType == PENALTY:
+                w = 0 # Width of a penalty only counts if the line is broken there.
+            totalWidths.append(totalWidths[-1] + w)
+            totalStretches.append(totalStretches[-1] + y)
+            totalShrinks.append(totalShrinks[-1] + z)
+        self.breaks = {} # (firstLineWidth, lineWidth) --> list of relative (lineStart, lineEnd)
+
+    def __repr__(self):
+        return '[%s items=%d breaks=%d]' % (self.__class__.__name__, len(self.types), len(self.breaks))
+
+    def _add(self, itemType, w, stretch, shrink, penalty, breakIndex, nextIndex, widths, stretches, shrinks):
+        self.types.append(itemType)
+        widths.append(w)
+        stretches.append(stretch)
+        shrinks.append(shrink)
+        self.penalties.append(penalty)
+        self.penaltyWidths.append(w if itemType == PENALTY else 0)
+        self.breakIndices.append(breakIndex)
+        self.nextIndices.append(nextIndex)
+
+class BreakNode(object):
+    u"""Feasible break at *position* (item index) of the total-fit breaker."""
+    def __init__(self, position, line, fitness, totalWidth, totalStretch, totalShrink, demerits, previous):
+        self.position = position
+        self.line = line # Number of lines before this break.
+        self.fitness = fitness
+        self.totalWidth = totalWidth # Cumulative sums after the break.
+        self.totalStretch = totalStretch
+        self.totalShrink = totalShrink
+        self.demerits = demerits
+        self.previous = previous
+
+class TotalFitBreaker(object):
+    u"""Knuth-Plass line breaker that minimizes the total demerits of the lines of a paragraph.
+    Glue (white space) can stretch by *stretch* and shrink by *shrink* times its width. Breaks after
+    hyphens cost *hyphenPenalty*. Lines with an adjustment ratio above *tolerance* are not feasible.
+    If a paragraph has no feasible breaks, then it is tried again with *emergencyTolerance*, and
+    then broken greedy. The tables and breaks of at most
+    *maxParagraphs* paragraphs are cached."""
+    LINE_PENALTY = 10
+    FLAGGED_DEMERITS = 3000 # Demerits for consecutive lines that end with a hyphen.
+    FITNESS_DEMERITS = 100 # Demerits for consecutive lines of very different tightness.
+    totalFit = True # Line breaks depend on the complete paragraph.
+
+    def __init__(self, stretch=0.5, shrink=0.33, hyphenPenalty=50, tolerance=3, emergencyTolerance=20,
+            maxParagraphs=4096):
+        self.stretch = stretch
+        self.shrink = shrink
+        self.hyphenPenalty = hyphenPenalty
+        self.tolerance = tolerance
+        self.emergencyTolerance = emergencyTolerance
+        self.maxParagraphs = maxParagraphs
+        self.greedyBreaker = GreedyBreaker()
+        self._tables = {} # (paragraph text, advances, hyphenation) --> ParagraphTable
+        self.resetStats()
+
+    def __repr__(self):
+        return '[%s paragraphs=%d]' % (self.__class__.__name__, len(self._tables))
+
+    def resetStats(self):
+        u"""Reset the counters of the cached tables and breaks."""
+        self.stats = dict(tableHits=0, tableMisses=0, breakHits=0, breakMisses=0, greedy=0)
+
+    def clear(self):
+        u"""Remove all cached paragraph tables."""
+        self._tables = {}
+
+    def getTable(self, text, advances, start, end, hyphenation=None):
+        u"""Answer the cached ParagraphTable of text[start:end], with the optional *hyphenation*
+        (positions, hyphenWidth)."""
+        paragraphAdvances = tuple(advances[start:end])
+        hyphenPositions = ()
+        hyphenWidth = 0
+        if hyphenation is not None:
+            hyphenPositions = tuple([position - start for position in hyphenation[0]])
+            hyphenWidth = hyphenation[1]
+        key = text[start:end], paragraphAdvances, hyphenPositions, hyphenWidth
+        table = self._tables.get(key)
+        if table is None:
+            self.stats['tableMisses'] += 1
+            if len(self._tables) >= self.maxParagraphs:
+                self._tables = {}
+            table = self._tables[key] = ParagraphTable(text[start:end], paragraphAdvances, self.stretch,
+                self.shrink, self.hyphenPenalty, hyphenPositions, hyphenWidth)
+        else:
+            self.stats['tableHits'] += 1
+        return table
+
+    def breakParagraph(self, text, advances, start, end, getWidth, hyphenation=None):
+        u"""Answer the list of (lineStart, lineEnd) of the paragraph text[start:end], with the line widths
+        answered by getWidth(isFirstLine). Optional *hyphenation* is (positions, hyphenWidth), the
+        string indices where words can be hyphenated and the width of the hyphen."""
+        table = self.getTable(text, advances, start, end, hyphenation)
+        widths = getWidth(True), getWidth(False)
+        breaks = table.breaks.get(widths)
+        if breaks is None:
+            self.stats['breakMisses'] += 1
+            breaks = self.findBreaks(table, widths, self.tolerance)
+            if breaks is None:
+                breaks = self.findBreaks(table, widths, self.emergencyTolerance)
+            if breaks is None: # No feasible solution, e.g. words longer than the line.
+                self.stats['greedy'] += 1
+                breaks = [(lineStart - start, lineEnd - start) for lineStart, lineEnd in
+                    self.greedyBreaker.breakParagraph(text, advances, start, end, getWidth, hyphenation)]
+            table.breaks[widths] = breaks
+        else:
+            self.stats['breakHits'] += 1
+        return [(start + lineStart, start + lineEnd) for lineStart, lineEnd in breaks]
+
+    def findBreaks(self, table, widths, tolerance):
+        u"""Answer the list of relative (lineStart, lineEnd) with the least total demerits for the
+        (firstLineWidth, lineWidth) *widths*, with lines of at most *tolerance* adjustment ratio.
+        Answer None if there is no feasible solution."""
+        types = table.types
+        penalties = table.penalties
+        penaltyWidths = table.penaltyWidths
+        totalWidths = table.totalWidths
+        totalStretches = table.totalStretches
+        totalShrinks = table.totalShrinks
+        active = [BreakNode(-1, 0, 1, 0, 0, 0, 0, None)]
+        for position, itemType in enumerate(types):
+            if itemType == BOX:
+                continue
+            penalty = penalties[position]
+            if itemType == PENALTY and penalty >= INFINITY:
+                continue
+            if itemType == GLUE and types[position-1] != BOX: # Glue is only a break after a box.
+                continue
+            isFlagged = itemType == PENALTY and 0 < penalty < INFINITY
+            candidates = {} # fitness --> (demerits, node)
+            remaining = []
+            for node in active:
+                lineWidth = widths[0] if node.line == 0 else widths[1]
+                w = totalWidths[position] - node.totalWidth + penaltyWidths[position]
+                if w < lineWidth:
+                    stretch = totalStretches[position] - node.totalStretch
+                    ratio = (lineWidth - w) / stretch if stretch > 0 else INFINITY
+                elif w > lineWidth:
+                    shrink = totalShrinks[position] - node.totalShrink
+                    ratio = (lineWidth - w) / shrink if shrink > 0 else -INFINITY
+                else:
+                    ratio = 0
+                if ratio >= -1 and penalty > -INFINITY:
+                    remaining.append(node) # Node can still start a line that ends at a later break.
+                if -1 <= ratio <= tolerance:
+                    badness = 100 * abs(ratio) ** 3
+                    if penalty >= 0:
+                        demerits = (self.LINE_PENALTY + badness) ** 2 + penalty ** 2
+                    elif penalty > -INFINITY:
+                        demerits = (self.LINE_PENALTY + badness) ** 2 - penalty ** 2
+                    else:
+                        demerits = (self.LINE_PENALTY + badness) ** 2
+                    if isFlagged and node.position >= 0 and types[node.position] == PENALTY and \
+                            0 < penalties[node.position] < INFINITY:
+                        demerits += self.FLAGGED_DEMERITS
+                    if ratio < -0.5:
+                        fitness = 0 # Tight
+                    elif ratio <= 0.5:
+                        fitness = 1 # Normal
+                    elif ratio <= 1:
+                        fitness = 2 # Loose
+                    else:
+                        fitness = 3 # Very loose
+                    if abs(fitness - node.fitness) > 1:
+                        demerits += self.FITNESS_DEMERITS
+                    demerits += node.demerits
+                    best = candidates.get(fitness)
+                    if best is None or demerits < best[0]:
+                        candidates[fitness] = demerits, node
+            active = remaining
+            if candidates:
+                # Cumulative sums after the break skip the glue of the break.
+                afterPosition = position + 1 if itemType == GLUE else position
+                for fitness, (demerits, node) in sorted(candidates.items()):
+                    active.append(BreakNode(position, node.line + 1, fitness, totalWidths[afterPosition],
+                        totalStretches[afterPosition], totalShrinks[afterPosition], demerits, node))
+            if not active:
+                return None
+        best = None
+        for node in active:
+            if node.position == len(types) - 1 and (best is None or node.demerits < best.demerits):
+                best = node
+        if best is None:
+            return None
+        breaks = []
+        while best.previous is not None:
+            previous = best.previous
+            lineStart = 0 if previous.position < 0 else table.nextIndices[previous.position]
+            breaks.append((lineStart, table.breakIndices[best.position]))
+            best = previous
+        breaks.reverse()
+        return breaks
+
+def _getRaggedness(frame, w):
+    u"""Answer the sum of the squared space at the end of the lines of *frame* before justification,
+    except the last lines of the paragraphs."""
+    raggedness = 0
+    for line in frame.lines[:-1]:
+        if line.string and not line.string[-1] in NEW_LINES:
+            raggedness += (w - line.x - line.naturalWidth) ** 2
+    return raggedness
+
+def benchmarkLineBreaking(fs, w, count=5, widthChange=0.9):
+    u"""Compare greedy and total-fit line breaking of *fs* (see FontToolsLayout) in width *w*. For every
+    breaker, answer the time of the first layout, the average time of *count* layouts with cached
+    tables, the time of a layout after changing the width by factor *widthChange*, the number of lines
+    and the raggedness (sum of the squared space at the end of the lines before justification, lower
+    is more even)."""
+    from pagebot.toolbox.textlayout import FontToolsLayout
+
+    results = {}
+    for name, lineBreaker in (('greedy', GreedyBreaker()), ('totalFit', TotalFitBreaker())):
+        layout = FontToolsLayout(lineBreaker=lineBreaker)
+        startTime = time()
+        frame = layout.layout(fs, w)
+        first = time() - startTime
+        startTime = time()
+        for _ in range(count):
+            layout.layout(fs, w)
+        average = (time() - startTime) / max(1, count)
+        startTime = time()
+        layout.layout(fs, w * widthChange)
+        widthChanged = time() - startTime
+        results[name] = dict(first=first, average=average, widthChanged=widthChanged,
+            lines=len(frame.lines), raggedness=_getRaggedness(frame, w))
+    return results
@@ -0,0 +1,194 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     pagehash.py
+#
+#     Content hashes of pages, used by View.exportIncremental to decide which
+#     pages can reuse their previously rendered output. The hash of a page
+#     covers everything that changes its drawing: the plain data of the page
+#     and its elements (template name, geometry, styles, conditions, flow
+#     links, text runs, see toolbox.snapshot), the root and named styles of
+#     the document, the view settings, and the contents of the image files
+#     and font files that are used. Pages that are connected by flows (see
+#     toolbox.parallelsolve.getPageGroups) include the hashes of the whole
+#     group, so a change on one of them invalidates all of them.
+#     The eIds of elements are different for every build, so flow links that
+#     refer to an eId are hashed as the location of the element in the
+#     document. The page number and, if the view shows it, the page name info
+#     (with the date, see View.getPageNameInfo) are part of the page hash.
+#     Values that are not plain data, such as drawing hooks or attributes of
+#     formatted strings that the snapshot does not keep, are hashed by their
+#     names and reprs. Reprs with a memory address, e.g. of functions, are
+#     different for every build, so these pages are always rebuilt.
+#
+import os
+import hashlib
+
+from pagebot.toolbox.snapshot import element2Snapshot
+from pagebot.toolbox.parallelsolve import getPageGroups
+
+# Attributes that are different for every build of the same content.
+VOLATILE_ATTRIBUTES = set(('_eId', '_geometryTime', '_isDrawn'))
+# Attributes that refer to another element by name or by eId.
+REFERENCE_ATTRIBUTES = ('nextElement', 'prevElement')
+
+def stableRepr(value):
+    u"""Answer the string representation of the plain data *value*, where dictionaries are sorted by key,
+    so equal data always answers the same string."""
+    if isinstance(value, dict):
+        return '{%s}' % ', '.join(['%s: %s' % (stableRepr(name), stableRepr(v)) for name, v in sorted(value.items())])
+    if isinstance(value, (list, tuple)):
+        return '[%s]' % ', '.join([stableRepr(v) for v in value])
+    return repr(value)
+
+class FileHashes(object):
+    u"""Cache of the md5 hashes of file contents, by path. A file is hashed again if its size or
+    modification time changed."""
+    def __init__(self):
+        self._hashes = {} # path --> (size, mtime, hexdigest)
+
+    def __repr__(self):
+        return '[%s files=%d]' % (self.__class__.__name__, len(self._hashes))
+
+    def getHash(self, path):
+        u"""Answer the hex md5 of the content of the file *path*. Answer None if the file does not exist."""
+        if path is None or not os.path.isfile(path):
+            return None
+        stat = os.stat(path)
+        cached = self._hashes.get(path)
+        if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime):
+            return cached[2]
+        md5 = hashlib.md5()
+        f = open(path, 'rb')
+        while True:
+            block = f.read(1 << 16)
+            if not block:
+                break
+            md5.update(block)
+        f.close()
+        digest = md5.hexdigest()
+        self._hashes[path] = stat.st_size, stat.st_mtime, digest
+        return digest
+
+fileHashes = FileHashes()
+
+def getFontPath(fontName):
+    u"""Answer the file path of *fontName*, which is a path or the name of an installed font.
+    Answer None if the font cannot be found."""
+    if os.path.isfile(fontName):
+        return fontName
+    from pagebot.fonttoolbox.objects.font import getFontPathOfFont # Needs AppKit and CoreText.
+    return getFontPathOfFont(fontName)
+
+class PageHasher(object):
+    u"""Answers the content hashes of the pages of a document, drawn by *view* on a canvas of (w, h).
+    Font paths and file hashes are cached for all pages."""
+    def __init__(self, view, w, h):
+        self.view = view
+        self.doc = view.parent
+        self._fontPaths = {} # Font name --> path or None
+        self.documentHash = hashlib.md5(stableRepr((
+            w, h,
+            sorted(self.doc.rootStyle.items()),
+            sorted([(name, dict(style.items())) for name, style in self.doc.styles.items() if name != 'root']),
+            self._getData(view),
+        ))).hexdigest()
+
+    def _getData(self, e):
+        u"""Answer the plain data of *e* and its child elements without the volatile attributes, and
+        with the hashes of the files it uses and the reprs of the values that are not plain data."""
+        lost = []
+        data = element2Snapshot(e, lost)
+        self._clean(data)
+        elements = {}
+        self._indexElements(e, elements)
+        data['lostValues'] = [(name, self._getLostRepr(elements[eId], name)) for eId, name in lost]
+        return data
+
+    def _indexElements(self, e, elements):
+        elements[e.eId] = e
+        for child in e.elements:
+            self._indexElements(child, elements)
+
+    def _getLostRepr(self, e, name):
+        u"""Answer the repr of the value *name* of element *e* that the snapshot could not keep."""
+        if name.startswith('fs.'): # Attribute of the formatted string.
+            fs = e.fs
+            if hasattr(fs, 'getNSObject'):
+                fs = fs.getNSObject()
+            return repr(fs)
+        if name in e.__dict__:
+            return stableRepr(e.__dict__[name])
+        if name in e.style:
+            return stableRepr(e.style[name])
+        return stableRepr([condition.__dict__ for condition in e.conditions or []]) # Condition attribute.
+
+    def _clean(self, data):
+        attributes = data['attributes']
+        for name in VOLATILE_ATTRIBUTES:
+            attributes.pop(name, None)
+        for name in REFERENCE_ATTRIBUTES:
+            value = attributes.get(name)
+            if isinstance(value, basestring):
+                e = self.doc.getElementByEId(value)
+                if e is not None: # Reference by eId, hashed as the location of the element.
+                    attributes[name] = ('eId', self.getElementLocation(e))
+        fileNames = []
+        path = attributes.get('path') # Image files, e.g. PixelMap.path
+        if isinstance(path, basestring):
+            fileNames.append(path)
+        fontNames = set()
+        if isinstance(data['style'].get('font'), basestring):
+            fontNames.add(data['style']['font'])
+        for text, run in data['runs'] or []:
+            if isinstance(run.get('font'), basestring):
+                fontNames.add(run['font'])
+        for fontName in sorted(fontNames):
+            if not fontName in self._fontPaths:
+                self._fontPaths[fontName] = getFontPath(fontName)
+            fileNames.append(self._fontPaths[fontName])
+        data['fileHashes'] = [fileHashes.getHash(fileName) for fileName in fileNames]
+        for child in data['elements']:
+            self._clean(child)
+
+    def getElementLocation(self, e):
+        u"""Answer the (page key, child indices) of element *e* in the document, which is the same for
+        every build of the same content."""
+        path = []
+        while e.parent is not None and not e.isPage:
+            path.insert(0, e.parent.elements.index(e))
+            e = e.parent
+        return self.doc.pageIndex.getKey(e), tuple(path)
+
+    def getPageHash(self, page):
+        u"""Answer the hex md5 content hash of *page* by itself, including the document hash."""
+        data = self._getData(page)
+        template = page.template
+        if template is not None:
+            data['template'] = template.name or template.__class__.__name__
+        data['pageNumber'] = self.doc.getPageNumber(page)
+        if self.view.showPageNameInfo: # Drawn by the view, including the date.
+            data['pageNameInfo'] = self.view.getPageNameInfo(page)
+        return hashlib.md5(self.documentHash + stableRepr(data)).hexdigest()
+
+    def getPageHashes(self, pages):
+        u"""Answer the dictionary of page --> hex md5 hash for *pages*. The hash of pages in a flow group
+        includes the hashes of all pages in the group that are in *pages*."""
+        hashes = dict([(page, self.getPageHash(page)) for page in pages])
+        for pageKeys, isFlow in getPageGroups(self.doc):
+            if not isFlow:
+                continue
+            groupPages = [self.doc.pages[pn][index] for pn, index in pageKeys]
+            groupPages = [page for page in groupPages if page in hashes]
+            groupHash = hashlib.md5(''.join([hashes[page] for page in groupPages])).hexdigest()
+            for page in groupPages:
+                hashes[page] = hashlib.md5(groupHash + hashes[page]).hexdigest()
+        return hashes
@@ -0,0 +1,176 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     pageindex.py
+#
+#     Ordered sequence of the pages in a document, kept next to the
+#     Document.pages dictionary of page number rows, so navigation and page
+#     number queries don't need to sort and scan all pages.
+#
+from bisect import insort
+
+class PageIndex(object):
+    u"""Pages of a document in order of (pn, index), with the reverse map of page to position and
+    (pn, index), and the pages by name. Pages appended after the last page are added in constant time.
+    Pages inserted before the last page mark the sequence to be rebuilt on the next query.
+    self.rows is the dictionary of page number --> list of pages, used by the Document as Document.pages."""
+    def __init__(self):
+        self.rows = {} # pn --> list of pages
+        self.clear()
+
+    def __repr__(self):
+        return '[%s pages=%d rows=%d]' % (self.__class__.__name__, len(self._keys), len(self.rows))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        return iter(self.getPages())
+
+    def __contains__(self, page):
+        return page in self._keys
+
+    def clear(self):
+        u"""Remove all pages from the index."""
+        self.rows.clear() # Keep the dictionary, as it is shared with the Document.
+        self._pns = [] # Sorted list of page numbers.
+        self._keys = {} # Page --> (pn, index)
+        self._names = {} # Name --> list of pages with that name.
+        self._pages = [] # Flat list of pages in order of (pn, index)
+        self._positions = {} # Page --> position in self._pages
+        self._dirty = False # Set to True if self._pages and self._positions need to be rebuilt.
+
+    def appendPage(self, pn, page):
+        u"""Add *page* at the end of the row of page number *pn*."""
+        if pn in self.rows:
+            row = self.rows[pn]
+        else:
+            row = self.rows[pn] = []
+            insort(self._pns, pn)
+        row.append(page)
+        self._keys[page] = (pn, len(row) - 1)
+        if page.name is not None:
+            self._names.setdefault(page.name, []).append(page)
+        if not self._dirty and pn == self._pns[-1]: # After the last page, sequence stays valid.
+            self._positions[page] = len(self._pages)
+            self._pages.append(page)
+        else:
+            self._dirty = True
+
+    def removePage(self, page):
+        u"""Remove *page* from its row. The following pages in the row move to the previous index.
+        An empty row is removed from self.rows. Answer the (pn, index) that the page had, or None
+        if the page is not indexed."""
+        key = self._keys.pop(page, None)
+        if key is None:
+            return None
+        pn, index = key
+        row = self.rows[pn]
+        del row[index]
+        for nextIndex in range(index, len(row)):
+            self._keys[row[nextIndex]] = (pn, nextIndex)
+        if not row:
+            del self.rows[pn]
+            self._pns.remove(pn)
+        pages = self._names.get(page.name)
+        if pages is not None and page in pages:
+            pages.remove(page)
+            if not pages:
+                del self._names[page.name]
+        if not self._dirty and self._pages and self._pages[-1] is page: # Last page, sequence stays valid.
+            self._pages.pop()
+            del self._positions[page]
+        else:
+            self._dirty = True
+        return key
+
+    def rename(self, page, oldName, newName):
+        u"""Move *page* from *oldName* to *newName* in the index of names, if the page is indexed."""
+        if not page in self._keys:
+            return
+        pages = self._names.get(oldName)
+        if pages is not None and page in pages:
+            pages.remove(page)
+            if not pages:
+                del self._names[oldName]
+        if newName is not None:
+            self._names.setdefault(newName, []).append(page)
+
+    def _update(self):
+        if self._dirty:
+            self._pages = []
+            self._positions = {}
+            for pn in self._pns:
+                for page in self.rows[pn]:
+                    self._positions[page] = len(self._pages)
+                    self._pages.append(page)
+            self._dirty = False
+
+    def getPages(self):
+        u"""Answer the list of all pages in order of (pn, index)."""
+        self._update()
+        return self._pages
+
+    def getPageNumbers(self):
+        u"""Answer the sorted list of page numbers."""
+        return self._pns
+
+    def getMaxPageNumber(self):
+        u"""Answer the highest page number. Answer None if there are no pages."""
+        if self._pns:
+            return self._pns[-1]
+        return None
+
+    def getKey(self, page):
+        u"""Answer the (pn, index) of *page*. Answer None if the page is not indexed."""
+        return self._keys.get(page)
+
+    def getPosition(self, page):
+        u"""Answer the position of *page* in the sequence of all pages. Answer None if the page is not indexed."""
+        self._update()
+        return self._positions.get(page)
+
+    def getPageAt(self, position):
+        u"""Answer the page at *position* in the sequence of pages. Answer None if out of range."""
+        self._update()
+        if 0 <= position < len(self._pages):
+            return self._pages[position]
+        return None
+
+    def getNextPage(self, page, step=1):
+        u"""Answer the page that is *step* pages after *page* in the sequence. A negative *step* answers
+        previous pages. Answer None if the page is not indexed or the position is out of range."""
+        position = self.getPosition(page)
+        if position is None:
+            return None
+        return self.getPageAt(position + step)
+
+    def getFirstPage(self):
+        u"""Answer the first page. Answer None if there are no pages."""
+        return self.getPageAt(0)
+
+    def getLastPage(self):
+        u"""Answer the last page. Answer None if there are no pages."""
+        return self.getPageAt(len(self._keys) - 1)
+
+    def getPagesByName(self, name):
+        u"""Answer the list of pages with *name* in order of the sequence."""
+        pages = self._names.get(name, [])
+        if len(pages) > 1:
+            self._update()
+            pages = sorted(pages, key=self._positions.get)
+        return list(pages)
+
+    def getPageNumbersFrom(self, pns):
+        u"""Answer the sorted list of page numbers that exist in the index and in *pns*."""
+        if pns is None:
+            return list(self._pns)
+        return [pn for pn in self._pns if pn in pns]
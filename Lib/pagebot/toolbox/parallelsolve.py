@@ -0,0 +1,138 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     parallelsolve.py
+#
+#     Solving the pages of a Document in worker processes, used by
+#     Document.solve(workers=n). Pages are partitioned into groups that are
+#     connected by flows (nextPage/prevPage of their elements). Every group
+#     without flow elements is solved by a worker process (see toolbox.workers)
+#     on its copy of the document, which answers the changed geometry values
+#     and the score per page. Groups with flows change the formatted strings of
+#     their elements, which cannot be sent back, so they are solved in the main
+#     process. The workers solve a copy that is restored from a snapshot (see
+#     toolbox.snapshot), which does not keep values that are not plain data,
+#     such as drawing hooks, or text attributes that are not kept by fs2Runs.
+#     Groups with pages that have such lost values are solved in the main
+#     process too, so the result is always the same as Document.solve().
+#
+from pagebot.conditions.score import Score
+from pagebot.style import GEOMETRY_KEYS
+from pagebot.toolbox.workers import runWorkers
+from pagebot.toolbox.snapshot import document2Snapshot, getLostPages
+
+def _getElements(e):
+    u"""Answer the list of all descendants of *e* in document order."""
+    elements = []
+    for child in e.elements:
+        elements.append(child)
+        elements += _getElements(child)
+    return elements
+
+def getPageGroups(doc):
+    u"""Answer the list of (pageKeys, isFlow) groups of the pages in *doc*, where pageKeys is the sorted
+    list of (pn, index) of pages that are connected by the nextPage/prevPage of their elements. The flag
+    isFlow is True if elements in the group refer to next or previous flow elements. The groups are
+    answered in the order of their first page."""
+    keys = {} # Page --> (pn, index)
+    for pn, pnPages in sorted(doc.pages.items()):
+        for index, page in enumerate(pnPages):
+            keys[page] = (pn, index)
+    groups = dict([(key, key) for key in keys.values()]) # Union-find of (pn, index) --> representing (pn, index)
+
+    def find(key):
+        while groups[key] != key:
+            groups[key] = groups[groups[key]]
+            key = groups[key]
+        return key
+
+    flows = set() # Representing keys of pages that have flow elements.
+    for page, key in sorted(keys.items(), key=lambda item: item[1]):
+        for e in _getElements(page):
+            if e.nextElement is None and e.prevElement is None:
+                continue
+            flows.add(key)
+            for pageName in (e.nextPage, e.prevPage):
+                if pageName is None:
+                    continue
+                linkedPage = doc.getPage(pageName)
+                if linkedPage in keys:
+                    root, linkedRoot = find(key), find(keys[linkedPage])
+                    if root != linkedRoot:
+                        groups[max(root, linkedRoot)] = min(root, linkedRoot)
+    flows = set([find(key) for key in flows])
+
+    pageGroups = {} # Representing (pn, index) --> list of (pn, index) of the group.
+    for key in sorted(keys.values()):
+        pageGroups.setdefault(find(key), []).append(key)
+    return [(pageKeys, root in flows) for root, pageKeys in sorted(pageGroups.items())]
+
+def _solvePageGroup(doc, pageKeys):
+    u"""Solve the pages of *pageKeys* in the copy *doc* of a worker process. Answer the list of (result, fails)
+    per page, where fails is a list of (condition, eId), and the list of (eId, changes) of elements that
+    changed, where changes is a dictionary with the new geometry values of the element style."""
+    pages = [doc.pages[pn][index] for pn, index in pageKeys]
+    elements = []
+    for page in pages:
+        elements.append(page)
+        elements += _getElements(page)
+    snapshots = [[e.style.get(name) for name in GEOMETRY_KEYS] for e in elements]
+    pageScores = []
+    for page in pages:
+        score = page.solve(Score())
+        pageScores.append((score.result, [(condition, e.eId) for condition, e in score.fails]))
+    changes = []
+    for e, snapshot in zip(elements, snapshots):
+        changed = {}
+        for name, value in zip(GEOMETRY_KEYS, snapshot):
+            newValue = e.style.get(name)
+            if newValue != value:
+                changed[name] = newValue
+        if changed:
+            changes.append((e.eId, changed))
+    return pageScores, changes
+
+def solveParallel(doc, workers):
+    u"""Solve all pages of *doc* with a pool of *workers* processes and answer the total Score.
+    The geometry changes of the workers are copied into the elements of *doc*. The page scores
+    are added in the order of the pages, so the fails are the same as doc.solve() without workers."""
+    snapshot = document2Snapshot(doc)
+    lostPages = getLostPages(doc, snapshot['lost'])
+    serialGroups = []
+    workerGroups = []
+    for pageKeys, isFlow in getPageGroups(doc):
+        if isFlow or [key for key in pageKeys if doc.pages[key[0]][key[1]] in lostPages]:
+            serialGroups.append(pageKeys)
+        else:
+            workerGroups.append(pageKeys)
+
+    pageScores = {} # (pn, index) --> (result, fails)
+    if workerGroups:
+        results = runWorkers(_solvePageGroup, workerGroups, workers, doc, snapshot)
+        for pageKeys, (groupScores, changes) in zip(workerGroups, results):
+            for eId, changed in changes:
+                e = doc.getElementByEId(eId)
+                for name, value in sorted(changed.items()):
+                    e.style[name] = value # Reports the change to the caches of e.
+            for key, (result, fails) in zip(pageKeys, groupScores):
+                pageScores[key] = result, [(condition, doc.getElementByEId(eId)) for condition, eId in fails]
+
+    # Flows change other pages in the group, solve them here in page order, same as groups with lost values.
+    for pageKeys in serialGroups:
+        for pn, index in pageKeys:
+            score = doc.pages[pn][index].solve(Score())
+            pageScores[(pn, index)] = score.result, score.fails
+
+    score = Score()
+    for key, (result, fails) in sorted(pageScores.items()):
+        score.result += result
+        score.fails += fails
+    return score
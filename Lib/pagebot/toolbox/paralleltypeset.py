@@ -0,0 +1,211 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     paralleltypeset.py
+#
+#     Typesetting the chapter files of a book in worker processes, used by
+#     Typesetter.typesetChapters. Every chapter is typeset by a worker (see
+#     toolbox.workers) into its own Galley, with footnotes and literature
+#     references numbered from 1. Galleys and formatted strings cannot be
+#     pickled, so the worker answers the galley as snapshot data (see
+#     toolbox.snapshot) and the references with their etree nodes as XML
+#     strings. The main process renumbers the footnote and literature markers
+#     in the marker side-tables of the text boxes, the footnote reference
+#     numbers and the entries in doc.lib, so they continue over the chapters,
+#     and appends the chapters in order to the galley of the typesetter.
+#
+#     The snapshot of a FormattedString keeps the font, size, color, alignment,
+#     leading, tracking, baseline shift, indents, paragraph spacing and
+#     language of the text. If a galley of a worker has other attributes, such
+#     as OpenType features, tabs, underline or stroke, or other values that
+#     cannot be stored, then the chapters are typeset again serially in the
+#     main process, so the result never differs from Typesetter.typesetFile.
+#
+import os
+import re
+from time import time
+
+import xml.etree.ElementTree as ET
+
+from pagebot import MARKER_PATTERN
+from pagebot.elements import Galley
+from pagebot.toolbox.snapshot import element2Snapshot, snapshot2Element
+from pagebot.toolbox.workers import runWorkers, getObjectPath, getObject
+
+FOOTNOTE_NUMBER = 'fnnumber' # Marker id of the footnote reference numbers that are typeset by the workers.
+FIND_NUMBERED_MARKERS = re.compile('\=\=(footnote|literature|%s)\-\-([0-9]+)\=\=' % FOOTNOTE_NUMBER)
+
+def _ref2Plain(entry):
+    u"""Answer a copy of the footnote or literature reference *entry*, with the etree nodes as XML strings
+    and without the element."""
+    entry = dict(entry)
+    for name in ('node', 'p'):
+        if entry.get(name) is not None:
+            entry[name] = ET.tostring(entry[name], encoding='utf-8')
+    entry['e'] = None
+    return entry
+
+def _typesetChapter(doc, job):
+    u"""Typeset the chapter file *path* of the *job* into a new galley. Answer (galleyData, lost, footnotes,
+    literatureRefs, seconds, pid), where lost is the list of values that the galley snapshot could not
+    store and footnotes and literatureRefs are sorted lists of (index, entry)."""
+    path, typesetterClassPath, eId = job
+    startTime = time()
+    doc.lib['footnotes'] = {} # Number the references of this chapter from 1.
+    doc.lib['literatureRefs'] = {}
+    e = None
+    if eId is not None:
+        e = doc.getElementByEId(eId)
+    galley = Galley()
+    chapterTypesetter = getObject(typesetterClassPath)(doc, galley)
+    chapterTypesetter.markFootnoteNumbers = True
+    chapterTypesetter.typesetFile(path, e)
+    footnotes = [(index, _ref2Plain(entry)) for index, entry in sorted(doc.lib['footnotes'].items())]
+    literatureRefs = [(index, _ref2Plain(entry)) for index, entry in sorted(doc.lib['literatureRefs'].items())]
+    lost = []
+    galleyData = element2Snapshot(galley, lost)
+    return galleyData, lost, footnotes, literatureRefs, time() - startTime, os.getpid()
+
+def _typesetSerially(typesetter, paths, e):
+    u"""Typeset the chapter files of *paths* one after the other by *typesetter*. Answer the list of
+    statistics per chapter, same as typesetChapters."""
+    lib = typesetter.doc.lib
+    galley = typesetter.galley
+    statistics = []
+    for path in paths:
+        startTime = time()
+        footnotes = len(lib.get('footnotes', {}))
+        literatureRefs = len(lib.get('literatureRefs', {}))
+        elements = len(galley.elements)
+        typesetter.typesetFile(path, e)
+        statistics.append(dict(path=path, time=time() - startTime, pid=os.getpid(),
+            footnotes=len(lib.get('footnotes', {})) - footnotes,
+            literatureRefs=len(lib.get('literatureRefs', {})) - literatureRefs,
+            elements=len(galley.elements) - elements))
+    return statistics
+
+class Renumbering(object):
+    u"""Offsets of the footnote, literature and footnote number markers of the chapters that are merged."""
+    def __init__(self, footnotes=0, literatureRefs=0):
+        self.offsets = {'footnote': footnotes, 'literature': literatureRefs, FOOTNOTE_NUMBER: 0}
+        self.maxNumber = 0 # Highest footnote reference number in the current chapter.
+
+    def _replace(self, match):
+        markerId, index = match.group(1), int(match.group(2))
+        if markerId == FOOTNOTE_NUMBER:
+            self.maxNumber = max(self.maxNumber, index)
+            return unicode(index + self.offsets[markerId]) # Visible number, replaces the marker.
+        return MARKER_PATTERN % (markerId, index + self.offsets[markerId])
+
+    def renumber(self, s, offset=0, shifts=None):
+        u"""Answer the string *s* with the markers renumbered by the offsets. If *shifts* is defined, then
+        (string index after the marker, change of length) is added to it for every marker that is
+        replaced by a string of another length, where *offset* is the string index of *s*."""
+        parts = []
+        start = 0
+        for match in FIND_NUMBERED_MARKERS.finditer(s):
+            replacement = self._replace(match)
+            parts.append(s[start:match.start()])
+            parts.append(replacement)
+            start = match.end()
+            if shifts is not None and len(replacement) != start - match.start():
+                shifts.append((offset + start, len(replacement) - (start - match.start())))
+        parts.append(s[start:])
+        return u''.join(parts)
+
+    def renumberMarkers(self, markers, shifts=()):
+        u"""Answer the marker side-table *markers* with the footnote and literature markers renumbered, and
+        the string indices moved by the sorted (string index, change of length) *shifts* of the text."""
+        renumbered = []
+        shiftIndex = shift = 0
+        for index, markerId, arg in markers:
+            while shiftIndex < len(shifts) and shifts[shiftIndex][0] <= index:
+                shift += shifts[shiftIndex][1]
+                shiftIndex += 1
+            if markerId in ('footnote', 'literature'):
+                arg = int(arg) + self.offsets[markerId]
+            renumbered.append((index + shift, markerId, arg))
+        return renumbered
+
+    def renumberGalley(self, data):
+        u"""Renumber the markers in the text runs and marker side-tables of the snapshot *data* of a galley
+        and its elements. Side-table indices after a marker in the text that changed length are moved."""
+        shifts = []
+        if data['runs'] is not None:
+            runs = []
+            offset = 0
+            for text, attributes in data['runs']:
+                runs.append((self.renumber(text, offset, shifts), attributes))
+                offset += len(text)
+            data['runs'] = runs
+        if data['attributes'].get('_markers'):
+            data['attributes']['_markers'] = self.renumberMarkers(data['attributes']['_markers'], shifts)
+        for childData in data['elements']:
+            self.renumberGalley(childData)
+
+    def renumberRef(self, entry, e):
+        u"""Answer the plain reference *entry* with its etree nodes parsed and renumbered, and element *e*."""
+        entry = dict(entry)
+        for name in ('node', 'p'):
+            if entry.get(name) is not None:
+                entry[name] = ET.fromstring(self.renumber(entry[name].decode('utf-8')).encode('utf-8'))
+        entry['e'] = e
+        return entry
+
+    def nextChapter(self, footnotes, literatureRefs):
+        u"""Add the number of references of the merged chapter to the offsets."""
+        self.offsets['footnote'] += footnotes
+        self.offsets['literature'] += literatureRefs
+        self.offsets[FOOTNOTE_NUMBER] += self.maxNumber
+        self.maxNumber = 0
+
+def typesetChapters(typesetter, paths, workers, e=None):
+    u"""Typeset the chapter files of *paths* by at most *workers* processes and append them in order
+    to typesetter.galley, as if they were typeset one after the other. Answer the list of statistics per
+    chapter: dict(path, time, pid, footnotes, literatureRefs, elements). If the galley of a chapter
+    cannot be stored as snapshot without loss, then the chapters are typeset serially."""
+    doc = typesetter.doc
+    eId = None
+    if e is not None:
+        eId = e.eId
+        if doc.getElementByEId(eId) is not e: # Not in the document, so the workers cannot find it.
+            return _typesetSerially(typesetter, paths, e)
+    typesetterClassPath = getObjectPath(typesetter.__class__)
+    jobs = [(path, typesetterClassPath, eId) for path in paths]
+    results = runWorkers(_typesetChapter, jobs, workers, doc)
+    if any(lost for _, lost, _, _, _, _ in results): # Incomplete galley, e.g. OpenType features or tabs.
+        return _typesetSerially(typesetter, paths, e)
+
+    lib = doc.lib
+    footnotes = lib.setdefault('footnotes', {})
+    literatureRefs = lib.setdefault('literatureRefs', {})
+    renumbering = Renumbering(len(footnotes), len(literatureRefs))
+    galley = typesetter.galley
+    statistics = []
+    for path, (galleyData, _, chapterFootnotes, chapterLiteratureRefs, seconds, pid) in zip(paths, results):
+        renumbering.renumberGalley(galleyData)
+        for index, entry in chapterFootnotes:
+            entry = renumbering.renumberRef(entry, e)
+            entry['index'] = index + renumbering.offsets['footnote']
+            footnotes[entry['index']] = entry
+        for index, entry in chapterLiteratureRefs:
+            literatureRefs[index + renumbering.offsets['literature']] = renumbering.renumberRef(entry, e)
+        chapterGalley = snapshot2Element(galleyData)
+        elements = list(chapterGalley.elements)
+        for element in elements: # Same result as typesetting the chapters serially, see the lost check above.
+            if element.isTextBox:
+                galley.appendString(element.fs, element.markers)
+            else:
+                galley.appendElement(element)
+        renumbering.nextChapter(len(chapterFootnotes), len(chapterLiteratureRefs))
+        statistics.append(dict(path=path, time=seconds, pid=pid, footnotes=len(chapterFootnotes),
+            literatureRefs=len(chapterLiteratureRefs), elements=len(elements)))
+    return statistics
@@ -0,0 +1,183 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     profiling.py
+#
+#     Spans of the build phases (typeset, compose, solve, draw, export),
+#     aggregated per element class and per page. Profiling is disabled by
+#     default, then a span is a shared object that does nothing. Enable by
+#     profiler.enable() or by setting the environment variable PAGEBOT_PROFILE.
+#
+#     from pagebot.toolbox.profiling import profiler
+#     profiler.enable()
+#     doc.export('Doc.pdf')
+#     profiler.exportTrace('Trace.json') # Open in chrome://tracing
+#     print profiler.getSummary()
+#
+from __future__ import division
+import os
+import json
+from time import time
+
+class NoSpan(object):
+    u"""Span of a disabled profiler, doing nothing."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exceptionType, exception, traceback):
+        return False
+
+NO_SPAN = NoSpan()
+
+class Span(object):
+    u"""Context manager that measures the time of a phase. On exit the duration is added to the profiler."""
+    def __init__(self, profiler, category, name, e, args):
+        self.profiler = profiler
+        self.category = category
+        self.name = name
+        self.e = e
+        self.args = args
+        self.childTime = 0 # Total time of the spans inside self, to calculate the self time.
+
+    def __enter__(self):
+        self.profiler._stack.append(self)
+        self.startTime = time()
+        return self
+
+    def __exit__(self, exceptionType, exception, traceback):
+        self.profiler._endSpan(self, time())
+        return False
+
+class Profiler(object):
+    u"""Collects the spans of a build. Every span is stored as Chrome trace event and the times are
+    aggregated by (category, element class name) and by (category, page)."""
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.clear()
+
+    def __repr__(self):
+        return '[%s enabled=%s events=%d]' % (self.__class__.__name__, self.enabled, len(self.events))
+
+    def clear(self):
+        u"""Remove all collected spans."""
+        self.events = [] # Chrome trace events
+        self.classTimes = {} # (category, className) --> [count, total time, self time]
+        self.pageTimes = {} # (category, pageName) --> total time
+        self._stack = [] # Open spans
+        self._startTime = time()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, category, name=None, e=None, **args):
+        u"""Answer the context manager that measures the phase *category*. If *e* is an element, the time
+        is aggregated by its class name and, if e is a page, by its page. *name* is the name of the trace
+        event, default is the class name of *e* or category. Additional keyword *args* are stored in the
+        event."""
+        if not self.enabled:
+            return NO_SPAN
+        if name is None:
+            if e is None:
+                name = category
+            else:
+                name = e.__class__.__name__
+        return Span(self, category, name, e, args)
+
+    def _endSpan(self, span, endTime):
+        duration = endTime - span.startTime
+        stack = self._stack
+        if stack and stack[-1] is span:
+            stack.pop()
+        if stack:
+            stack[-1].childTime += duration
+        args = span.args
+        e = span.e
+        if e is not None:
+            key = span.category, e.__class__.__name__
+            times = self.classTimes.get(key)
+            if times is None:
+                times = self.classTimes[key] = [0, 0, 0]
+            times[0] += 1
+            times[1] += duration
+            times[2] += duration - span.childTime
+            args['eId'] = e.eId
+            if e.isPage:
+                pageName = e.name or e.eId
+                key = span.category, pageName
+                self.pageTimes[key] = self.pageTimes.get(key, 0) + duration
+                args['page'] = pageName
+        self.events.append(dict(name=span.name, cat=span.category, ph='X', pid=os.getpid(), tid=0,
+            ts=int((span.startTime - self._startTime) * 1000000), dur=int(duration * 1000000), args=args))
+
+    def exportTrace(self, path):
+        u"""Write the spans as Chrome trace-event JSON to *path*, to be opened by chrome://tracing or Perfetto."""
+        f = open(path, 'w')
+        json.dump(dict(traceEvents=self.events, displayTimeUnit='ms'), f, default=str)
+        f.close()
+
+    def getSummary(self, count=10):
+        u"""Answer the text summary of the total time per phase, the *count* element classes with the
+        highest self time of drawing and the *count* slowest pages."""
+        lines = []
+        phases = {} # category --> total time of spans that are not inside spans of the same category.
+        outer = {} # category --> end time of the last outer span.
+        for event in sorted(self.events, key=lambda event: (event['ts'], -event['dur'])):
+            category = event['cat']
+            end = outer.get(category, -1)
+            if event['ts'] >= end: # Not inside a span of the same category.
+                phases[category] = phases.get(category, 0) + event['dur']/1000000
+                outer[category] = event['ts'] + event['dur']
+        lines.append('Phases')
+        for category, total in sorted(phases.items(), key=lambda item: -item[1]):
+            lines.append('    %-12s %10.4fs' % (category, total))
+
+        lines.append('Element classes by draw time (count, total, self)')
+        drawTimes = [(times, className) for (category, className), times in self.classTimes.items() if category == 'draw']
+        for (n, total, selfTime), className in sorted(drawTimes, key=lambda item: -item[0][2])[:count]:
+            lines.append('    %-24s %8d %10.4fs %10.4fs' % (className, n, total, selfTime))
+
+        lines.append('Slowest pages (phase, total)')
+        for (category, pageName), total in sorted(self.pageTimes.items(), key=lambda item: -item[1])[:count]:
+            lines.append('    %-24s %-12s %10.4fs' % (pageName, category, total))
+        return '\n'.join(lines)
+
+    def exportSummary(self, path, count=10):
+        u"""Write the text summary to *path*."""
+        f = open(path, 'w')
+        f.write(self.getSummary(count))
+        f.close()
+
+profiler = Profiler(enabled=bool(os.environ.get('PAGEBOT_PROFILE')))
+
+def profiled(category, getName=None):
+    u"""Decorator that measures each call of the method in a span of *category*. If self is an element,
+    the time is aggregated by its class. The optional *getName(self, *args, **kwargs)* answers the name
+    of the trace event. When profiling is disabled, the method is called directly."""
+    def decorator(method):
+        def wrapper(self, *args, **kwargs):
+            if not profiler.enabled:
+                return method(self, *args, **kwargs)
+            if getName is None:
+                name = None
+            else:
+                name = getName(self, *args, **kwargs)
+            e = None
+            if hasattr(self, 'isPage'): # Only elements are aggregated by class.
+                e = self
+            with profiler.span(category, name, e):
+                return method(self, *args, **kwargs)
+        wrapper.__name__ = method.__name__
+        wrapper.__doc__ = method.__doc__
+        return wrapper
+    return decorator
@@ -0,0 +1,69 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     selectorindex.py
+#
+#     Trie of the space separated style names in Document.styles (such as
+#     'document h1 p'), used by Document.findStyle and the Typesetter to find
+#     the style names that match the end of a tag path, without joining and
+#     looking up every suffix of the path as string.
+#
+class SelectorIndex(object):
+    u"""Trie over the tokens of the style names, stored from last token to first. Walking the tag path
+    backwards from its last tag answers all style names that are a suffix of the path, in order of length.
+    The index is built for the current names in *styles*. Use self.isValid(styles) to check if the
+    dictionary still has the same names."""
+    def __init__(self, styles):
+        self._styles = styles
+        self._names = set(styles.keys())
+        self._root = {} # token --> [child trie, style name or None]
+        for name in self._names:
+            tokens = name.split(' ')
+            node = None
+            children = self._root
+            for token in reversed(tokens):
+                if not token: # Ignore double spaces.
+                    continue
+                node = children.get(token)
+                if node is None:
+                    node = children[token] = [{}, None]
+                children = node[0]
+            if node is not None:
+                node[1] = name
+
+    def __repr__(self):
+        return '[%s names=%d]' % (self.__class__.__name__, len(self._names))
+
+    def isValid(self, styles):
+        u"""Answer True if the index was built for *styles* and its names did not change."""
+        return styles is self._styles and len(styles) == len(self._names)
+
+    def getMatches(self, tags):
+        u"""Answer the list of style names that match the end of the sequence of *tags*, longest first."""
+        matches = []
+        children = self._root
+        for index in range(len(tags)-1, -1, -1):
+            node = children.get(tags[index])
+            if node is None:
+                break
+            if node[1] is not None:
+                matches.append(node[1])
+            children = node[0]
+        matches.reverse()
+        return matches
+
+    def findLongest(self, tags):
+        u"""Answer the longest style name that matches the end of the sequence of *tags*.
+        Answer None if there is no match."""
+        matches = self.getMatches(tags)
+        if matches:
+            return matches[0]
+        return None
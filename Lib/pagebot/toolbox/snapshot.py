@@ -0,0 +1,354 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     snapshot.py
+#
+#     Compact snapshot of a composed and solved Document, used by
+#     Document.saveSnapshot and Document.loadSnapshot, so a document can be
+#     restored without typesetting, composing and solving it again.
+#     The snapshot is plain data (dictionaries, lists, strings and numbers):
+#     element tree, styles, conditions, flow links, solved geometry and the
+#     text of text boxes as runs of plain attributes. It is written as a
+#     versioned binary file: the MAGIC header, the version and the compressed
+#     data. Reading and writing snapshot data does not need DrawBot. Without
+#     DrawBot (headless), the text of text boxes is restored as the list of
+#     runs, which can be measured and composed by the layouts of
+#     toolbox.textlayout, but not drawn. Attributes that refer to the element
+#     itself or to one of its descendants, such as Galley.lastTextBox, are
+#     stored by eId and restored as reference to the restored element.
+#
+#     doc.saveSnapshot('Doc.pbsnap')
+#     doc = Document.loadSnapshot('Doc.pbsnap')
+#
+import struct
+import zlib
+import cPickle
+
+try:
+    from drawBot import FormattedString
+    from AppKit import NSLeftTextAlignment, NSRightTextAlignment, NSCenterTextAlignment, NSJustifiedTextAlignment, \
+        NSParagraphStyle, NSFontFeatureSettingsAttribute, NSFontVariationAttribute
+    ALIGNMENTS = {NSLeftTextAlignment: 'left', NSRightTextAlignment: 'right', NSCenterTextAlignment: 'center',
+        NSJustifiedTextAlignment: 'justified'}
+    # Attributes of the font descriptor that are not kept by the font name.
+    FONT_DESCRIPTOR_ATTRIBUTES = {NSFontFeatureSettingsAttribute: 'openTypeFeatures',
+        NSFontVariationAttribute: 'fontVariations'}
+except ImportError:
+    FormattedString = NSParagraphStyle = None
+    ALIGNMENTS = {}
+    FONT_DESCRIPTOR_ATTRIBUTES = {}
+
+MAGIC = 'PBSNAP'
+VERSION = 2 # Increment if the structure of the snapshot data changes.
+
+# Attributes of elements that are caches or links, which are rebuilt when the element is restored.
+CACHE_ATTRIBUTES = set(('_parent', '_elements', '_eIds', '_style', '_cssCache', '_cssVersion', '_rootPoint',
+    '_spatialIndex', 'timeMarks', '_tm0', '_tm1', '_template', 'conditions', 'report', '_solveTime',
+    '_solveConditions', '_solveScore', '_fs', '_fsHash', '_textLines', '_baseLines', '_ctLines'))
+
+# Attributes of the attributed string of a FormattedString that are kept by fs2Runs.
+KEPT_STRING_ATTRIBUTES = set(('NSFont', 'NSColor', 'NSParagraphStyle', 'NSKern', 'NSBaselineOffset', 'NSLanguage'))
+
+# Attributes of the runs in the text of text boxes. Default values reset the attributes of the previous run.
+RUN_DEFAULTS = dict(fill=None, cmykFill=None, align=None, lineHeight=None, tracking=None, baselineShift=None,
+    firstLineIndent=0, indent=0, tailIndent=0, paragraphTopSpacing=0, paragraphBottomSpacing=0)
+
+def isPlain(value):
+    u"""Answer True if *value* is plain data: None, boolean, number, string, or a list, tuple or
+    dictionary of plain data."""
+    if value is None or isinstance(value, (bool, int, long, float, basestring)):
+        return True
+    if isinstance(value, (list, tuple)):
+        for v in value:
+            if not isPlain(v):
+                return False
+        return True
+    if isinstance(value, dict):
+        for name, v in value.items():
+            if not isPlain(name) or not isPlain(v):
+                return False
+        return True
+    return False
+
+def _plainItems(items, lost, eId):
+    u"""Answer the dictionary of the plain values in *items*. Names of other values are added to *lost*."""
+    plain = {}
+    for name, value in items:
+        if isPlain(value):
+            plain[name] = value
+        else:
+            lost.append((eId, name))
+    return plain
+
+def _getClassPath(obj):
+    return obj.__class__.__module__, obj.__class__.__name__
+
+def _getClass(classPath):
+    moduleName, className = classPath
+    module = __import__(moduleName, {}, {}, [className])
+    return getattr(module, className)
+
+#   W R I T I N G
+
+def writeSnapshot(data, path):
+    u"""Write the snapshot *data* to *path* as versioned binary file."""
+    f = open(path, 'wb')
+    f.write(MAGIC + struct.pack('>H', VERSION))
+    f.write(zlib.compress(cPickle.dumps(data, 2)))
+    f.close()
+
+def readSnapshot(path):
+    u"""Answer the snapshot data in the file *path*. Raise a ValueError if the file is not a snapshot or has
+    an unknown version."""
+    f = open(path, 'rb')
+    header = f.read(len(MAGIC) + 2)
+    body = f.read()
+    f.close()
+    if not header.startswith(MAGIC):
+        raise ValueError('File "%s" is not a PageBot snapshot' % path)
+    version, = struct.unpack('>H', header[len(MAGIC):])
+    if version != VERSION:
+        raise ValueError('Snapshot "%s" has version %d, expected %d' % (path, version, VERSION))
+    return cPickle.loads(zlib.decompress(body))
+
+#   F O R M A T T E D  S T R I N G S
+
+def _color2Plain(color):
+    u"""Answer ('cmykFill', (c, m, y, k, a)) or ('fill', (r, g, b, a)) for the NSColor *color*."""
+    if color.colorSpaceName() == 'NSDeviceCMYKColorSpace':
+        return 'cmykFill', (color.cyanComponent(), color.magentaComponent(), color.yellowComponent(),
+            color.blackComponent(), color.alphaComponent())
+    color = color.colorUsingColorSpaceName_('NSCalibratedRGBColorSpace')
+    return 'fill', (color.redComponent(), color.greenComponent(), color.blueComponent(), color.alphaComponent())
+
+def fs2Runs(fs, lost=None):
+    u"""Answer the list of (text, attributes) runs of the FormattedString *fs*, where attributes is a
+    plain dictionary with the values for FormattedString.append. Only font, size, color, alignment,
+    leading, tracking, baseline shift, indents, paragraph spacing and language are kept. The names of
+    other attributes of the string, such as underline, stroke, tabs, OpenType features and font
+    variations, are added to the list *lost*, if defined."""
+    attrString = fs.getNSObject()
+    s = attrString.string()
+    runs = []
+    lostNames = set()
+    defaultTabStops = None
+    index = 0
+    while index < len(s):
+        attrs, (start, length) = attrString.attributesAtIndex_effectiveRange_(index, None)
+        run = dict(RUN_DEFAULTS)
+        font = attrs.get('NSFont')
+        if font is not None:
+            run['font'] = font.fontName()
+            run['fontSize'] = font.pointSize()
+            fontAttributes = font.fontDescriptor().fontAttributes()
+            for name, lostName in FONT_DESCRIPTOR_ATTRIBUTES.items():
+                if fontAttributes.get(name):
+                    lostNames.add(lostName)
+        color = attrs.get('NSColor')
+        if color is not None:
+            name, value = _color2Plain(color)
+            run[name] = value
+        paragraphStyle = attrs.get('NSParagraphStyle')
+        if paragraphStyle is not None:
+            run['align'] = ALIGNMENTS.get(paragraphStyle.alignment())
+            run['lineHeight'] = paragraphStyle.maximumLineHeight() or None
+            run['firstLineIndent'] = paragraphStyle.firstLineHeadIndent()
+            run['indent'] = paragraphStyle.headIndent()
+            run['tailIndent'] = paragraphStyle.tailIndent()
+            run['paragraphTopSpacing'] = paragraphStyle.paragraphSpacingBefore()
+            run['paragraphBottomSpacing'] = paragraphStyle.paragraphSpacing()
+            if defaultTabStops is None:
+                defaultTabStops = NSParagraphStyle.defaultParagraphStyle().tabStops()
+            if paragraphStyle.tabStops() != defaultTabStops:
+                lostNames.add('tabs')
+        if attrs.get('NSKern') is not None:
+            run['tracking'] = float(attrs['NSKern'])
+        if attrs.get('NSBaselineOffset') is not None:
+            run['baselineShift'] = float(attrs['NSBaselineOffset'])
+        if attrs.get('NSLanguage') is not None: # Language of the hyphenation, see toolbox.hyphenation
+            run['language'] = unicode(attrs['NSLanguage'])
+        for name in attrs.keys():
+            if not name in KEPT_STRING_ATTRIBUTES: # E.g. NSUnderline, NSStrokeColor, NSStrokeWidth
+                lostNames.add(unicode(name))
+        runs.append((unicode(s[start:start+length]), run))
+        index = start + length
+    if lost is not None:
+        lost += sorted(lostNames)
+    return runs
+
+def runs2FS(runs):
+    u"""Answer a new FormattedString from the list of (text, attributes) *runs*. Answer a copy of the runs
+    if DrawBot is not available."""
+    if FormattedString is None: # Headless, the runs are the text of toolbox.textlayout.
+        return [(text, dict(attributes)) for text, attributes in runs]
+    fs = FormattedString()
+    for text, attributes in runs:
+        fs.append(text, **attributes)
+    return fs
+
+#   E L E M E N T S
+
+def _isInTree(value, e):
+    u"""Answer True if *value* is element *e* or one of its descendants."""
+    while getattr(value, 'isPage', None) is not None: # Element
+        if value is e:
+            return True
+        value = value.parent
+    return False
+
+def _findElement(e, eId):
+    u"""Answer the element with *eId* in the tree of element *e*. Answer None if it does not exist."""
+    if e.eId == eId:
+        return e
+    for child in e.elements:
+        found = _findElement(child, eId)
+        if found is not None:
+            return found
+    return None
+
+def element2Snapshot(e, lost):
+    u"""Answer the snapshot data of element *e* and its child elements. The names of attributes and style
+    values that are not plain data are added to the *lost* list as (eId, name)."""
+    attributes = {}
+    references = {} # Attribute name --> eId of the referred element in the tree of e.
+    for name, value in e.__dict__.items():
+        if name in CACHE_ATTRIBUTES:
+            continue
+        if isPlain(value):
+            attributes[name] = value
+        elif _isInTree(value, e):
+            references[name] = value.eId
+            attributes[name] = None
+        else:
+            if not name.startswith('_'): # Drawing hooks, shadow, gradient...
+                lost.append((e.eId, name))
+            attributes[name] = None
+    conditions = []
+    for condition in e.conditions or []:
+        conditions.append((_getClassPath(condition), _plainItems(condition.__dict__.items(), lost, e.eId)))
+    data = dict(
+        classPath=_getClassPath(e),
+        attributes=attributes,
+        style=_plainItems(e.style.items(), lost, e.eId),
+        conditions=conditions,
+        hasConditions=e.conditions is not None,
+        elements=[element2Snapshot(child, lost) for child in e.elements],
+        references=references,
+        runs=None,
+        spatialIndexCellSize=None,
+    )
+    if e._spatialIndex is not None:
+        data['spatialIndexCellSize'] = e._spatialIndex.cellSize
+    fs = e.__dict__.get('_fs')
+    if fs is not None:
+        if isinstance(fs, basestring):
+            data['runs'] = [(fs, {})]
+        elif isinstance(fs, (list, tuple)): # Runs of toolbox.textlayout
+            data['runs'] = [(text, dict(attributes)) for text, attributes in fs]
+        else:
+            lostNames = []
+            data['runs'] = fs2Runs(fs, lostNames)
+            for name in lostNames:
+                lost.append((e.eId, 'fs.' + name))
+    return data
+
+def snapshot2Element(data):
+    u"""Answer a new element from the snapshot *data*, including its child elements. The element is
+    restored without calling its constructor, the caches are reset."""
+    from pagebot.style import XXXL
+    from pagebot.toolbox.timemark import TimeMark
+    from pagebot.toolbox.spatialindex import SpatialIndex
+
+    elementClass = _getClass(data['classPath'])
+    e = elementClass.__new__(elementClass)
+    e.__dict__.update(data['attributes'])
+    if data['runs'] is not None: # Text box, reset the cached text lines.
+        e._textLines = e._baseLines = None
+    e._parent = None
+    e._cssCache = {}
+    e._cssVersion = 0
+    e._rootPoint = None
+    e._spatialIndex = None
+    e._template = None
+    e.resetSolved()
+    e.clearElements()
+    e.style = data['style']
+    e.timeMarks = [TimeMark(0, e.style), TimeMark(XXXL, e.style)]
+    e._tm0 = e._tm1 = None
+    conditions = None
+    if data['hasConditions']:
+        conditions = []
+        for classPath, attributes in data['conditions']:
+            conditionClass = _getClass(classPath)
+            condition = conditionClass.__new__(conditionClass)
+            condition.__dict__.update(attributes)
+            conditions.append(condition)
+    e.conditions = conditions
+    e.report = []
+    if data['runs'] is not None:
+        e.fs = runs2FS(data['runs'])
+    for childData in data['elements']:
+        e.appendElement(snapshot2Element(childData))
+    if data['spatialIndexCellSize'] is not None:
+        e.spatialIndex = SpatialIndex(data['spatialIndexCellSize'])
+    for name, eId in data['references'].items():
+        e.__dict__[name] = _findElement(e, eId)
+    return e
+
+#   D O C U M E N T
+
+def document2Snapshot(doc):
+    u"""Answer the snapshot data of *doc*: document attributes, root style, named styles and pages by page
+    number. Views are not included, the loaded document gets the default views."""
+    lost = []
+    styles = {}
+    for name, style in doc.styles.items():
+        if name != 'root': # Root style is added by the Document constructor.
+            styles[name] = _plainItems(style.items(), lost, name)
+    pages = []
+    for pn, pnPages in sorted(doc.pages.items()):
+        for page in pnPages:
+            pages.append((pn, element2Snapshot(page, lost)))
+    return dict(
+        version=VERSION,
+        name=doc.name,
+        title=doc.title,
+        w=doc.w,
+        h=doc.h,
+        originTop=doc.originTop,
+        rootStyle=_plainItems(doc.rootStyle.items(), lost, 'root'),
+        styles=styles,
+        pages=pages,
+        lost=lost, # List of (eId or style name, name) of values that could not be stored.
+    )
+
+def getLostPages(doc, lost):
+    u"""Answer the set of pages of *doc* with elements that have values in the *lost* list of its snapshot.
+    Lost values of the root style or named styles are used by all pages, then all pages are answered."""
+    pages = set()
+    for eId, name in lost:
+        e = doc.getElementByEId(eId)
+        if e is None: # Root style or named style.
+            return set([page for pnPages in doc.pages.values() for page in pnPages])
+        if not e.isPage:
+            e = e.getElementPage()
+        pages.add(e)
+    return pages
+
+def snapshot2Document(data, documentClass):
+    u"""Answer a new instance of *documentClass* from the snapshot *data*."""
+    doc = documentClass(rootStyle=data['rootStyle'], styles=data['styles'], name=data['name'],
+        title=data['title'], autoPages=0, originTop=data['originTop'], w=data['w'], h=data['h'])
+    for pn, pageData in data['pages']:
+        page = snapshot2Element(pageData)
+        page.setParent(doc) # Set parent as weakref, adds the elements to the element index.
+        doc[pn] = page
+    return doc
@@ -0,0 +1,171 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     spatialindex.py
+#
+#     Optional index of the margin boxes of the child elements in a container,
+#     used by Element.getFloat*Side to find the siblings that can block floating,
+#     without scanning all elements of the parent.
+#
+from math import floor
+
+DEFAULT_CELL_SIZE = 100 # Default width of the columns and height of the rows of the grid.
+MAX_CELL_SPAN = 64 # Boxes spanning more cells are stored in a separate list per layer.
+
+class SpatialIndex(object):
+    u"""Uniform grid over the margin boxes of the child elements of a container, partitioned by z-layer.
+    Every layer has columns (horizontal projection of the boxes) and rows (vertical projection).
+    Margin boxes are measured lazily: appended or changed elements are marked dirty and (re)measured
+    on the next query. Elements keep their order of appending, so queries can select previous siblings."""
+    def __init__(self, cellSize=None):
+        self.cellSize = cellSize or DEFAULT_CELL_SIZE
+        self.clear()
+
+    def __repr__(self):
+        return '[%s elements=%d layers=%d]' % (self.__class__.__name__, len(self._orders), len(self._layers))
+
+    def __len__(self):
+        return len(self._orders)
+
+    def clear(self):
+        u"""Remove all elements from the index."""
+        self._orders = {} # Element --> order of appending
+        self._boxes = {} # Element --> (z, (xMin, xMax), (yMin, yMax)) of measured margin box.
+        self._layers = {} # z --> dict(x={cell: set of elements}, y={...}, wide=dict(x=set(), y=set()))
+        self._dirty = set() # Elements that need to be (re)measured.
+        self._order = 0
+
+    def fill(self, elements):
+        u"""Clear the index and add the list of *elements* in their current order."""
+        self.clear()
+        for e in elements:
+            self.appendElement(e)
+
+    def appendElement(self, e):
+        u"""Add *e* as last element in the order of the index."""
+        self._orders[e] = self._order
+        self._order += 1
+        self._dirty.add(e)
+
+    def removeElement(self, e):
+        u"""Remove *e* from the index, if it is there."""
+        if e in self._orders:
+            self._unbucket(e)
+            del self._orders[e]
+            self._dirty.discard(e)
+
+    def elementChanged(self, e):
+        u"""Mark the margin box of *e* to be measured again on the next query."""
+        if e in self._orders:
+            self._dirty.add(e)
+
+    def invalidate(self):
+        u"""Mark the margin boxes of all elements to be measured again, e.g. when inherited alignment
+        or the size of the container changed."""
+        self._dirty.update(self._orders)
+
+    def _span(self, vMin, vMax):
+        u"""Answer the range of cell indices that cover (vMin, vMax). Answer None if the span
+        is too wide to store in individual cells."""
+        cellSize = self.cellSize
+        c0 = int(floor(vMin / cellSize))
+        c1 = int(floor(vMax / cellSize))
+        if c1 - c0 >= MAX_CELL_SPAN:
+            return None
+        return range(c0, c1+1)
+
+    def _getLayer(self, z):
+        layer = self._layers.get(z)
+        if layer is None:
+            layer = self._layers[z] = dict(x={}, y={}, wide=dict(x=set(), y=set()))
+        return layer
+
+    def _bucket(self, e):
+        u"""Measure the margin box of *e* and store it in the cells of its layer."""
+        x0, x1 = e.mLeft, e.mRight
+        y0, y1 = e.mTop, e.mBottom
+        box = self._boxes[e] = e.z, (min(x0, x1), max(x0, x1)), (min(y0, y1), max(y0, y1))
+        z, xRange, yRange = box
+        layer = self._getLayer(z)
+        for axis, (vMin, vMax) in (('x', xRange), ('y', yRange)):
+            span = self._span(vMin, vMax)
+            if span is None:
+                layer['wide'][axis].add(e)
+            else:
+                cells = layer[axis]
+                for cell in span:
+                    if not cell in cells:
+                        cells[cell] = set()
+                    cells[cell].add(e)
+
+    def _unbucket(self, e):
+        u"""Remove *e* from the cells where it was stored by its previous measure."""
+        box = self._boxes.pop(e, None)
+        if box is None:
+            return
+        z, xRange, yRange = box
+        layer = self._layers[z]
+        for axis, (vMin, vMax) in (('x', xRange), ('y', yRange)):
+            span = self._span(vMin, vMax)
+            if span is None:
+                layer['wide'][axis].discard(e)
+            else:
+                cells = layer[axis]
+                for cell in span:
+                    cells[cell].discard(e)
+                    if not cells[cell]:
+                        del cells[cell]
+        if not layer['x'] and not layer['wide']['x']:
+            del self._layers[z] # Layer became empty.
+
+    def update(self):
+        u"""Measure the margin boxes of all dirty elements again."""
+        while self._dirty:
+            e = self._dirty.pop()
+            self._unbucket(e)
+            self._bucket(e)
+
+    def findSiblings(self, e, previousOnly, tolerance, axis):
+        u"""Answer the list of indexed elements that can overlap the margin box of *e* in the projection
+        on *axis* ('x' for horizontal, 'y' for vertical), with z-layer within *tolerance* of e.z.
+        If *previousOnly* is True, then only answer the elements that were appended before *e*.
+        The list is a superset of the overlapping elements, so the caller still needs to test them.
+        The order of the answered list is undefined."""
+        self.update()
+        order = self._orders.get(e)
+        if not previousOnly or order is None:
+            order = self._order # All elements, including e itself.
+        x0, x1 = e.mLeft, e.mRight
+        y0, y1 = e.mTop, e.mBottom
+        if axis == 'x':
+            span = self._span(min(x0, x1), max(x0, x1))
+        else:
+            span = self._span(min(y0, y1), max(y0, y1))
+        z = e.z
+        found = set()
+        if tolerance:
+            layers = [layer for layerZ, layer in self._layers.items() if abs(layerZ - z) <= tolerance]
+        elif z in self._layers:
+            layers = [self._layers[z]]
+        else:
+            layers = []
+        for layer in layers:
+            found.update(layer['wide'][axis])
+            cells = layer[axis]
+            if span is None: # Wide query, test all elements of the layer.
+                for elements in cells.values():
+                    found.update(elements)
+            else:
+                for cell in span:
+                    if cell in cells:
+                        found.update(cells[cell])
+        orders = self._orders
+        return [sibling for sibling in found if orders[sibling] < order]
@@ -0,0 +1,146 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     textflow.py
+#
+#     Text that flows through a sequence of text boxes, used by Composer.compose.
+#     The text of the galley elements is appended in place to one string. Every
+#     text box of the flow gets the part of the string from the offset where the
+#     previous box stopped, up to the last line that fits. Only a chunk of the
+#     text after the offset is measured, doubled until it overflows the box, so
+#     filling all boxes takes time linear in the length of the text, instead of
+#     measuring and copying the complete remaining text for every box.
+#     Measurements are cached by toolbox.textmeasure, line breaks of the
+#     FontToolsLayout by its line breaker (see toolbox.linebreaking). The
+#     total-fit line breaker breaks the lines of a paragraph depending on all
+#     of its text, so for layouts that use it the chunks are extended to the
+#     end of a paragraph, otherwise the lines in the box would differ from the
+#     lines of the complete text.
+#     The marker side-tables of the appended strings (see TextBox.appendMarker)
+#     are kept with their offset in the flow, and every box gets its part of them.
+#
+#     flow = TextFlow()
+#     flow.append(fs)
+#     end = flow.fill(tb, 0) # tb.fs is the part of fs that fits, end is the offset of the next box.
+#
+from bisect import bisect_left, bisect_right
+
+from pagebot import sliceMarkers
+from pagebot.toolbox.textmeasure import textMeasureCache
+from pagebot.toolbox.textlayout import fsLength
+from pagebot.toolbox.linebreaking import NEW_LINES
+
+class TextFlow(object):
+    u"""Text that flows through text boxes, starting with optional *fs* and its *markers*. The text is a
+    FormattedString or a list of (text, attributes) runs (see toolbox.textlayout), plain strings are
+    appended as runs. Boxes are measured with chunks of at least *chunkSize* characters."""
+    CHUNK_SIZE = 1024
+
+    def __init__(self, fs=None, markers=None, chunkSize=None):
+        self.fs = None
+        self.chunkSize = chunkSize or self.CHUNK_SIZE
+        self._length = 0
+        self._runStarts = [] # String index of every run, if self.fs is a list of runs.
+        self._markers = [] # Marker side-table of the flow: sorted list of (index, markerId, arg)
+        self._paragraphEnds = [] # String index after every new line character.
+        if fs or markers:
+            self.append(fs, markers)
+
+    def __repr__(self):
+        return '[%s length=%d]' % (self.__class__.__name__, self._length)
+
+    def __len__(self):
+        return self._length
+
+    def append(self, fs, markers=None):
+        u"""Append *fs* to the text of the flow, with the optional side-table *markers* of *fs*. The string
+        is not copied, unless it is the first."""
+        for index, markerId, arg in markers or ():
+            self._markers.append((self._length + index, markerId, arg))
+        if not fs:
+            return
+        if isinstance(fs, basestring):
+            fs = [(fs, {})]
+        if isinstance(fs, (list, tuple)):
+            text = u''.join([t for t, _ in fs])
+        else:
+            text = unicode(fs.getNSObject().string())
+        for index, c in enumerate(text):
+            if c in NEW_LINES:
+                self._paragraphEnds.append(self._length + index + 1)
+        if self.fs is None:
+            if isinstance(fs, (list, tuple)):
+                self.fs = []
+            else:
+                self.fs = fs.copy() # Appending must not change the string of the galley element.
+                self._length = len(fs)
+                return
+        if isinstance(self.fs, list):
+            for text, attributes in fs:
+                self._runStarts.append(self._length)
+                self.fs.append((text, attributes))
+                self._length += len(text)
+        else:
+            self.fs.append(fs) # In place, FormattedString += makes a copy.
+            self._length += len(fs)
+
+    def getSlice(self, start, end):
+        u"""Answer the text from string index *start* to *end*, in the type of the text of the flow."""
+        if self.fs is None: # No text appended yet.
+            return None
+        if not isinstance(self.fs, list):
+            return self.fs[start:end]
+        runs = []
+        runStarts = self._runStarts
+        for runIndex in range(max(0, bisect_right(runStarts, start) - 1), len(runStarts)):
+            runStart = runStarts[runIndex]
+            if runStart >= end:
+                break
+            text, attributes = self.fs[runIndex]
+            text = text[max(0, start - runStart):end - runStart]
+            if text:
+                runs.append((text, attributes))
+        return runs
+
+    def getParagraphEnd(self, index):
+        u"""Answer the string index of the end of the paragraph that includes the character before *index*.
+        Answer *index* if it already is the end of a paragraph."""
+        paragraphIndex = bisect_left(self._paragraphEnds, index)
+        if paragraphIndex < len(self._paragraphEnds):
+            return self._paragraphEnds[paragraphIndex]
+        return self._length
+
+    def fill(self, tb, start):
+        u"""Set the text and markers of text box *tb* to the text from string index *start* that fits in
+        the box. Answer the string index of the first character that does not fit, len(self) if all text
+        fits."""
+        end = self._length
+        if start < end and tb.style['h'] is not None and not tb.css('elasticH'): # Otherwise all text fits.
+            w = tb.w - tb.pl - tb.pr
+            h = tb.h - tb.pt - tb.pb
+            layout = tb.getTextLayout()
+            totalFit = getattr(getattr(layout, 'lineBreaker', None), 'totalFit', False)
+            chunkSize = self.chunkSize
+            while True:
+                chunkEnd = min(self._length, start + chunkSize)
+                if totalFit: # Measure complete paragraphs, see above.
+                    chunkEnd = self.getParagraphEnd(chunkEnd)
+                chunk = self.getSlice(start, chunkEnd)
+                overflow = textMeasureCache.textOverflow(chunk, w, h, layout=layout)
+                overflowLength = fsLength(overflow)
+                if overflowLength or chunkEnd == self._length:
+                    end = chunkEnd - overflowLength
+                    break
+                chunkSize *= 2 # All of the chunk fits, try more.
+            self.chunkSize = max(self.CHUNK_SIZE, 2 * (end - start)) # Estimate for the next box.
+        tb.fs = self.getSlice(start, end)
+        tb.markers = sliceMarkers(self._markers, start, end if end < self._length else None)
+        return end
@@ -0,0 +1,651 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     textlayout.py
+#
+#     Text layout backends for TextBox, selected by the name in css('textLayout').
+#     None is the CoreText layout of DrawBot. FontToolsLayout is a pure Python
+#     layout from the cmap, hmtx, hhea and GPOS kerning of the font files, read
+#     with fontTools through pagebot.fonttoolbox.objects.font.Font. It does not
+#     need DrawBot, CoreText or AppKit, so text can be laid out headless, e.g. on
+#     a Linux render server or in CI benchmarks. The text is a list of
+#     (text, attributes) runs, as made by toolbox.snapshot.fs2Runs, a plain
+#     string, or a FormattedString if DrawBot is available.
+#     The layout answers lines with the same interface as TextLine and TextRun
+#     of elements.pbtextbox, the overflow and the baseline positions. Text
+#     boxes with a layout draw the runs at the positions of getDrawRuns.
+#     Lines are broken on white space and hyphens, greedy or total-fit (see
+#     toolbox.linebreaking), without shaping (ligatures, OpenType features, bidi).
+#     If hyphenation is on, then words are hyphenated by the TeX patterns of the
+#     language of the run (see toolbox.hyphenation).
+#
+#     layout = getTextLayout(FONTTOOLS_LAYOUT)
+#     runs = [(u'Hello world', dict(font='/path/to/font.ttf', fontSize=12, lineHeight=16))]
+#     for textLine in layout.getTextLines(runs, 200, 100):
+#         print textLine.x, textLine.y, textLine.string
+#
+from __future__ import division
+import os
+import re
+from time import time
+
+from pagebot.style import LEFT, RIGHT, CENTER, JUSTIFIED, XXXL
+from pagebot.fonttoolbox.objects.font import Font, getFontPathOfFont
+from pagebot.fonttoolbox.ttftools import getBestCmap
+from pagebot.toolbox.linebreaking import WHITE_SPACE, NEW_LINES, GreedyBreaker, TotalFitBreaker
+from pagebot.toolbox.hyphenation import getHyphenator
+
+FONTTOOLS_LAYOUT = 'fonttools'
+TOTAL_FIT_LAYOUT = 'totalfit' # FontToolsLayout with TotalFitBreaker
+HYPHENATED_LAYOUT = 'hyphenated' # FontToolsLayout with TotalFitBreaker and hyphenation
+DEFAULT_FONT_SIZE = 16
+# Attributes of the runs that are drawn with the text. The positions of the lines already include the
+# paragraph attributes, the font and font size are the ones that the layout measured.
+DRAW_ATTRIBUTES = ('fill', 'cmykFill', 'tracking', 'baselineShift', 'language')
+
+class FoundPattern(object):
+    def __init__(self, s, x, ix, y=None, w=None, h=None, line=None, run=None):
+        self.s = s # Actual found string
+        self.x = x
+        self.ix = ix
+        self.y = y
+        self.w = w
+        self.h = h
+        self.line = line # TextLine instance that this was found in
+        self.run = run # List of  of this strin,g
+
+    def __repr__(self):
+        return '[Found "%s" @ %d,%d]' % (self.s, self.x, self.y)
+
+class BaseTextLine(object):
+    u"""Methods of text lines that are the same for all layouts. Inheriting classes define self.string,
+    self.runs, self.glyphCount, self.getOffsetForStringIndex(i)."""
+    def __len__(self):
+        return self.glyphCount
+
+    def getGlyphIndex2Run(self, glyphIndex):
+        for run in self.runs:
+            if run.iStart >= glyphIndex:
+                return run
+        return None
+
+    def findPattern(self, pattern):
+        founds = []
+        if isinstance(pattern, basestring):
+            pattern = re.compile(pattern)
+        for iStart, iEnd in [(m.start(0), m.end(0)) for m in re.finditer(pattern, self.string)]:
+            xStart = self.getOffsetForStringIndex(iStart)
+            xEnd = self.getOffsetForStringIndex(iEnd)
+            run = self.getGlyphIndex2Run(xStart)
+            founds.append(FoundPattern(self.string[iStart:iEnd], xStart, iStart, line=self, run=run))
+        return founds
+
+#   F O N T S
+
+class FontMetrics(object):
+    u"""Layout metrics of the pagebot *font*: character map, advance widths, GPOS kerning pairs and vertical
+    metrics in font units. Glyph advances in points are cached per font size."""
+    def __init__(self, font):
+        self.font = font
+        ttFont = font.ttFont
+        self.unitsPerEm = ttFont['head'].unitsPerEm
+        self.cmap = getBestCmap(ttFont) or {}
+        self.hmtx = ttFont['hmtx'].metrics
+        hhea = ttFont['hhea']
+        self.ascender = hhea.ascent
+        self.descender = hhea.descent # Negative value
+        self.lineGap = hhea.lineGap
+        os2 = ttFont.get('OS/2')
+        self.capHeight = getattr(os2, 'sCapHeight', None) or self.ascender
+        self.xHeight = getattr(os2, 'sxHeight', None) or self.ascender / 2
+        self.kerning = font.kerning # (leftGlyphName, rightGlyphName) --> value
+        self._glyphs = {} # char --> (glyphName, glyphId, advance in units)
+        self._advances = {} # fontSize --> {char: advance in points}
+
+    def __repr__(self):
+        return '[%s %s]' % (self.__class__.__name__, self.font.name)
+
+    def getGlyph(self, char):
+        u"""Answer the cached (glyphName, glyphId, advance) of *char*. The advance is in font units."""
+        glyph = self._glyphs.get(char)
+        if glyph is None:
+            glyphName = self.cmap.get(ord(char), '.notdef')
+            glyph = self._glyphs[char] = (glyphName, self.font.ttFont.getGlyphID(glyphName),
+                self.hmtx.get(glyphName, (0, 0))[0])
+        return glyph
+
+    def getAdvances(self, fontSize):
+        u"""Answer the cached dictionary char --> advance in points at *fontSize*. Missing characters are
+        added by self.getAdvance."""
+        advances = self._advances.get(fontSize)
+        if advances is None:
+            advances = self._advances[fontSize] = {}
+        return advances
+
+    def getAdvance(self, char, fontSize):
+        u"""Answer the advance of *char* in points at *fontSize*."""
+        advances = self.getAdvances(fontSize)
+        advance = advances.get(char)
+        if advance is None:
+            advance = advances[char] = self.getGlyph(char)[2] * fontSize / self.unitsPerEm
+        return advance
+
+    def getVerticalMetrics(self, fontSize):
+        u"""Answer (ascent, descent, lineGap) in points at *fontSize*, with descent as positive value."""
+        scale = fontSize / self.unitsPerEm
+        return self.ascender * scale, -self.descender * scale, self.lineGap * scale
+
+FONT_METRICS = {} # Font path or name --> FontMetrics
+
+def getFontMetrics(font):
+    u"""Answer the cached FontMetrics of *font*, a font file path or the name of an installed font."""
+    metrics = FONT_METRICS.get(font)
+    if metrics is None:
+        if os.path.isfile(font):
+            path = font
+        else:
+            path = getFontPathOfFont(font) # Needs AppKit
+        assert path is not None, 'Cannot find font "%s"' % font
+        metrics = FONT_METRICS[font] = FontMetrics(Font(path, install=False))
+    return metrics
+
+#   R U N S
+
+def fs2LayoutRuns(fs):
+    u"""Answer *fs* as list of (text, attributes) runs. *fs* is a plain string, a list of runs or a
+    FormattedString."""
+    if isinstance(fs, basestring):
+        return [(fs, {})]
+    if isinstance(fs, (list, tuple)):
+        return fs
+    from pagebot.toolbox.snapshot import fs2Runs # Needs DrawBot
+    return fs2Runs(fs)
+
+def fsLength(fs):
+    u"""Answer the number of characters of *fs*, which is None, a plain string, a list of runs or a
+    FormattedString."""
+    if not fs:
+        return 0
+    if isinstance(fs, (list, tuple)):
+        return sum([len(text) for text, _ in fs])
+    return len(fs)
+
+def sliceFS(fs, index):
+    u"""Answer the part of *fs* from string *index*, in the same type as *fs*."""
+    if not isinstance(fs, (list, tuple)):
+        return fs[index:] # Plain string or FormattedString
+    runs = []
+    start = 0
+    for text, attributes in fs:
+        end = start + len(text)
+        if end > index:
+            runs.append((text[max(0, index - start):], attributes))
+        start = end
+    return runs
+
+class RunInfo(object):
+    u"""Resolved attributes of a run of the laid out text."""
+    def __init__(self, attributes, metrics, fontSize):
+        self.attributes = attributes
+        self.metrics = metrics
+        self.fontSize = fontSize
+        self.ascent, self.descent, self.lineGap = metrics.getVerticalMetrics(fontSize)
+        self.lineHeight = attributes.get('lineHeight')
+        self.align = attributes.get('align') or LEFT
+        self.firstLineIndent = attributes.get('firstLineIndent') or 0
+        self.indent = attributes.get('indent') or 0
+        self.tailIndent = attributes.get('tailIndent') or 0
+        self.paragraphTopSpacing = attributes.get('paragraphTopSpacing') or 0
+        self.paragraphBottomSpacing = attributes.get('paragraphBottomSpacing') or 0
+        self.baselineShift = attributes.get('baselineShift') or 0
+        self.language = attributes.get('language')
+        self.hyphenation = attributes.get('hyphenation') # None is the hyphenation of the layout.
+
+#   L I N E S
+
+class LayoutRun(object):
+    u"""Run of glyphs with the same attributes in a LayoutLine, with the interface of TextRun."""
+    def __init__(self, info, runIndex, string, iStart, positions, advances):
+        self.info = info
+        self.runIndex = runIndex # Index of the run in the line
+        self.string = string
+        self.glyphCount = len(string)
+        self.iStart = iStart # String index of the first character
+        self.iEnd = iStart + len(string)
+        self.stringIndices = range(self.iStart, self.iEnd)
+        self.positions = positions # List of (x, y) of the glyphs, relative to the line origin.
+        self.advances = advances # List of (w, 0) of the glyphs
+        metrics = info.metrics
+        self.glyphNames = [metrics.getGlyph(c)[0] for c in string]
+        self.glyphs = [metrics.getGlyph(c)[1] for c in string]
+        self.status = 0
+
+    def __len__(self):
+        return self.glyphCount
+
+    def __repr__(self):
+        return '[%s #%d "%s"]' % (self.__class__.__name__, self.runIndex, self.string)
+
+    def __getitem__(self, index):
+        return self.string[index]
+
+    # Font stuff
+
+    def _get_fontName(self):
+        return self.info.metrics.font.info.psName or self.info.metrics.font.name
+    fontName = font = property(_get_fontName)
+
+    def _get_familyName(self):
+        return self.info.metrics.font.info.familyName
+    familyName = property(_get_familyName)
+
+    def _get_fontSize(self):
+        return self.info.fontSize
+    fontSize = property(_get_fontSize)
+
+    def _get_ascender(self):
+        return self.info.ascent
+    ascender = property(_get_ascender)
+
+    def _get_descender(self):
+        return -self.info.descent # Negative, as NSFont.descender
+    descender = property(_get_descender)
+
+    def _get_capHeight(self):
+        return self.info.metrics.capHeight * self.info.fontSize / self.info.metrics.unitsPerEm
+    capHeight = property(_get_capHeight)
+
+    def _get_xHeight(self):
+        return self.info.metrics.xHeight * self.info.fontSize / self.info.metrics.unitsPerEm
+    xHeight = property(_get_xHeight)
+
+    def _get_leading(self):
+        return self.info.lineGap
+    leading = property(_get_leading)
+
+    #   Paragraph attributes
+
+    def _get_alignment(self):
+        return self.info.align
+    alignment = property(_get_alignment)
+
+    def _get_paragraphSpacing(self):
+        return self.info.paragraphBottomSpacing
+    paragraphSpacing = property(_get_paragraphSpacing)
+
+    def _get_paragraphSpacingBefore(self):
+        return self.info.paragraphTopSpacing
+    paragraphSpacingBefore = property(_get_paragraphSpacingBefore)
+
+    def _get_headIndent(self):
+        return self.info.indent
+    headIndent = property(_get_headIndent)
+
+    def _get_tailIndent(self):
+        return self.info.tailIndent
+    tailIndent = property(_get_tailIndent)
+
+    def _get_firstLineHeadIndent(self):
+        return self.info.firstLineIndent
+    firstLineHeadIndent = property(_get_firstLineHeadIndent)
+
+    def _get_maximumLineHeight(self):
+        return self.info.lineHeight or 0
+    maximumLineHeight = minimumLineHeight = property(_get_maximumLineHeight)
+
+class LayoutLine(BaseTextLine):
+    u"""Line of a FontToolsLayout, with the interface of TextLine. Offsets are relative to the line
+    origin (self.x, self.y)."""
+    def __init__(self, string, iStart, lineIndex, runs, offsets, width, trailingWhiteSpace, ascent, descent,
+            leading):
+        self.x = self.y = 0 # Position of the origin, set by the layout.
+        self.lineIndex = lineIndex # Vertical line index in TextBox.
+        self.string = string
+        self.glyphCount = len(string)
+        self.iStart = iStart
+        self.runs = runs
+        self._offsets = offsets # x offset of every character and the end of the line.
+        self.width = width # Without trailing white space.
+        self.naturalWidth = width # Width before justification.
+        self._trailingWhiteSpace = trailingWhiteSpace
+        self.ascent = ascent
+        self.descent = descent
+        self.leading = leading
+        self.hyphenated = False # True if the line ends with a hyphen, included in self.width.
+
+    def __repr__(self):
+        return '[%s #%d Glyphs:%d Runs:%d]' % (self.__class__.__name__, self.lineIndex, self.glyphCount,
+            len(self.runs))
+
+    def getIndexForPosition(self, (x, y)):
+        u"""Answer the string index of the caret position closest to *x*."""
+        offsets = self._offsets
+        for index in range(self.glyphCount):
+            if x < (offsets[index] + offsets[index+1]) / 2:
+                return self.iStart + index
+        return self.iStart + self.glyphCount
+
+    def getOffsetForStringIndex(self, i):
+        u"""Answer the z position that is closest to glyph string index i. If i is out of bounds,
+        then answer the closest x position (left and right side of the string)."""
+        return self._offsets[min(max(0, i - self.iStart), self.glyphCount)]
+
+    def _get_stringIndex(self):
+        return self.iStart
+    stringIndex = property(_get_stringIndex)
+
+    def _get_imageBounds(self):
+        u"""Property that answers the bounding box of the line, estimated from the typographic bounds."""
+        return 0, -self.descent, self.width, self.ascent + self.descent
+    imageBounds = property(_get_imageBounds)
+
+    def _get_bounds(self):
+        u"""Property that returns the typographic bounds (width, ascent, descent, leading) of the line."""
+        return self.width + self._trailingWhiteSpace, self.ascent, self.descent, self.leading
+    bounds = property(_get_bounds)
+
+    def _get_trailingWhiteSpace(self):
+        return self._trailingWhiteSpace
+    trailingWhiteSpace = property(_get_trailingWhiteSpace)
+
+class LayoutFrame(object):
+    u"""Result of FontToolsLayout.layout: the lines, with positions relative to the bottom-left of the
+    box, and the string index of the overflow, None if all text fits."""
+    def __init__(self, lines, overflowIndex, length, w, h):
+        self.lines = lines
+        self.overflowIndex = overflowIndex
+        self.length = length # Length of the laid out text.
+        self.w = w # Width of the widest line
+        self.h = h # Height of the lines, including paragraph spacing.
+
+    def __repr__(self):
+        return '[%s lines=%d overflow=%s]' % (self.__class__.__name__, len(self.lines), self.overflowIndex)
+
+#   L A Y O U T
+
+class FontToolsLayout(object):
+    u"""Text layout from the font files, without DrawBot. Runs without font attribute use *defaultFont*,
+    runs without font size use *fontSize*. The lines of the paragraphs are broken by *lineBreaker*,
+    default is the GreedyBreaker (see toolbox.linebreaking). If *hyphenation* is True, then paragraphs
+    are hyphenated in the language of their first run, unless the run has hyphenation False."""
+    def __init__(self, defaultFont=None, fontSize=DEFAULT_FONT_SIZE, lineBreaker=None, hyphenation=False):
+        self.defaultFont = defaultFont
+        self.fontSize = fontSize
+        self.lineBreaker = lineBreaker or GreedyBreaker()
+        self.hyphenation = hyphenation
+
+    def __repr__(self):
+        return '[%s]' % self.__class__.__name__
+
+    def getGlyphAdvances(self, fs):
+        u"""Answer (text, advances, infos, runIndices) of *fs*, with the advance in points of every character,
+        including tracking and kerning with the next character of the same run."""
+        text = []
+        advances = []
+        runIndices = []
+        infos = []
+        for runIndex, (t, attributes) in enumerate(fs2LayoutRuns(fs)):
+            font = attributes.get('font') or self.defaultFont
+            assert font is not None, 'Text run "%s" has no font' % t
+            metrics = getFontMetrics(font)
+            fontSize = attributes.get('fontSize') or self.fontSize
+            infos.append(RunInfo(attributes, metrics, fontSize))
+            runAdvances = metrics.getAdvances(fontSize)
+            tracking = attributes.get('tracking') or 0
+            kerning = metrics.kerning
+            kerningScale = fontSize / metrics.unitsPerEm
+            prevGlyphName = None
+            for c in t:
+                advance = runAdvances.get(c)
+                if advance is None:
+                    advance = metrics.getAdvance(c, fontSize)
+                if kerning:
+                    glyphName = metrics.getGlyph(c)[0]
+                    if prevGlyphName is not None:
+                        advances[-1] += kerning.get((prevGlyphName, glyphName), 0) * kerningScale
+                    prevGlyphName = glyphName
+                text.append(c)
+                advances.append(advance + tracking)
+                runIndices.append(runIndex)
+        return u''.join(text), advances, infos, runIndices
+
+    def getHyphenation(self, text, start, end, info):
+        u"""Answer (positions, hyphenWidth) of the paragraph text[start:end] with the RunInfo *info* of its
+        first run. Answer None if the paragraph is not hyphenated."""
+        hyphenation = self.hyphenation if info.hyphenation is None else info.hyphenation
+        if not hyphenation or not info.language:
+            return None
+        hyphenator = getHyphenator(info.language)
+        if hyphenator is None: # No patterns for this language.
+            return None
+        return hyphenator.getTextPositions(text, start, end), info.metrics.getAdvance(u'-', info.fontSize)
+
+    def layout(self, fs, w, h=None):
+        u"""Answer the LayoutFrame of *fs* in a box of width *w* and height *h*. If *h* is None, then the
+        height is unlimited."""
+        text, advances, infos, runIndices = self.getGlyphAdvances(fs)
+        # Paragraphs, ending with their new line character.
+        paragraphs = []
+        start = 0
+        for index, c in enumerate(text):
+            if c in NEW_LINES:
+                paragraphs.append((start, index + 1))
+                start = index + 1
+        if start < len(text) or not paragraphs:
+            paragraphs.append((start, len(text)))
+
+        lines = []
+        top = 0 # Distance of the top of the next line from the top of the box.
+        maxW = 0
+        overflowIndex = None
+        for paragraphIndex, (start, end) in enumerate(paragraphs):
+            info = infos[runIndices[start]] if start < len(text) else None
+            if info is None: # Empty text
+                break
+            right = w + info.tailIndent if info.tailIndent <= 0 else info.tailIndent
+            def getWidth(isFirstLine):
+                if isFirstLine:
+                    return right - info.firstLineIndent
+                return right - info.indent
+            if lines:
+                top += info.paragraphTopSpacing
+            hyphenation = self.getHyphenation(text, start, end, info)
+            paragraphLines = self.lineBreaker.breakParagraph(text, advances, start, end, getWidth, hyphenation)
+            hyphenPositions = set(hyphenation[0]) if hyphenation is not None else ()
+            for lineIndex, (lineStart, lineEnd) in enumerate(paragraphLines):
+                isFirstLine = lineIndex == 0
+                isLastLine = lineIndex == len(paragraphLines) - 1
+                line = self._makeLine(text, advances, infos, runIndices, lineStart, lineEnd, len(lines))
+                if not isLastLine and lineEnd in hyphenPositions:
+                    line.hyphenated = True
+                    line.width += hyphenation[1]
+                    line.naturalWidth = line.width
+                lineInfo = infos[runIndices[lineStart]]
+                if info.lineHeight:
+                    lineHeight = info.lineHeight
+                    baseline = lineHeight - line.descent
+                else:
+                    lineHeight = line.ascent + line.descent + line.leading
+                    baseline = line.ascent
+                if h is not None and top + lineHeight > h + 0.01:
+                    overflowIndex = lineStart
+                    break
+                left = info.firstLineIndent if isFirstLine else info.indent
+                available = right - left
+                if info.align == RIGHT:
+                    line.x = left + available - line.width
+                elif info.align == CENTER:
+                    line.x = left + (available - line.width) / 2
+                else:
+                    line.x = left
+                    if info.align == JUSTIFIED and not isLastLine:
+                        self._justifyLine(line, text, available)
+                line.y = -(top + baseline) # Relative to the top, set to bottom origin below.
+                line.baselineShift = lineInfo.baselineShift
+                maxW = max(maxW, line.x + line.width)
+                lines.append(line)
+                top += lineHeight
+            if overflowIndex is not None:
+                break
+            top += info.paragraphBottomSpacing
+        if h is None:
+            h = top
+        for line in lines:
+            line.y += h
+        return LayoutFrame(lines, overflowIndex, len(text), maxW, top)
+
+    def _makeLine(self, text, advances, infos, runIndices, lineStart, lineEnd, lineIndex):
+        offsets = [0]
+        x = 0
+        for index in range(lineStart, lineEnd):
+            x += advances[index]
+            offsets.append(x)
+        trailingStart = lineEnd
+        while trailingStart > lineStart and (text[trailingStart-1] in WHITE_SPACE or text[trailingStart-1] in NEW_LINES):
+            trailingStart -= 1
+        width = offsets[trailingStart - lineStart]
+        runs = []
+        ascent = descent = leading = 0
+        runStart = lineStart
+        for index in range(lineStart, lineEnd + 1):
+            if index == lineEnd or runIndices[index] != runIndices[runStart]:
+                info = infos[runIndices[runStart]]
+                ascent = max(ascent, info.ascent)
+                descent = max(descent, info.descent)
+                leading = max(leading, info.lineGap)
+                positions = [(offsets[i - lineStart], info.baselineShift) for i in range(runStart, index)]
+                runAdvances = [(advances[i], 0) for i in range(runStart, index)]
+                runs.append(LayoutRun(info, len(runs), text[runStart:index], runStart, positions, runAdvances))
+                runStart = index
+        return LayoutLine(text[lineStart:lineEnd], lineStart, lineIndex, runs, offsets, width,
+            x - width, ascent, descent, leading)
+
+    def _justifyLine(self, line, text, available):
+        u"""Distribute the remaining space of *line* over the white space between the words. The space is
+        negative if the line breaker shrinks the white space of the line."""
+        spaces = [index for index, c in enumerate(line.string[:len(line.string.rstrip())]) if c in WHITE_SPACE]
+        if not spaces or line.width == available:
+            return
+        extra = (available - line.width) / len(spaces)
+        offsets = line._offsets
+        shift = 0
+        spaces = set(spaces)
+        for index in range(len(offsets) - 1):
+            offsets[index] += shift
+            if index in spaces:
+                shift += extra
+        offsets[-1] += shift
+        line.width = available
+        for run in line.runs:
+            run.positions = [(offsets[i - line.iStart], y) for i, (_, y) in zip(run.stringIndices, run.positions)]
+
+    def getTextLines(self, fs, w, h, originTop=False):
+        u"""Answer the list of LayoutLine instances of *fs* that fit in the box (w, h). If *originTop* is
+        True, then the y positions are from the top of the box."""
+        lines = self.layout(fs, w, h).lines
+        if originTop:
+            for line in lines:
+                line.y = h - line.y
+        return lines
+
+    def getDrawRuns(self, fs, w, h):
+        u"""Answer the list of (x, y, text, attributes) of the runs of *fs* that fit in the box (w, h),
+        with the position of their baseline relative to the bottom-left of the box. Drawing the text of
+        the runs at these positions, e.g. by DrawBot text(), shows the lines as they are measured by
+        self.getTextSize and self.getOverflow, instead of broken again by CoreText. The runs of justified
+        lines are split into words, each at its position in the line. Hyphenated lines end with a run of
+        the hyphen, as measured by the layout."""
+        drawRuns = []
+        for line in self.layout(fs, w, h).lines:
+            justified = line.width != line.naturalWidth
+            attributes = None # Attributes of the last run of the line, also used for the hyphen.
+            for run in line.runs:
+                text = run.string.rstrip(u''.join(NEW_LINES))
+                if not text:
+                    continue
+                info = run.info
+                attributes = dict([(name, info.attributes[name]) for name in DRAW_ATTRIBUTES
+                    if info.attributes.get(name) is not None])
+                attributes['font'] = info.metrics.font.path
+                attributes['fontSize'] = info.fontSize
+                starts = [0]
+                if justified: # The white space is stretched or shrunk, start a part after every word.
+                    starts += [index for index in range(1, len(text))
+                        if text[index-1] in WHITE_SPACE and not text[index] in WHITE_SPACE]
+                for start, end in zip(starts, starts[1:] + [len(text)]):
+                    drawRuns.append((line.x + run.positions[start][0], line.y, text[start:end], attributes))
+            if line.hyphenated and attributes is not None: # The hyphen is not in the text, only in line.width.
+                drawRuns.append((line.x + line.getOffsetForStringIndex(line.iStart + line.glyphCount), line.y,
+                    u'-', attributes))
+        return drawRuns
+
+    def getTextSize(self, fs, w=None):
+        u"""Answer (w, h) of *fs*, laid out in width *w*. If *w* is None, the width is unlimited."""
+        frame = self.layout(fs, w or XXXL)
+        return frame.w, frame.h
+
+    def getOverflow(self, fs, w, h):
+        u"""Answer the part of *fs* that does not fit in the box (w, h), in the same type as *fs*."""
+        frame = self.layout(fs, w, h)
+        if frame.overflowIndex is None:
+            return sliceFS(fs, frame.length) # Empty
+        return sliceFS(fs, frame.overflowIndex)
+
+    def getBaseLines(self, fs, box):
+        u"""Answer a list of (x,y) positions of all line starts in the box."""
+        x, y, w, h = box
+        return [(x + line.x, y + line.y) for line in self.layout(fs, w, h).lines]
+
+    def textPositionSearch(self, fs, w, h, search):
+        u"""Answer the list of (line, (x, y, w, h)) rectangles of the parts of the matches of the regular
+        expression *search* in the lines of *fs* in the box (w, h)."""
+        lines = self.layout(fs, w, h).lines
+        text = u''.join([line.string for line in lines])
+        rectangles = []
+        for found in re.finditer(search, text):
+            for line in lines:
+                lineEnd = line.iStart + line.glyphCount
+                if found.end() <= line.iStart or found.start() >= lineEnd:
+                    continue
+                minx = line.getOffsetForStringIndex(max(found.start(), line.iStart))
+                maxx = line.getOffsetForStringIndex(min(found.end(), lineEnd))
+                rectangles.append((line, (line.x + minx, line.y - line.descent, maxx - minx,
+                    line.ascent + line.descent)))
+        return rectangles
+
+TEXT_LAYOUTS = {} # Name --> text layout instance
+
+def registerTextLayout(name, layout):
+    u"""Register the text *layout* by *name*, for the css('textLayout') of text boxes."""
+    TEXT_LAYOUTS[name] = layout
+
+def getTextLayout(name):
+    u"""Answer the registered text layout of *name*."""
+    assert name in TEXT_LAYOUTS, 'Unknown text layout "%s"' % name
+    return TEXT_LAYOUTS[name]
+
+registerTextLayout(FONTTOOLS_LAYOUT, FontToolsLayout())
+registerTextLayout(TOTAL_FIT_LAYOUT, FontToolsLayout(lineBreaker=TotalFitBreaker()))
+registerTextLayout(HYPHENATED_LAYOUT, FontToolsLayout(lineBreaker=TotalFitBreaker(), hyphenation=True))
+
+def benchmarkLayout(fs, w, h=None, count=10, layout=None):
+    u"""Lay out *fs* in the box (w, h) *count* times with *layout* (default is the FontToolsLayout).
+    The first layout fills the glyph caches. Answer dict(first, average, lines, glyphs), with the times
+    in seconds."""
+    layout = layout or getTextLayout(FONTTOOLS_LAYOUT)
+    startTime = time()
+    frame = layout.layout(fs, w, h)
+    first = time() - startTime
+    startTime = time()
+    for _ in range(count):
+        layout.layout(fs, w, h)
+    return dict(first=first, average=(time() - startTime) / max(1, count), lines=len(frame.lines),
+        glyphs=sum([line.glyphCount for line in frame.lines]))
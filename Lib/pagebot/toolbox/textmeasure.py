@@ -0,0 +1,144 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     textmeasure.py
+#
+#     Memoized text measurements, used by TextBox.getTextSize, TextBox.getOverflow
+#     and the elastic height of text boxes. The DrawBot textSize and textOverflow
+#     results are cached by the content hash of the formatted string (text and
+#     all attributes of its runs, see fsHash) and the size of the box, with
+#     least recently used eviction. For the overflow only the string index where
+#     it starts is cached, the overflow is sliced from the string when answered.
+#     Text boxes keep the content hash of their string until it is changed by
+#     TextBox.fs or TextBox.appendString.
+#
+import hashlib
+from collections import OrderedDict
+
+try:
+    from drawBot import textSize, textOverflow
+except ImportError: # Headless, only measurements by a layout of toolbox.textlayout.
+    textSize = textOverflow = None
+
+from pagebot.style import LEFT
+from pagebot.toolbox.textlayout import fsLength, sliceFS
+
+def fsHash(fs):
+    u"""Answer the hex md5 of the text and the attributes of all runs of the FormattedString *fs*.
+    Plain strings answer the hash of their text, lists of (text, attributes) runs the hash of their
+    text and plain attributes."""
+    md5 = hashlib.md5()
+    if isinstance(fs, basestring):
+        md5.update(fs.encode('utf-8'))
+        return md5.hexdigest()
+    if isinstance(fs, (list, tuple)): # Runs, see toolbox.textlayout
+        for text, attributes in fs:
+            md5.update(text.encode('utf-8'))
+            md5.update('\x00%r\x01' % sorted(attributes.items()))
+        return md5.hexdigest()
+    attrString = fs.getNSObject()
+    s = attrString.string()
+    index = 0
+    while index < len(s):
+        attrs, (start, length) = attrString.attributesAtIndex_effectiveRange_(index, None)
+        md5.update(unicode(s[start:start+length]).encode('utf-8'))
+        for name in sorted(attrs.keys()):
+            value = attrs[name]
+            if name == 'NSFont': # Name, size, OpenType features and fallback fonts of the font descriptor.
+                value = value.fontDescriptor().fontAttributes()
+            md5.update(u'\x00%s=%s' % (name, value))
+        md5.update('\x01')
+        index = start + length
+    return md5.hexdigest()
+
+class TextMeasureCache(object):
+    u"""Least recently used cache of text measurements, keyed by (kind, fsHash, box size). Counts the
+    hits, misses and evictions of all lookups."""
+    def __init__(self, maxSize=4096):
+        self.maxSize = maxSize
+        self._values = OrderedDict()
+        self.resetStats()
+
+    def __repr__(self):
+        return '[%s size=%d hits=%d misses=%d]' % (self.__class__.__name__, len(self._values),
+            self.hits, self.misses)
+
+    def __len__(self):
+        return len(self._values)
+
+    def clear(self):
+        u"""Remove all cached measurements."""
+        self._values.clear()
+
+    def resetStats(self):
+        u"""Reset the hit, miss and eviction counters to 0."""
+        self.hits = self.misses = self.evictions = 0
+
+    def getStats(self):
+        u"""Answer the dictionary with the size and the counters of the cache."""
+        return dict(size=len(self._values), maxSize=self.maxSize, hits=self.hits, misses=self.misses,
+            evictions=self.evictions)
+
+    def _get(self, key, measure, *args):
+        u"""Answer the cached value of *key*. If it does not exist, then answer and cache the result of
+        measure(*args)."""
+        values = self._values
+        if key in values:
+            self.hits += 1
+            value = values.pop(key)
+        else:
+            self.misses += 1
+            value = measure(*args)
+            if len(values) >= self.maxSize:
+                values.popitem(last=False) # Remove the least recently used measurement.
+                self.evictions += 1
+        values[key] = value # Most recently used is last.
+        return value
+
+    def textSize(self, fs, w, key=None, layout=None):
+        u"""Answer the (w, h) of *fs* with width *w*. Optional *key* is the fsHash of *fs*, if it is
+        already known by the caller. Optional *layout* is the text layout instead of CoreText,
+        see toolbox.textlayout."""
+        if layout is None:
+            return self._get(('size', key or fsHash(fs), w), _textSize, fs, w)
+        return self._get(('size', key or fsHash(fs), w, layout), layout.getTextSize, fs, w)
+
+    def textOverflow(self, fs, w, h, key=None, layout=None):
+        u"""Answer the overflow of *fs* in a box of (w, h), as new slice of *fs*, so the caller can change it.
+        Optional *key* is the fsHash of *fs*, if it is already known by the caller. Optional *layout* is the
+        text layout instead of CoreText, see toolbox.textlayout."""
+        if layout is None:
+            index = self._get(('overflow', key or fsHash(fs), w, h), _overflowIndex, _textOverflow, fs, w, h)
+        else:
+            index = self._get(('overflow', key or fsHash(fs), w, h, layout), _overflowIndex, layout.getOverflow, fs, w, h)
+        if index is None: # No overflow answered by the measurement.
+            return None
+        return sliceFS(fs, index)
+
+def _textSize(fs, w):
+    return textSize(fs, width=w)
+
+def _textOverflow(fs, w, h):
+    return textOverflow(fs, (0, 0, w, h), LEFT)
+
+def _overflowIndex(getOverflow, fs, w, h):
+    u"""Answer the string index in *fs* where the overflow of getOverflow(fs, w, h) starts. The overflow
+    is the end of *fs*, so its length tells the index. Answer None if the overflow is None."""
+    overflow = getOverflow(fs, w, h)
+    if overflow is None:
+        return None
+    return fsLength(fs) - fsLength(overflow)
+
+textMeasureCache = TextMeasureCache()
+
+def getTextMeasureStats():
+    u"""Answer the dictionary with the size, hits, misses and evictions of the text measurement cache."""
+    return textMeasureCache.getStats()
@@ -0,0 +1,122 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     workers.py
+#
+#     Worker processes for Document.solve(workers=n), View.exportParallel and
+#     Typesetter.typesetChapters. A process that is forked after DrawBot,
+#     AppKit, Quartz or CoreText are loaded is not safe on macOS, so the
+#     workers are new Python processes, not forks. The main process saves the
+#     document as snapshot (see toolbox.snapshot) and every worker restores its
+#     own copy from it, before running its share of the jobs. Jobs and results
+#     are exchanged as pickled files, so they must be plain data.
+#
+#     results = runWorkers(solvePages, jobs, 4, doc) # [solvePages(docCopy, job) for job in jobs]
+#
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+import cPickle
+
+# Python that runs the workers. Set it to the path of a Python interpreter if sys.executable is an
+# application that embeds Python, such as DrawBot.
+WORKER_PYTHON = sys.executable
+
+def getObjectPath(obj):
+    u"""Answer the (module name, name) of the module level function or class *obj*, as plain data."""
+    return obj.__module__, obj.__name__
+
+def getObject(path):
+    u"""Answer the function or class of the (module name, name) *path*."""
+    moduleName, name = path
+    module = __import__(moduleName, {}, {}, [name])
+    return getattr(module, name)
+
+def _writePickle(data, path):
+    f = open(path, 'wb')
+    cPickle.dump(data, f, 2)
+    f.close()
+
+def _readPickle(path):
+    f = open(path, 'rb')
+    data = cPickle.load(f)
+    f.close()
+    return data
+
+def runWorkers(function, jobs, workers, doc=None, snapshot=None):
+    u"""Answer the list of function(doc, job) for all *jobs*, run by at most *workers* new processes.
+    The *function* must be defined on module level, *jobs* and the results must be plain data. If *doc*
+    is defined, then every worker calls *function* with its own copy of *doc*, restored from a snapshot.
+    Otherwise the doc argument is None. Optional *snapshot* is the snapshot data of *doc*, if the caller
+    already made it. Raise a ValueError if *function* or the class of *doc* is defined in a script that
+    runs as __main__, the workers cannot import it. Raise a RuntimeError if a worker fails."""
+    from pagebot.toolbox.snapshot import document2Snapshot, writeSnapshot
+
+    for obj in (function, doc.__class__ if doc is not None else None):
+        if obj is not None and obj.__module__ == '__main__':
+            raise ValueError('[runWorkers] Workers cannot import %s from __main__, define it in a module.' % obj.__name__)
+    jobs = list(jobs)
+    if not jobs:
+        return []
+    workers = max(1, min(workers, len(jobs)))
+    folder = tempfile.mkdtemp()
+    processes = []
+    try:
+        snapshotPath = documentClassPath = None
+        if doc is not None:
+            snapshotPath = os.path.join(folder, 'document.pbsnap')
+            writeSnapshot(snapshot or document2Snapshot(doc), snapshotPath)
+            documentClassPath = getObjectPath(doc.__class__)
+        env = dict(os.environ) # Workers import the same modules as this process.
+        env['PYTHONPATH'] = os.pathsep.join([path or os.getcwd() for path in sys.path])
+        for workerIndex in range(workers):
+            jobPath = os.path.join(folder, 'jobs-%03d.pickle' % workerIndex)
+            resultPath = os.path.join(folder, 'results-%03d.pickle' % workerIndex)
+            logPath = os.path.join(folder, 'output-%03d.txt' % workerIndex)
+            _writePickle((getObjectPath(function), snapshotPath, documentClassPath, jobs[workerIndex::workers]), jobPath)
+            log = open(logPath, 'wb')
+            process = subprocess.Popen([WORKER_PYTHON, '-m', __name__, jobPath, resultPath], env=env,
+                stdout=log, stderr=subprocess.STDOUT)
+            log.close()
+            processes.append((process, resultPath, logPath))
+        results = [None] * len(jobs)
+        for workerIndex, (process, resultPath, logPath) in enumerate(processes):
+            process.wait()
+            if process.returncode != 0 or not os.path.exists(resultPath):
+                f = open(logPath, 'rb')
+                output = f.read()
+                f.close()
+                raise RuntimeError('[runWorkers] Worker %d of %s failed:\n%s' % (workerIndex, function.__name__, output))
+            results[workerIndex::workers] = _readPickle(resultPath)
+    finally:
+        for process, _, _ in processes: # Stop the other workers if one failed.
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+        shutil.rmtree(folder)
+    return results
+
+def runJobs(jobPath, resultPath):
+    u"""Run the jobs in the pickled file *jobPath* and write the pickled list of results to *resultPath*.
+    Called by the worker processes of runWorkers."""
+    functionPath, snapshotPath, documentClassPath, jobs = _readPickle(jobPath)
+    doc = None
+    if snapshotPath is not None:
+        doc = getObject(documentClassPath).loadSnapshot(snapshotPath)
+    function = getObject(functionPath)
+    results = [function(doc, job) for job in jobs]
+    _writePickle(results, resultPath + '.tmp')
+    os.rename(resultPath + '.tmp', resultPath) # Only complete results are read.
+
+if __name__ == '__main__':
+    runJobs(*sys.argv[1:])
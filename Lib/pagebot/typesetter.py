@@ -25,8 +25,11 @@ except ImportError:
     print 'Typesetter: Install Python markdown from https://pypi.python.org/pypi/Markdown'
     markdown = None
 
-from pagebot import newFS, getMarker
+from pagebot import newFS, getMarker, MARKER_PATTERN
 from pagebot.elements import Galley, Image, Ruler, TextBox
+from pagebot.readers import iterMD, iterXML, iterNodeEvents
+from pagebot.toolbox.paralleltypeset import typesetChapters, FOOTNOTE_NUMBER
+from pagebot.toolbox.profiling import profiled
 
 class Typesetter(object):
 
@@ -58,55 +61,49 @@ class Typesetter(object):
         # Stack of graphic state as cascading styles. Last is template for the next.
         self.gState = [] 
         self.tagHistory = []
+        self.tagStack = [] # Tags of the nodes that are currently typeset, from root to parent of the current node.
+        self._nodeStyles = {} # (id(parentStyle), tag path) --> (parentStyle, merged style), see self.getNodeStyle()
+        self._nodeStylesKey = None # (SelectorIndex, stylesVersion) of the document for which self._nodeStyles is valid.
+        # If True, footnote reference numbers are typeset as markers, renumbered by self.typesetChapters()
+        self.markFootnoteNumbers = False
 
     def getTextBox(self, e=None):
         u"""Answer the current text box, if the width fits the current style.
         If style is omitted, then always answer the current latest text box."""
         return self.galley.getTextBox(e)
 
-    def node_h1(self, node, e):
+    # Tags without a node_<tag> hook, such as <p>, <em> and <a>, are typeset as part of the stream of nodes,
+    # without recursion. Optional start_<tag>(node, e) hooks are called before the node is typeset, when
+    # its text and child nodes may not be available yet. Hooks node_<tag>(node, e) get the complete node,
+    # and must typeset it themselves, e.g. by self.typesetNode(node, e).
+
+    def start_h1(self, node, e):
         u"""Collect the page-node-pageNumber connection."""
         # Add line break to whatever style/content there was before.
         # Add invisible h1-marker in the string, to be retrieved by the composer.
         #headerId = self.document.addTocNode(node) # Store the node in the self.document.toc for later TOC composition.
         #self.galley.appendString(getMarker(node.tag, headerId)) # Link the node tag with the TOC headerId.
-        # Typeset the block of the tag. Pass on the cascaded style, as we already calculated it.
-        self.typesetNode(node, e)
 
-    def node_h2(self, node, e):
+    def start_h2(self, node, e):
         u"""Collect the page-node-pageNumber connection."""
         # Add line break to whatever style/content there was before.
         # Add invisible h2-marker in the string, to be retrieved by the composer.
         #headerId = self.document.addTocNode(node) # Store the node in the self.document.toc for later TOC composition.
         #self.galley.appendString(getMarker(node.tag, headerId)) # Link the node tag with the TOC headerId.
-        # Typeset the block of the tag. Pass on the cascaded style, as we already calculated it.
-        self.typesetNode(node, e)
 
-    def node_h3(self, node, e):
+    def start_h3(self, node, e):
         u"""Collect the page-node-pageNumber connection."""
         # Add line break to whatever style/content there was before.
         # Add invisible h3-marker in the string, to be retrieved by the composer.
         #headerId = self.document.addTocNode(node) # Store the node in the self.document.toc for later TOC composition.
         #self.galley.append(getMarker(node.tag, headerId)) # Link the node tag with the TOC headerId.
-        # Typeset the block of the tag. Pass on the cascaded style, as we already calculated it.
-        self.typesetNode(node, e)
 
-    def node_h4(self, node, e):
+    def start_h4(self, node, e):
         u"""Collect the page-node-pageNumber connection."""
         # Add line break to whatever style/content there was before.
         # Add invisible h4-marker in the string, to be retrieved by the composer.
         #headerId = self.document.addTocNode(node) # Store the node in the self.document.toc for later TOC composition.
         #self.galley.append(getMarker(node.tag, headerId)) # Link the node tag with the TOC headerId.
-        # Typeset the block of the tag. Pass on the cascaded style, as we already calculated it.
-        self.typesetNode(node, e)
-
-    def node_em(self, node, e):
-        u"""Handle the <em> tag"""
-        self.typesetNode(node, e)
-
-    def node_p(self, node, e):
-        u"""Handle the <p> tag."""
-        self.typesetNode(node, e)
 
     def node_hr(self, node, e):
         u"""Add Ruler instance to the Galley."""
@@ -143,11 +140,6 @@ class Typesetter(object):
         fs = newFS(s, e, style=brStyle)
         self.galley.appendString(fs) # Add newline in the current setting of FormattedString
         """
-    def node_a(self, node, e):
-        u"""Ignore links, but process the block"""
-        # Typeset the block of the tag. Pass on the cascaded style, as we already calculated it.
-        self.typesetNode(node, e)
-
     def node_sup(self, node, e):
         u"""Collect footnote references on their page number.
         And typeset the superior footnote index reference."""
@@ -160,9 +152,11 @@ class Typesetter(object):
                 index = len(footnotes)+1
                 # Footnode['p'] content node will be added if <div class="footnote">...</div> is detected.
                 footnotes[index] = dict(nodeId=nodeId, index=index, node=node, e=e, p=None)
-                # Add invisible mark, so we can scan the text after page composition to find
-                # on which page it ended up.
-                self.galley.appendString(getMarker('footnote', index))
+                # Add marker to the side-table of the text, so we can find after page composition
+                # on which page it ended up, see Document.findMarkers.
+                self.galley.appendMarker('footnote', index)
+            if self.markFootnoteNumbers and node.text:
+                node.text = MARKER_PATTERN % (FOOTNOTE_NUMBER, node.text)
 
         # Typeset the block of the tag. Pass on the cascaded style, as we already calculated it.
         self.typesetNode(node, e)
@@ -181,7 +175,7 @@ class Typesetter(object):
                 assert not nodeId in literatureRefs
                 # Make literature reference entry. Content <p> and split fields will be added later.
                 literatureRefs[index] = dict(nodeId=nodeId, node=node, e=e, p=None, pageIds=[])
-                self.galley.appendString(getMarker('literature', index))
+                self.galley.appendMarker('literature', index)
 
         # Typeset the block of the tag. Pass on the cascaded style, as we already calculated it.
         self.typesetNode(node, e)
@@ -220,12 +214,10 @@ class Typesetter(object):
 
         return result
 
-    def node_li(self, node, e):
+    def start_li(self, node, e):
         u"""Generate bullet/Numbered list item."""
         bulletString = newFS(self.doc.css('listBullet')) # Get styled string with bullet.
         self.galley.appendString(bulletString) # Append the bullet as defined in the style.
-        # Typeset the block of the tag. Pass on the cascaded style, as we already calculated it.
-        self.typesetNode(node, e)
 
     def node_img(self, node, e):
         u"""Process the image. Find nearby empty space on the page to place it,
@@ -323,34 +315,35 @@ class Typesetter(object):
         return s
 
     def getMatchingStyleNames(self, tag):
-        parents = self.TAG_MATCHING[tag]
-        revHistory = self.tagHistory[:]
-        revHistory.reverse()
-        matches = []
-        for n in range(len(revHistory)):
-            styleName = revHistory[:n+1]
-            styleName.reverse()
-            styleName = ' '.join(styleName)
-            if styleName in self.doc.styles:
-                matches.append(styleName)
-        #print tag, parents, revHistory, matches
-        #print tag, matches
-        matches.reverse()
-        return matches
+        u"""Answer the names of the document styles that match the end of the tag path self.tagStack + [tag],
+        longest first. E.g. for the path ['document', 'h1', 'em'] these can be 'h1 em' and 'em'."""
+        return self.doc.getSelectorIndex().getMatches(self.tagStack + [tag])
 
     def getNodeStyle(self, tag):
-        u"""Make a copy of the top of the style graphics state and mew *style* into it. Answer the new style."""
+        u"""Make a copy of the top of the style graphics state and merge the longest matching style of *tag*
+        into it. Answer the new style. The merged style is memoized by the tag path and the parent style,
+        so the answered style is shared and should not be changed by the caller."""
         if self.peekStyle() is None: # Not an initialized stack, use doc.rootStyle as default.
             self.pushStyle(self.doc.getRootStyle()) # Happens if calling directly, without check on e
-        mergedStyle = copy.copy(self.peekStyle())
+        nodeStylesKey = self.doc.getSelectorIndex(), self.doc.stylesVersion
+        if nodeStylesKey != self._nodeStylesKey: # Styles of the document changed.
+            self._nodeStyles = {}
+            self._nodeStylesKey = nodeStylesKey
+        parentStyle = self.peekStyle()
+        key = id(parentStyle), tuple(self.tagStack), tag # The cached parentStyle keeps its id unique.
+        cached = self._nodeStyles.get(key)
+        if cached is not None:
+            return cached[1]
+        mergedStyle = copy.copy(parentStyle)
         # Find the best matching style for tag on order of relevance, 
-        # considering the possible HTML tag parents and the history.
+        # considering the possible HTML tag parents.
         for styleName in self.getMatchingStyleNames(tag):
             nodeStyle = self.doc.getStyle(styleName)
             if nodeStyle is not None:
                 for name, value in nodeStyle.items():
                     mergedStyle[name] = value
                 break
+        self._nodeStyles[key] = parentStyle, mergedStyle
         return mergedStyle
 
     def typesetString(self, s, e=None, style=None):
@@ -361,70 +354,108 @@ class Typesetter(object):
         self.galley.appendString(fs)
         return fs
 
+    @profiled('typeset', lambda self, node, e=None: node.tag)
     def typesetNode(self, node, e=None):
-        u"""Recursively typeset the etree *node*, using a reference to element *e* or the cascading *style*.
+        u"""Typeset the etree *node*, using a reference to element *e* or the cascading *style*.
         If *e* is None, then the tag style is merged on top of the doc.rootStyle. If *e* is defined, then 
-        rootstyle of the stack starts with an empty dictionary, leaving root searching for the e.parent path."""
-
-        # Add this tag to the tag-hitstory line
-        self.addHistory(node.tag)
+        rootstyle of the stack starts with an empty dictionary, leaving root searching for the e.parent path.
+        The tree is walked with a stack, so deep nesting does not recurse. Only the child nodes that have
+        a node_<tag> hook are handled by a call to the hook."""
+        self.typesetEvents(iterNodeEvents(node), e)
+
+    @profiled('typeset', lambda self, path, e=None: path.split('/')[-1])
+    def typesetFile(self, path, e=None):
+        u"""Typeset the Markdown (.md) or XML file *path* as stream of events. The nodes are released
+        after they are typeset, so memory holds the current block instead of the whole document tree.
+        Nodes that are passed to hooks (e.g. footnote references) are kept by the references to them."""
+        if path.lower().endswith('.md'):
+            events = iterMD(path)
+        else:
+            events = iterXML(path)
+        self.typesetEvents(events, e, release=True)
+
+    def typesetChapters(self, paths, workers, e=None):
+        u"""Typeset the chapter files of *paths* by a pool of *workers* processes, each into its own Galley,
+        and append the chapters in order to self.galley. Footnotes and literature references are numbered
+        over all chapters, as if the files were typeset one after the other. Answer the list of statistics
+        per chapter: dict(path, time, pid, footnotes, literatureRefs, elements).
+        See pagebot.toolbox.paralleltypeset."""
+        return typesetChapters(self, paths, workers, e)
+
+    def _getNodeHook(self, tag):
+        u"""Answer the node_<tag> hook method of the tag, or None if there is no hook."""
+        if not isinstance(tag, basestring): # Comments and processing instructions.
+            return None
+        return getattr(self, 'node_'+tag, None)
+
+    def _typesetText(self, frame, e):
+        u"""Typeset the text of the node in *frame* that is complete now: the node text if no child nodes
+        were typeset yet, otherwise the tail of the last child node. Both use the style of the node."""
+        node, nodeStyle, pending = frame
+        if pending is None:
+            return
+        frame[2] = None # Text is typeset.
+        # XML-nodes are organized as: node - node.text - node.children - node.tail
+        # If there is no text or if the node does not have tail text, these are None.
+        if pending is node:
+            s = self._strip(node.text)
+        else:
+            s = pending.tail
+        if s: # Not None and still has content after stripping?
+            fs = newFS(s, e, nodeStyle)
+            self.galley.appendString(fs) # Add the new formatted string to the current flow textBox
 
+    def typesetEvents(self, events, e=None, release=False):
+        u"""Typeset the sequence of (event, node) *events*, where event is 'start' or 'end', as answered by
+        iterNodeEvents(node) or ElementTree.iterparse(path, events=('start', 'end')). The text of a node is
+        typeset at the start of its first child or at its end, the tail of a child at the start of the
+        next child or at the end of the parent, as these are complete by then in a stream. Child nodes with
+        a node_<tag> hook are collected until their end and then passed to the hook. Comments and processing
+        instructions are skipped, except for their tail. If *release* is True, then nodes are removed from
+        their parent after they are typeset."""
         # If e is undefined, then we make sure that the stack contains the doc.rootStyle on top.
         # If e is defined then root queries for style should follow the e.parent path. 
         if self.peekStyle() is None and e is not None:
             # Root of stack is empty style, to force searching on the e.parent line.
             self.pushStyle({}) # Define top level for styles.
-        nodeStyle = self.getNodeStyle(node.tag) # Merge found tag style with current top of stack
-        self.pushStyle(nodeStyle) # Push this merged style on the stack
-
-        # XML-nodes are organized as: node - node.text - node.children - node.tail
-        # If there is no text or if the node does not have tail text, these are None.
-        # Still we want to be able to add the prefix to the node.text, so then the text is changed to an empty string.
-        
-        nodeText = self._strip(node.text)
-        if nodeText: # Not None and still has content after stripping?
-            fs = newFS(nodeText, e, nodeStyle)
-            self.galley.appendString(fs) # Add the new formatted string to the current flow textBox
-        
-        # Type set all child node in the current node, by recursive call.
-        for child in node:
-            hook = 'node_'+child.tag
-            # Method will handle the styled body of the element, but not the tail.
-            if hasattr(self, hook):
-                # There is a hook for this node, let this method do the work.
-                getattr(self, hook)(child, e) # Hook must be able to derive styles from e.
-                # We are in tail mode now, but we don't know what happened in the child block.
+        frames = [] # Stack of [node, nodeStyle, pending], where pending is the node with text or tail to typeset.
+        hookNode = None # Node with a hook or comment, of which the events are skipped until its end.
+        for event, node in events:
+            if hookNode is not None:
+                if event != 'end' or node is not hookNode:
+                    continue # Node is part of the hook node, wait for its end.
+                hookNode = None
+                hook = self._getNodeHook(node.tag)
+                if hook is not None: # Otherwise a comment, of which only the tail is typeset.
+                    # Method will handle the styled body of the element, but not the tail.
+                    hook(node, e) # Hook must be able to derive styles from e.
+            elif event == 'start':
+                if frames:
+                    self._typesetText(frames[-1], e) # Text before this child node is complete.
+                    if self._getNodeHook(node.tag) is not None or not isinstance(node.tag, basestring):
+                        hookNode = node
+                        continue
+                startHook = getattr(self, 'start_%s' % node.tag, None)
+                if startHook is not None:
+                    startHook(node, e)
+                # Add this tag to the tag-hitstory line
+                self.addHistory(node.tag)
+                nodeStyle = self.getNodeStyle(node.tag) # Merge found tag style with current top of stack
+                self.pushStyle(nodeStyle) # Push this merged style on the stack
+                self.tagStack.append(node.tag) # Path of tags to match the styles of the child nodes.
+                frames.append([node, nodeStyle, node])
+                continue
             else:
-                # If no method hook defined, then just solve recursively. Child node will get the style.
-                self.typesetNode(child, e)
-            # XML-nodes are organized as: node - node.text - node.children - node.tail
-            # If there is no text or if the node does not have tail text, these are None.
-            # Still we want to be able to add the postfix to the tail, so then the tail is changed
-            # to empty string?
-            childTail = child.tail #self._strip(child.tail, postfix=self.getStyleValue('postfix', e, nodeStyle, ''))
-            if childTail: # Any tail left after stripping, then append to the galley.
-                fs = newFS(childTail, e, nodeStyle)
-                self.galley.appendString(fs)  # Add the tail formatted string to the galley.
-        
-        # Now restore the graphic state at the end of the element content processing to the
-        # style of the parent in order to process the tail text. Back to the style of the parent, 
-        # which was in nodeStyle.
-        self.popStyle()  
-
-        """
-        # If there is a postfix for the current state, then add that to the output.
-        postfix = style.get('postfix')
-        if not postfix and e is not None: # Do we have a style tree?
-            postfix = self._strip('', postfix= or e.css('postfix'))
-
-        # XML-nodes are organized as: node - node.text - node.children - node.tail
-        # If there is no text or if the node does not have tail text, these are None.
-        # Still we want to be able to add the postfix to the tail, so then the tail is changed to empty string.
-        nodeTail = self._strip(node.tail, postfix=postfix)
-        if nodeTail: # Something of a tail left after stripping?
-            fs = newFS(nodeTail, e, nodeStyle)
-            self.galley.appendString(fs) # Add to the current flow textBox
-        """
+                self._typesetText(frames.pop(), e) # Text or tail of the last child.
+                # Now restore the graphic state at the end of the element content processing to the
+                # style of the parent in order to process the tail text.
+                self.popStyle()  
+                self.tagStack.pop()
+            if frames: # The tail of node is typeset by the parent.
+                parent = frames[-1]
+                parent[2] = node
+                if release:
+                    parent[0].remove(node)
 
     def DEPRECATED_typesetFile(self, fileName, e=None, xPath=None):
         u"""Read the XML document and parse it into a tree of document-chapter nodes. Make the typesetter
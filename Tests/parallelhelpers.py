@@ -0,0 +1,39 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     parallelhelpers.py
+#
+#     Functions and conditions of the tests that run in worker processes. The
+#     workers import them by module path, so they cannot be defined in the
+#     test scripts, which are __main__ if they run by themselves.
+#
+from pagebot.conditions.condition import Condition
+
+class Fit2Function(Condition):
+    u"""Set the width of the element to the answer of the function *getWidth*. The function is not plain
+    data, so it is lost in a snapshot of the document."""
+    def __init__(self, getWidth, **kwargs):
+        Condition.__init__(self, **kwargs)
+        self.getWidth = getWidth
+
+    def test(self, e):
+        return e.w == self.getWidth(e)
+
+    def solve(self, e, score):
+        if not self.test(e):
+            e.w = self.getWidth(e)
+        self.addScore(self.test(e), e, score)
+
+def countElements(doc, pn):
+    return len(doc[pn].elements)
+
+def fail(doc, job):
+    raise ValueError('Failing job %s' % job)
@@ -0,0 +1,82 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     test_batch.py
+#
+#     Element.evaluateBatch answers the same score as Element.evaluate.
+#
+import random
+import unittest
+
+from pagebot.document import Document
+from pagebot.elements import newRect
+from pagebot.conditions import batch, Float2TopSide, Float2LeftSide
+from pagebot.conditions.batch import BATCH_TESTS
+from pagebot.toolbox.spatialindex import SpatialIndex
+
+class BatchTest(unittest.TestCase):
+
+    def newPage(self, seed, hidden):
+        random.seed(seed)
+        doc = Document(w=500, h=800, autoPages=1, originTop=seed % 2 == 0)
+        page = doc[0]
+        page.padding = 10
+        conditionClasses = sorted(BATCH_TESTS.keys(), key=lambda conditionClass: conditionClass.__name__)
+        for index in range(60):
+            x = random.choice((0, 10, 100, 250, random.randint(0, 500)))
+            y = random.choice((0, 10, 100, 400, random.randint(0, 800)))
+            conditions = [conditionClass() for conditionClass in random.sample(conditionClasses, 4)]
+            e = newRect(parent=page, x=x, y=y, w=random.choice((10, 50, 480)), h=random.choice((10, 50, 780)),
+                z=random.choice((0, 0, 1)), margin=random.choice((0, 0, 5)), conditions=conditions)
+            if hidden and index % 3 == 0:
+                e.show = False
+        return page
+
+    def assertSameScore(self, page):
+        scalar = page.evaluate()
+        batchScore = page.evaluateBatch()
+        self.assertEqual(batchScore.result, scalar.result)
+        self.assertEqual([(condition.__class__, id(e)) for condition, e in batchScore.fails],
+            [(condition.__class__, id(e)) for condition, e in scalar.fails])
+
+    @unittest.skipIf(batch.numpy is None, 'Batch evaluation needs NumPy')
+    def test_sameScore(self):
+        for seed in range(6):
+            self.assertSameScore(self.newPage(seed, False))
+
+    @unittest.skipIf(batch.numpy is None, 'Batch evaluation needs NumPy')
+    def test_hiddenSiblings(self):
+        for seed in range(6):
+            self.assertSameScore(self.newPage(seed, True))
+
+    @unittest.skipIf(batch.numpy is None, 'Batch evaluation needs NumPy')
+    def test_floatOnHiddenSiblings(self):
+        doc = Document(w=500, h=800, autoPages=1)
+        page = doc[0]
+        elements = []
+        for index in range(40):
+            elements.append(newRect(parent=page, w=50 + index % 3 * 20, h=40,
+                conditions=[Float2TopSide(), Float2LeftSide()]))
+        page.solve()
+        for e in elements[::4]: # Hidden elements still block the floating of the next ones.
+            e.show = False
+        self.assertEqual(len(page.evaluate().fails), 0)
+        self.assertSameScore(page)
+
+    @unittest.skipIf(batch.numpy is None, 'Batch evaluation needs NumPy')
+    def test_spatialIndex(self):
+        for seed in range(6):
+            page = self.newPage(seed, True)
+            page.spatialIndex = SpatialIndex(50)
+            self.assertSameScore(page)
+
+if __name__ == '__main__':
+    unittest.main()
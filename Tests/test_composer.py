@@ -0,0 +1,89 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     test_composer.py
+#
+#     Composer.compose flows the text of a galley through the text boxes of
+#     the pages, made from their template if necessary.
+#
+import unittest
+
+from pagebot.document import Document
+from pagebot.elements import newTextBox, newRect, Template, Galley
+from pagebot.composer import Composer
+from pagebot.toolbox.textflow import TextFlow
+from pagebot.toolbox.textmeasure import textMeasureCache
+from pagebot.toolbox.textlayout import fsLength, FONTTOOLS_LAYOUT
+
+from test_textflow import newRuns
+
+class ComposerTest(unittest.TestCase):
+
+    def newPage(self, **kwargs):
+        template = Template(w=500, h=800)
+        newTextBox([], parent=template, name='Box', x=50, y=50, w=200, h=300, nextElement='Box',
+            textLayout=FONTTOOLS_LAYOUT, **kwargs)
+        self.doc = Document(w=500, h=800, autoPages=0) # Keep the document, pages refer to it weakly.
+        return self.doc.newPage(template=template)
+
+    def newGalley(self, paragraphs):
+        galley = Galley()
+        runs = newRuns(0, paragraphs)
+        newTextBox(runs, parent=galley)
+        return galley, runs
+
+    def getBoxes(self):
+        return [self.doc[pn].getElementByName('Box') for pn in sorted(self.doc.pages)]
+
+    def test_newPages(self):
+        page = self.newPage(nextPage=1)
+        galley, runs = self.newGalley(4)
+        Composer(makeNewPage=True).compose(galley, page, 'Box')
+        boxes = self.getBoxes()
+        self.assertTrue(len(boxes) > 2)
+        self.assertEqual(u''.join([text for tb in boxes for text, _ in tb.fs]), runs[0][0])
+        for tb in boxes:
+            self.assertEqual(fsLength(tb.getOverflow()), 0)
+
+    def test_noNewPages(self):
+        page = self.newPage(nextPage=1)
+        galley, runs = self.newGalley(4)
+        rect = newRect(parent=galley, w=100, h=100)
+        Composer(makeNewPage=False).compose(galley, page, 'Box')
+        boxes = self.getBoxes()
+        self.assertEqual(len(boxes), 1)
+        self.assertTrue(0 < fsLength(boxes[0].fs) < fsLength(runs))
+        self.assertTrue(rect.parent is galley) # No boxes left, the rest of the galley is not placed.
+
+    def test_circularFlow(self):
+        page = self.newPage() # The next box of Box is Box on the same page.
+        galley, runs = self.newGalley(4)
+        Composer(makeNewPage=True).compose(galley, page, 'Box')
+        boxes = self.getBoxes()
+        self.assertEqual(len(boxes), 1)
+        self.assertTrue(0 < fsLength(boxes[0].fs) < fsLength(runs))
+
+    def test_chunkDoubling(self):
+        page = self.newPage()
+        tb = page.getElementByName('Box')
+        runs = newRuns(0, 4)
+        flow = TextFlow(runs, chunkSize=16)
+        textMeasureCache.clear()
+        textMeasureCache.resetStats()
+        end = flow.fill(tb, 0)
+        # Chunks of 16, 32, ... characters are measured until one overflows the box.
+        measurements = textMeasureCache.misses
+        self.assertTrue(16 << (measurements - 2) < end <= 16 << (measurements - 1))
+        self.assertEqual(flow.chunkSize, max(TextFlow.CHUNK_SIZE, 2 * end)) # Estimate for the next box.
+        self.assertEqual(flow.fill(tb, end), flow.fill(self.newPage().getElementByName('Box'), end))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     test_copyonwrite.py
+#
+#     Pages made from a template share the styles of the template elements
+#     until they change (see pagebot.style.CopyOnWriteStyle).
+#
+import unittest
+
+from pagebot.document import Document
+from pagebot.elements import newRect, Template
+from pagebot.style import CopyOnWriteStyle, getCopyOnWriteStats, resetCopyOnWriteStats
+
+class CopyOnWriteTest(unittest.TestCase):
+
+    def setUp(self):
+        self.template = Template(w=500, h=800)
+        self.rect = newRect(parent=self.template, name='Rect', x=10, y=20, w=100, h=50, fill=(1, 0, 0))
+        self.doc = Document(w=500, h=800, autoPages=0)
+        resetCopyOnWriteStats()
+
+    def newPageRect(self):
+        return self.doc.newPage(template=self.template).getElementByName('Rect')
+
+    def test_sharedUntilChanged(self):
+        rects = [self.newPageRect() for _ in range(3)]
+        for rect in rects:
+            self.assertTrue(isinstance(rect.style, CopyOnWriteStyle))
+            self.assertFalse(rect.style.materialized)
+        rects[0].x = 30
+        self.assertEqual((rects[0].x, rects[1].x, self.rect.x), (30, 10, 10))
+        self.assertEqual(getCopyOnWriteStats(), dict(clones=3, materialized=1))
+
+    def test_templateChange(self):
+        rect = self.newPageRect()
+        self.assertEqual((rect.x, rect.rootX, rect.css('fill')), (10, 10, (1, 0, 0)))
+        self.rect.x = 999
+        self.rect.style['fill'] = (0, 0, 1)
+        # The page keeps the values of the template when it was made, same as a copy.
+        self.assertEqual((rect.x, rect.rootX, rect.css('fill')), (10, 10, (1, 0, 0)))
+        self.assertEqual(rect.style['x'], 10)
+        rect = self.newPageRect()
+        self.assertEqual((rect.x, rect.css('fill')), (999, (0, 0, 1)))
+
+    def test_dictProtocol(self):
+        style = self.newPageRect().style
+        self.assertEqual(dict(style), dict(self.rect.style.items()))
+        d = {}
+        d.update(style)
+        self.assertEqual(d['x'], 10)
+        def getX(**kwargs):
+            return kwargs['x']
+        self.assertEqual(getX(**style), 10)
+        self.assertEqual(sorted(style), sorted(self.rect.style.keys()))
+        self.assertEqual(style.copy(), dict(style.items()))
+        self.assertEqual(style, self.rect.style)
+        self.assertFalse(style.materialized)
+
+if __name__ == '__main__':
+    unittest.main()
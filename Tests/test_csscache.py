@@ -0,0 +1,95 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     test_csscache.py
+#
+#     The cached css values of elements are the same as the values resolved
+#     through the styles of the ancestors, after changes of styles, parents
+#     and templates.
+#
+import unittest
+
+from pagebot.document import Document
+from pagebot.elements import newRect, Template
+
+def resolveCss(e, name, default=None):
+    u"""Answer the css value of *name* for *e*, walking the styles of the ancestors without caches."""
+    while e is not None:
+        if e is e.doc: # Document, end of the chain.
+            return e.rootStyle.get(name, default)
+        if name in e.style:
+            return e.style[name]
+        e = e.parent
+    return default
+
+class CssCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.doc = Document(w=500, h=800, autoPages=2)
+        self.page = self.doc[0]
+        self.parent = newRect(parent=self.page, name='Parent', w=200, h=200)
+        self.child = newRect(parent=self.parent, name='Child', w=100, h=100)
+        self.grandChild = newRect(parent=self.child, name='GrandChild', w=50, h=50)
+
+    def assertCss(self, name):
+        for e in (self.page, self.parent, self.child, self.grandChild):
+            self.assertEqual(e.css(name), resolveCss(e, name), '%s.css(%r)' % (e.name, name))
+
+    def test_styleChange(self):
+        self.assertCss('fill')
+        self.parent.style['fill'] = 0.5
+        self.assertCss('fill')
+        self.child.style['fill'] = 0.2
+        self.parent.style['fill'] = 0.8
+        self.assertCss('fill')
+        del self.child.style['fill']
+        self.assertCss('fill')
+        self.parent.style.update(dict(fill=0.1, stroke=0.3))
+        self.assertCss('fill')
+        self.assertCss('stroke')
+
+    def test_rootStyleChange(self):
+        self.assertCss('textFill')
+        self.doc.rootStyle['textFill'] = 0.4
+        self.assertCss('textFill')
+        self.page.style['textFill'] = 0.6
+        self.assertCss('textFill')
+
+    def test_uncachedWrite(self):
+        self.parent.style['stroke'] = 0.5 # Written before any value is cached.
+        self.child.style['strokeWidth'] = 2
+        self.assertCss('stroke')
+        self.assertCss('strokeWidth')
+
+    def test_parentChange(self):
+        otherParent = newRect(parent=self.doc[1], name='Other', w=200, h=200, fill=0.9)
+        self.parent.style['fill'] = 0.5
+        self.assertCss('fill')
+        otherParent.appendElement(self.child) # Moves the child with its cached values.
+        self.assertEqual(self.child.css('fill'), 0.9)
+        self.assertEqual(self.grandChild.css('fill'), 0.9)
+        self.parent.appendElement(self.child)
+        self.assertCss('fill')
+
+    def test_templateChange(self):
+        self.assertCss('fill')
+        template = Template(w=500, h=800, fill=0.7)
+        self.page.template = template # Clears the elements of the page.
+        self.page.appendElement(self.parent)
+        self.assertEqual(self.parent.css('fill'), 0.7)
+        self.assertCss('fill')
+        self.page.template = Template(w=500, h=800, fill=0.3)
+        self.page.appendElement(self.parent)
+        self.assertEqual(self.grandChild.css('fill'), 0.3)
+        self.assertCss('fill')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     test_elementindex.py
+#
+#     The element index of a Document finds the same elements as a recursive
+#     search, after renaming, removing and replacing elements.
+#
+import unittest
+
+from pagebot.document import Document
+from pagebot.elements import newRect
+
+def findRecursive(e, name):
+    found = []
+    for child in e.elements:
+        if child.name == name:
+            found.append(child)
+        found += findRecursive(child, name)
+    return found
+
+class ElementIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.doc = Document(w=500, h=800, autoPages=2)
+        self.page = self.doc[0]
+        self.rects = [newRect(parent=self.page, name='Rect%d' % index, w=50, h=50) for index in range(3)]
+        self.child = newRect(parent=self.rects[0], name='Child', w=10, h=10)
+
+    def assertIndexed(self, name):
+        found = []
+        for pn, pnPages in self.doc.getSortedPages():
+            found += findRecursive(pnPages[0], name)
+        self.assertEqual(self.doc.findElements(name), found)
+        for e in found:
+            self.assertTrue(self.doc.getElementByEId(e.eId) is e)
+
+    def test_rename(self):
+        e = self.rects[1]
+        e.name = 'Other'
+        self.assertIndexed('Rect1')
+        self.assertIndexed('Other')
+        self.assertEqual(self.doc.findElements(prefix='Oth'), [e])
+
+    def test_remove(self):
+        e = self.rects[0]
+        self.page.removeElement(e)
+        self.assertIndexed('Rect0')
+        self.assertIndexed('Child')
+        self.assertTrue(self.doc.getElementByEId(self.child.eId) is None)
+        self.page.appendElement(e)
+        self.assertIndexed('Child')
+        self.assertEqual(self.doc.findElements(pattern='ect'), [self.rects[1], self.rects[2], e])
+
+    def test_replace(self):
+        old = self.rects[0]
+        e = newRect(name='New', w=50, h=50)
+        self.assertEqual(self.page.setElementByIndex(e, 0), 0)
+        self.assertTrue(old.parent is None)
+        self.assertTrue(e.parent is self.page)
+        self.assertIndexed('Rect0')
+        self.assertIndexed('Child')
+        self.assertIndexed('New')
+        self.assertEqual(self.page.elements, [e, self.rects[1], self.rects[2]])
+        # Replace by an element of another page, which is moved.
+        other = newRect(parent=self.doc[1], name='Moved', w=50, h=50)
+        self.page.setElementByIndex(other, 2)
+        self.assertEqual(self.doc[1].elements, [])
+        self.assertEqual(self.doc.findElements('Moved', page=self.page), [other])
+        self.assertIndexed('Rect2')
+
+if __name__ == '__main__':
+    unittest.main()
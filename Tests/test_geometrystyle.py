@@ -0,0 +1,74 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     test_geometrystyle.py
+#
+#     The compact GeometryStyle of elements with compactGeometry set to True
+#     behaves as the default CascadingStyle.
+#
+import unittest
+
+from pagebot.document import Document
+from pagebot.elements.element import Element
+from pagebot.style import GeometryStyle
+
+class CompactElement(Element):
+    compactGeometry = True
+
+class Owner(object):
+    def __init__(self):
+        self.changes = []
+    def styleChanged(self, name=None):
+        self.changes.append(name)
+
+class GeometryStyleTest(unittest.TestCase):
+
+    def test_dictProtocol(self):
+        style = GeometryStyle(dict(x=1, fill=2))
+        self.assertEqual(dict(style), dict(x=1, fill=2))
+        d = {}
+        d.update(style)
+        self.assertEqual(d, dict(x=1, fill=2))
+        def getX(**kwargs):
+            return kwargs['x']
+        self.assertEqual(getX(**style), 1)
+        self.assertEqual(sorted(style), ['fill', 'x'])
+        self.assertEqual(len(style), 2)
+        self.assertEqual(style, dict(x=1, fill=2))
+        self.assertEqual(style.pop('x'), 1)
+        self.assertFalse('x' in style)
+        self.assertEqual(style.get('x', 3), 3)
+
+    def test_changes(self):
+        owner = Owner()
+        style = GeometryStyle(dict(x=1, fill=2), owner)
+        style['x'] = 1 # Equal value, no change.
+        style.update(x=1, fill=2)
+        self.assertEqual(owner.changes, [])
+        style['x'] = 5
+        style.update(x=6)
+        style.update(y=7, fill=3)
+        self.assertEqual(owner.changes, ['x', 'x', None])
+        self.assertEqual(dict(style), dict(x=6, y=7, fill=3))
+
+    def test_element(self):
+        doc = Document(w=500, h=800, autoPages=1)
+        for elementClass in (Element, CompactElement):
+            e = elementClass(parent=doc[0], x=10, y=20, w=100, h=50, fill=(1, 0, 0))
+            self.assertEqual((e.x, e.y, e.w, e.h), (10, 20, 100, 50))
+            self.assertEqual(e.rootX, 10)
+            e.x = 30
+            self.assertEqual((e.x, e.rootX), (30, 30))
+            self.assertEqual(dict(e.style)['x'], 30)
+            self.assertEqual(e.copy().x, 30)
+
+if __name__ == '__main__':
+    unittest.main()
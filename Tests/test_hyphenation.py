@@ -0,0 +1,73 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     test_hyphenation.py
+#
+#     Hyphenators read from the cache of compiled pattern files hyphenate the
+#     same as the ones compiled from the pattern file.
+#
+import os
+import shutil
+import tempfile
+import unittest
+
+from pagebot.toolbox import hyphenation
+from pagebot.toolbox.hyphenation import Hyphenator
+
+PATTERNS = r'''\patterns{
+f1f r1i o1k n1g e1n
+}
+\hyphenation{ta-ble pro-ject}
+'''
+
+class HyphenationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'hyph-test.tex')
+        f = open(self.path, 'wb')
+        f.write(PATTERNS)
+        f.close()
+        self.cacheFolder = os.path.join(self.folder, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_cache(self):
+        words = [u'differing', u'broken', u'longer', u'table', u'Project']
+        hyphenator = Hyphenator.fromFile(self.path, self.cacheFolder)
+        positions = [hyphenator.getPositions(word) for word in words]
+        self.assertEqual(positions[3:], [(2,), (3,)]) # Exceptions
+        self.assertEqual(len(os.listdir(self.cacheFolder)), 1) # No temporary files left.
+        readPatterns = hyphenation.readPatterns
+        def failReading(path):
+            raise AssertionError('Pattern file is read again')
+        hyphenation.readPatterns = failReading
+        try:
+            cached = Hyphenator.fromFile(self.path, self.cacheFolder)
+        finally:
+            hyphenation.readPatterns = readPatterns
+        self.assertEqual([cached.getPositions(word) for word in words], positions)
+
+    def test_existingCacheFolder(self):
+        os.mkdir(self.cacheFolder)
+        exists = os.path.exists
+        def existsLater(path): # Made by another process, after this one checked.
+            return path != self.cacheFolder and exists(path)
+        os.path.exists = existsLater
+        try:
+            hyphenator = Hyphenator.fromFile(self.path, self.cacheFolder)
+        finally:
+            os.path.exists = exists
+        self.assertEqual(hyphenator.getPositions(u'table'), (2,))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     test_incrementalsolve.py
+#
+#     Document.solve(incremental=True) answers the same geometry as solving
+#     all conditions, after edits of the elements between the solves.
+#
+import unittest
+
+from pagebot.document import Document
+from pagebot.elements import newRect
+from pagebot.conditions import Float2TopSide, Float2LeftSide, Left2Left, Top2Top, Fit2Width
+
+def newDocument():
+    doc = Document(w=500, h=800, autoPages=2)
+    for pn in doc.pages:
+        page = doc[pn]
+        for index in range(12):
+            newRect(parent=page, name='Rect%d' % index, w=60 + index % 3 * 30, h=40 + index % 2 * 20,
+                conditions=[Float2TopSide(), Float2LeftSide()])
+        box = newRect(parent=page, name='Box', w=200, h=300, padding=10,
+            conditions=[Float2TopSide(), Float2LeftSide()])
+        for index in range(3):
+            newRect(parent=box, name='Child%d' % index, w=50, h=30, conditions=[Left2Left(), Top2Top(), Fit2Width()])
+    return doc
+
+def getGeometry(doc):
+    geometry = []
+    def collect(e):
+        for child in e.elements:
+            geometry.append((child.name, child.x, child.y, child.w, child.h))
+            collect(child)
+    for pn in sorted(doc.pages):
+        collect(doc[pn])
+    return geometry
+
+def solveAll(doc, maxPasses=10):
+    u"""Solve all conditions of *doc* until the geometry does not change anymore."""
+    geometry = getGeometry(doc)
+    for index in range(maxPasses):
+        doc.solve()
+        previous, geometry = geometry, getGeometry(doc)
+        if geometry == previous:
+            break
+
+def edit(doc):
+    for pn in sorted(doc.pages):
+        page = doc[pn]
+        page.getElementByName('Rect2').w = 200
+        page.removeElement(page.getElementByName('Rect5'))
+        box = page.getElementByName('Box')
+        box.w = 300
+        box.style['pl'] = 30
+        newRect(parent=page, name='Rect12', w=150, h=50, conditions=[Float2TopSide(), Float2LeftSide()])
+
+class IncrementalSolveTest(unittest.TestCase):
+
+    def test_sameResult(self):
+        doc = newDocument()
+        score = doc.solve(incremental=True)
+        self.assertTrue(score.converged)
+        fullDoc = newDocument()
+        solveAll(fullDoc)
+        self.assertEqual(getGeometry(doc), getGeometry(fullDoc))
+
+    def test_edits(self):
+        doc = newDocument()
+        doc.solve(incremental=True)
+        fullDoc = newDocument()
+        solveAll(fullDoc)
+        edit(doc)
+        edit(fullDoc)
+        score = doc.solve(incremental=True)
+        self.assertTrue(score.converged)
+        solveAll(fullDoc)
+        geometry = getGeometry(doc)
+        self.assertEqual(geometry, getGeometry(fullDoc))
+        solveAll(doc) # A full solve of the incremental result does not change anything.
+        self.assertEqual(getGeometry(doc), geometry)
+
+    def test_noChanges(self):
+        doc = newDocument()
+        doc.solve(incremental=True)
+        score = doc.solve(incremental=True)
+        self.assertTrue(score.converged)
+        self.assertEqual(len(score.passes), 1)
+        self.assertEqual(score.solvedElements, 0)
+        doc[0].getElementByName('Rect11').h = 100
+        score = doc.solve(incremental=True)
+        self.assertEqual(score.passes[0]['solvedElements'], 5) # Rect11, the following Box and its children.
+
+if __name__ == '__main__':
+    unittest.main()
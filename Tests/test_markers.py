@@ -0,0 +1,70 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     test_markers.py
+#
+#     The marker side-tables of text boxes (see TextBox.appendMarker) keep
+#     pointing to the same text when boxes are copied, flowed and renumbered.
+#
+import unittest
+
+from pagebot.document import Document
+from pagebot.elements import newTextBox
+from pagebot.toolbox.snapshot import element2Snapshot, snapshot2Element
+from pagebot.toolbox.paralleltypeset import Renumbering
+from pagebot.toolbox.textlayout import fsLength, FONTTOOLS_LAYOUT
+
+from test_textflow import newRuns
+
+class MarkersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.doc = Document(w=500, h=800, autoPages=1)
+
+    def test_copy(self):
+        tb = newTextBox([(u'Text', {})], parent=self.doc[0])
+        tb.appendMarker('footnote', 1)
+        e = tb.copy()
+        e.appendMarker('footnote', 2)
+        self.assertEqual(tb.markers, [(4, 'footnote', 1)])
+        self.assertEqual(e.markers, [(4, 'footnote', 1), (4, 'footnote', 2)])
+
+    def test_renumberGalley(self):
+        runs = [(u'Text==fnnumber--1==', {}), (u' more ==fnnumber--2== text', {})]
+        tb = newTextBox(runs, parent=self.doc[0])
+        tb.markers = [(4, 'footnote', 1), (19, 'footnote', 1), (25, 'literature', 1), (40, 'footnote', 2)]
+        data = element2Snapshot(tb, [])
+        renumbering = Renumbering(footnotes=10, literatureRefs=5)
+        renumbering.offsets['fnnumber'] = 10
+        renumbering.renumberGalley(data)
+        e = snapshot2Element(data)
+        text = u''.join([t for t, _ in e.fs])
+        self.assertEqual(text, u'Text11 more 12 text')
+        self.assertEqual(e.markers, [(4, 'footnote', 11), (6, 'footnote', 11), (12, 'literature', 6),
+            (14, 'footnote', 12)])
+
+    def test_overflow2Next(self):
+        page = self.doc[0]
+        tb1 = newTextBox([], parent=page, name='Box1', w=200, h=300, nextElement='Box2',
+            textLayout=FONTTOOLS_LAYOUT)
+        tb2 = newTextBox([], parent=page, name='Box2', w=200, h=3000, textLayout=FONTTOOLS_LAYOUT)
+        runs = newRuns(0, 2)
+        tb1.fs = runs
+        tb1.markers = [(index, 'footnote', index) for index in range(0, fsLength(runs), 100)]
+        tb1.overflow2Next()
+        split = fsLength(runs) - fsLength(tb2.fs)
+        self.assertTrue(0 < split < fsLength(runs))
+        self.assertEqual(tb1.markers, [marker for marker in tb1.markers if marker[0] < split])
+        self.assertEqual(len(tb1.markers) + len(tb2.markers), len(range(0, fsLength(runs), 100)))
+        self.assertEqual([arg for _, _, _, arg in self.doc.findMarkers('footnote')], range(0, fsLength(runs), 100))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     test_pagehash.py
+#
+#     Pages of two builds of the same document have the same content hash, and
+#     pages that are drawn differently have different hashes.
+#
+import unittest
+
+from pagebot.document import Document
+from pagebot.elements import newRect
+from pagebot.toolbox.pagehash import PageHasher
+
+def newDocument(links=True):
+    doc = Document(w=500, h=800, autoPages=3)
+    for pn in range(3):
+        e1 = newRect(parent=doc[pn], name='Rect1', w=100, h=40)
+        e2 = newRect(parent=doc[pn], name='Rect2', w=100, h=40)
+        if links: # Flow links by eId, which are different for every build.
+            e1.nextElement = e2.eId
+            e2.prevElement = e1.eId
+    return doc
+
+def getHashes(doc):
+    view = doc.getView()
+    pages = [pnPages[0] for pn, pnPages in doc.getSortedPages()]
+    hashes = PageHasher(view, 500, 800).getPageHashes(pages)
+    return [hashes[page] for page in pages]
+
+class PageHashTest(unittest.TestCase):
+
+    def test_sameBuild(self):
+        docs = [newDocument() for _ in range(2)] # Both alive, so their elements have different ids.
+        self.assertEqual(getHashes(docs[0]), getHashes(docs[1]))
+
+    def test_flowLinks(self):
+        doc1 = newDocument()
+        doc2 = newDocument()
+        doc2[1].elements[0].nextElement = doc2[1].elements[0].eId # Other element, same name.
+        hashes1 = getHashes(doc1)
+        hashes2 = getHashes(doc2)
+        self.assertEqual((hashes1[0], hashes1[2]), (hashes2[0], hashes2[2]))
+        self.assertNotEqual(hashes1[1], hashes2[1])
+
+    def test_pageNumbers(self):
+        # Pages with the same content on other page numbers are drawn with other page name info.
+        doc = newDocument(False)
+        hashes = getHashes(doc)
+        self.assertEqual(len(set(hashes)), 3)
+        doc.getView().showPageNameInfo = True
+        self.assertNotEqual(getHashes(doc), hashes)
+
+    def test_lostValues(self):
+        # Values that the snapshot cannot keep, such as drawing hooks, are part of the page hash.
+        doc = newDocument()
+        hashes = getHashes(doc)
+        doc[1].elements[0].drawBefore = lambda e, view, origin: None
+        self.assertEqual(getHashes(doc)[0], hashes[0])
+        self.assertNotEqual(getHashes(doc)[1], hashes[1])
+        doc[1].elements[0].drawBefore = None
+        self.assertEqual(getHashes(doc), hashes)
+
+if __name__ == '__main__':
+    unittest.main()
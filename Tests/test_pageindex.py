@@ -0,0 +1,109 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     test_pageindex.py
+#
+#     Navigation through the page index of a Document answers the same pages
+#     as sorting the rows of Document.pages, after inserting and removing pages.
+#
+import unittest
+
+from pagebot.document import Document
+from pagebot.elements.pbpage import Page
+
+def getSortedPages(doc):
+    return [page for pn in sorted(doc.pages) for page in doc.pages[pn]]
+
+class PageIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.doc = Document(w=500, h=800, autoPages=5)
+
+    def insertPage(self, pn, name=None):
+        u"""Add a new page at the end of the row of page number *pn*."""
+        page = Page(w=500, h=800, name=name)
+        page.setParent(self.doc)
+        self.doc[pn] = page
+        return page
+
+    def assertNavigation(self):
+        doc = self.doc
+        pages = getSortedPages(doc)
+        self.assertEqual(list(doc.pageIndex), pages)
+        self.assertEqual(len(doc.pageIndex), len(pages))
+        self.assertEqual(doc.getFirstPage(), pages[0])
+        self.assertEqual(doc.getLastPage(), pages[-1])
+        for position, page in enumerate(pages):
+            self.assertEqual(doc.pageIndex.getPosition(page), position)
+            if position + 1 < len(pages):
+                self.assertEqual(doc.nextPage(page, makeNew=False), pages[position + 1])
+            else:
+                self.assertEqual(doc.nextPage(page, makeNew=False), None)
+            if position:
+                self.assertEqual(doc.prevPage(page), pages[position - 1])
+            else:
+                self.assertEqual(doc.prevPage(page), None)
+            pn = [pn for pn in doc.pages if page in doc.pages[pn]][0]
+            index = doc.pages[pn].index(page)
+            if index:
+                self.assertEqual(doc.getPageNumber(page), '%d-%d' % (pn + 1, index + 1))
+            else:
+                self.assertEqual(doc.getPageNumber(page), '%d' % (pn + 1))
+        self.assertEqual([pn for pn, pnPages in doc.getSortedPages()], sorted(doc.pages))
+
+    def test_append(self):
+        self.assertNavigation()
+        self.doc.appendPage(Page(w=500, h=800))
+        self.insertPage(5)
+        self.assertEqual(len(self.doc.pages[5]), 2)
+        self.assertNavigation()
+
+    def test_insert(self):
+        self.assertNavigation()
+        self.insertPage(1, name='Inserted')
+        self.insertPage(0)
+        self.insertPage(10)
+        self.assertNavigation()
+        self.assertEqual(self.doc.getPageNumber(self.doc.getPage('Inserted')), '2-2')
+        self.insertPage(7)
+        self.assertNavigation()
+
+    def test_remove(self):
+        doc = self.doc
+        inserted = self.insertPage(2, name='Inserted')
+        self.assertNavigation()
+        doc.removePage(doc[2]) # The inserted page moves to the first index of the row.
+        self.assertEqual(doc.getPageNumber(inserted), '3')
+        self.assertNavigation()
+        doc.removePage(doc.getLastPage())
+        self.assertNavigation()
+        doc.removePage(inserted) # Removes the row of page number 2.
+        self.assertFalse(2 in doc.pages)
+        self.assertEqual(doc.getPage('Inserted'), None)
+        self.assertEqual(doc.getPageNumber(inserted), '')
+        self.assertEqual(inserted.parent, None)
+        self.assertNavigation()
+        self.assertEqual(doc.nextPage(doc[1], makeNew=False), doc[3])
+
+    def test_removeFirstAndAppend(self):
+        doc = self.doc
+        first = doc[0]
+        doc.removePage(first)
+        self.assertNavigation()
+        doc.appendPage(first) # Appended after the last page.
+        self.assertEqual(doc.getLastPage(), first)
+        self.assertNavigation()
+        doc.appendPage(doc[1]) # Moves the page from its row to the end.
+        self.assertFalse(1 in doc.pages)
+        self.assertNavigation()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     test_parallelexport.py
+#
+#     View.exportParallel renders pages with values that the snapshot cannot
+#     keep in the main process, in their own page ranges.
+#
+import unittest
+
+from pagebot.document import Document
+from pagebot.elements import newRect
+from pagebot.builders.parallelexport import getPageRanges
+from pagebot.toolbox.snapshot import document2Snapshot, getLostPages
+
+def drawHook(view, origin):
+    pass
+
+class ParallelExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.doc = Document(w=500, h=800, autoPages=8)
+        for pn in self.doc.pages:
+            newRect(parent=self.doc[pn], name='Rect', w=100, h=100)
+        self.pages = [pnPages[0] for pn, pnPages in self.doc.getSortedPages()]
+
+    def test_noLostValues(self):
+        lostPages = getLostPages(self.doc, document2Snapshot(self.doc)['lost'])
+        self.assertEqual(lostPages, set())
+        self.assertEqual(getPageRanges(self.doc, self.pages, 2, lostPages), [(0, 4, False), (4, 8, False)])
+
+    def test_lostValues(self):
+        self.doc[3].getElementByName('Rect').drawBefore = drawHook
+        self.doc[4].drawAfter = drawHook
+        lostPages = getLostPages(self.doc, document2Snapshot(self.doc)['lost'])
+        self.assertEqual(lostPages, set([self.doc[3], self.doc[4]]))
+        self.assertEqual(getPageRanges(self.doc, self.pages, 2, lostPages),
+            [(0, 3, False), (3, 5, True), (5, 8, False)])
+
+    def test_lostStyleValues(self):
+        self.doc.rootStyle['drawBefore'] = drawHook
+        lostPages = getLostPages(self.doc, document2Snapshot(self.doc)['lost'])
+        self.assertEqual(lostPages, set(self.pages))
+        self.assertEqual(getPageRanges(self.doc, self.pages, 2, lostPages), [(0, 8, True)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     test_parallelsolve.py
+#
+#     Document.solve(workers=n) solves the pages in new worker processes, with
+#     the same result as solving them in this process.
+#
+import unittest
+
+from pagebot.document import Document
+from pagebot.elements import newRect
+from pagebot.conditions import Float2TopSide, Float2LeftSide
+from pagebot.toolbox.workers import runWorkers
+from parallelhelpers import Fit2Function, countElements, fail
+
+def newDocument():
+    doc = Document(w=500, h=800, autoPages=4)
+    for pn in doc.pages:
+        for index in range(20):
+            newRect(parent=doc[pn], name='Rect%d' % index, w=50 + index % 3 * 20, h=40,
+                conditions=[Float2TopSide(), Float2LeftSide()])
+    return doc
+
+def getPositions(doc):
+    return [(e.name, e.x, e.y) for pn in sorted(doc.pages) for e in doc[pn].elements]
+
+class ParallelSolveTest(unittest.TestCase):
+
+    def test_sameResult(self):
+        doc = newDocument()
+        score = doc.solve()
+        parallelDoc = newDocument()
+        parallelScore = parallelDoc.solve(workers=2)
+        self.assertEqual((parallelScore.result, len(parallelScore.fails)), (score.result, len(score.fails)))
+        self.assertEqual(getPositions(parallelDoc), getPositions(doc))
+
+    def test_lostValues(self):
+        u"""Pages with values that are lost in the snapshot are solved in this process."""
+        doc = newDocument()
+        e = doc[2].getElementByName('Rect3')
+        e.conditions = [Fit2Function(lambda e: 123)] + e.conditions
+        score = doc.solve(workers=2)
+        self.assertEqual(e.w, 123)
+        self.assertEqual(len(score.fails), len(newDocument().solve().fails))
+
+    def test_runWorkers(self):
+        doc = newDocument()
+        self.assertEqual(runWorkers(countElements, [0, 1, 2, 3, 0], 2, doc), [20, 20, 20, 20, 20])
+        self.assertEqual(runWorkers(countElements, [], 2, doc), [])
+        self.assertRaises(RuntimeError, runWorkers, fail, [1, 2], 2)
+
+    def test_runWorkersMain(self):
+        u"""Functions of a script that runs as __main__ cannot be imported by the workers."""
+        def count(doc, pn):
+            return 0
+        count.__module__ = '__main__'
+        self.assertRaises(ValueError, runWorkers, count, [0], 2)
+
+if __name__ == '__main__':
+    unittest.main()
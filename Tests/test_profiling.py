@@ -0,0 +1,99 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     test_profiling.py
+#
+#     The profiler records nested spans as Chrome trace events, aggregated by
+#     element class and by page, and records nothing when it is disabled.
+#
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from pagebot.document import Document
+from pagebot.elements import newRect
+from pagebot.conditions import Float2TopSide, Float2LeftSide
+from pagebot.toolbox.profiling import Profiler, profiler, NO_SPAN
+
+class ProfilingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.doc = Document(w=500, h=800, autoPages=2, name='Doc')
+        for pn in self.doc.pages:
+            for index in range(5):
+                newRect(parent=self.doc[pn], name='Rect%d' % index, w=50, h=40,
+                    conditions=[Float2TopSide(), Float2LeftSide()])
+
+    def tearDown(self):
+        profiler.disable()
+        profiler.clear()
+
+    def test_disabled(self):
+        p = Profiler()
+        self.assertTrue(p.span('solve', e=self.doc[0]) is NO_SPAN)
+        with p.span('solve'):
+            pass
+        self.assertEqual(p.events, [])
+        self.doc.solve() # The global profiler is disabled by default.
+        self.assertEqual(profiler.events, [])
+
+    def test_nestedSpans(self):
+        p = Profiler(enabled=True)
+        page = self.doc[0]
+        rect = page.elements[0]
+        with p.span('draw', e=page):
+            with p.span('draw', e=rect):
+                pass
+            with p.span('draw', e=rect, extra=1):
+                pass
+        self.assertEqual([event['name'] for event in p.events], ['Rect', 'Rect', 'Page'])
+        self.assertEqual(p.events[1]['args'], dict(eId=rect.eId, extra=1))
+        self.assertEqual(p.events[2]['args']['page'], page.eId)
+        count, total, selfTime = p.classTimes[('draw', 'Page')]
+        self.assertEqual(count, 1)
+        self.assertTrue(0 <= selfTime <= total)
+        self.assertEqual(p.classTimes[('draw', 'Rect')][0], 2)
+        self.assertEqual(list(p.pageTimes), [('draw', page.eId)])
+        self.assertEqual(p._stack, [])
+
+    def test_solve(self):
+        profiler.enable()
+        self.doc.solve()
+        events = [event for event in profiler.events if event['cat'] == 'solve']
+        self.assertEqual(len(events), 12) # 2 pages with 5 elements each, and the 2 pages.
+        self.assertEqual(profiler.classTimes[('solve', 'Rect')][0], 10)
+        self.assertEqual(profiler.classTimes[('solve', 'Page')][0], 2)
+        self.assertEqual(len([key for key in profiler.pageTimes if key[0] == 'solve']), 2)
+        summary = profiler.getSummary()
+        self.assertTrue('solve' in summary.split('Element classes')[0])
+
+    def test_exportTrace(self):
+        profiler.enable()
+        self.doc.solve()
+        path = tempfile.mkdtemp()
+        try:
+            tracePath = os.path.join(path, 'Trace.json')
+            profiler.exportTrace(tracePath)
+            trace = json.load(open(tracePath))
+            summaryPath = os.path.join(path, 'Summary.txt')
+            profiler.exportSummary(summaryPath)
+            self.assertEqual(open(summaryPath).read(), profiler.getSummary())
+        finally:
+            shutil.rmtree(path)
+        self.assertEqual(len(trace['traceEvents']), len(profiler.events))
+        for event in trace['traceEvents']:
+            self.assertEqual(event['ph'], 'X')
+            self.assertTrue(event['dur'] >= 0 and event['ts'] >= 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     test_rootpoint.py
+#
+#     The cached absolute positions of elements are the same as the sum of the
+#     positions along the parent chain, after moves, style changes and reparenting.
+#
+import unittest
+
+from pagebot.document import Document
+from pagebot.elements import newRect
+
+def sumRootPoint(e):
+    u"""Answer the (rootX, rootY, rootZ) of *e*, adding the positions of the ancestors without caches."""
+    x = y = z = 0
+    while e is not None and e is not e.doc: # The document is the root origin.
+        x += e.x
+        y += e.y
+        z += e.z
+        e = e.parent
+    return x, y, z
+
+class RootPointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.doc = Document(w=500, h=800, autoPages=2)
+        self.page = self.doc[0]
+        self.parent = newRect(parent=self.page, name='Parent', x=10, y=20, w=200, h=200)
+        self.child = newRect(parent=self.parent, name='Child', x=5, y=6, w=100, h=100)
+        self.grandChild = newRect(parent=self.child, name='GrandChild', x=1, y=2, w=50, h=50)
+
+    def assertRootPoints(self):
+        for e in (self.parent, self.child, self.grandChild):
+            self.assertEqual(e.rootPoint, sumRootPoint(e), '%s.rootPoint' % e.name)
+            self.assertEqual((e.rootX, e.rootY, e.rootZ), e.rootPoint)
+
+    def test_move(self):
+        self.assertRootPoints()
+        self.parent.x = 30
+        self.assertRootPoints()
+        self.parent.y = 40
+        self.child.x = 7
+        self.assertRootPoints()
+        self.parent.z = 3
+        self.assertRootPoints()
+        self.assertEqual(self.grandChild.rootPoint, (38, 48, 3))
+
+    def test_styleChange(self):
+        self.assertRootPoints()
+        self.child.style['x'] = 50
+        self.assertRootPoints()
+        self.parent.style.update(dict(x=0, y=0))
+        self.assertRootPoints()
+        self.child.style = dict(x=8, y=9, z=0, w=100, h=100) # Replace the whole style.
+        self.assertRootPoints()
+        self.assertEqual(self.grandChild.rootPoint, (9, 11, 0))
+
+    def test_cachedChildOnly(self):
+        self.assertEqual(self.grandChild.rootPoint, (16, 28, 0)) # Fills the caches of the ancestors too.
+        self.parent.x = 100
+        self.assertEqual(self.grandChild.rootPoint, (106, 28, 0))
+        self.assertRootPoints()
+
+    def test_reparent(self):
+        self.assertRootPoints()
+        otherParent = newRect(parent=self.doc[1], name='Other', x=300, y=400, w=200, h=200)
+        otherParent.appendElement(self.child) # Moves the child with its cached position.
+        self.assertEqual(self.child.rootPoint, (305, 406, 0))
+        self.assertEqual(self.grandChild.rootPoint, sumRootPoint(self.grandChild))
+        otherParent.x = 200
+        self.assertEqual(self.grandChild.rootPoint, (206, 408, 0))
+        self.parent.appendElement(self.child)
+        self.assertRootPoints()
+        self.parent.removeElement(self.child)
+        self.assertEqual(self.grandChild.rootPoint, (6, 8, 0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     test_snapshot.py
+#
+#     Round trip of Document.saveSnapshot and Document.loadSnapshot.
+#     Runs without DrawBot:
+#
+#     PYTHONPATH=Lib python -m unittest discover Tests
+#
+import os
+import shutil
+import tempfile
+import unittest
+
+from pagebot.document import Document
+from pagebot.elements import newRect, newTextBox, Galley
+from pagebot.toolbox.snapshot import element2Snapshot, snapshot2Element
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'Test.pbsnap')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def newDocument(self, originTop):
+        doc = Document(w=500, h=700, autoPages=2, originTop=originTop, name='Test')
+        page = doc[0]
+        newRect(parent=page, name='Rect', x=10, y=20, w=100, h=50, fill=(1, 0, 0))
+        newTextBox([(u'Hello world', dict(fontSize=12))], parent=page, name='Text', x=30, y=40, w=200, h=100)
+        return doc
+
+    def test_originTop(self):
+        for originTop in (True, False):
+            doc = self.newDocument(originTop)
+            self.assertEqual(doc.originTop, originTop)
+            doc.saveSnapshot(self.path)
+            self.assertEqual(Document.loadSnapshot(self.path).originTop, originTop)
+
+    def test_roundTrip(self):
+        doc = self.newDocument(False)
+        self.assertEqual(doc.saveSnapshot(self.path), [])
+        loaded = Document.loadSnapshot(self.path)
+        self.assertEqual((loaded.name, loaded.w, loaded.h), ('Test', 500, 700))
+        self.assertEqual(sorted(loaded.pages.keys()), sorted(doc.pages.keys()))
+        for pn in doc.pages:
+            page, = doc.getPages(pn)
+            loadedPage, = loaded.getPages(pn)
+            self.assertEqual([e.name for e in loadedPage.elements], [e.name for e in page.elements])
+            for e, loadedE in zip(page.elements, loadedPage.elements):
+                self.assertEqual(loadedE.__class__, e.__class__)
+                self.assertEqual((loadedE.x, loadedE.y, loadedE.w, loadedE.h), (e.x, e.y, e.w, e.h))
+        rect, textBox = loaded[0].elements
+        self.assertEqual(rect.css('fill'), (1, 0, 0))
+        self.assertEqual(textBox.fs, [(u'Hello world', dict(fontSize=12))])
+
+    def test_references(self):
+        galley = Galley()
+        galley.newTextBox([(u'Chapter 1', {})])
+        galley.newTextBox([(u'Chapter 2', {})])
+        lost = []
+        loaded = snapshot2Element(element2Snapshot(galley, lost))
+        self.assertEqual(lost, []) # Galley.lastTextBox refers to a child, restored as reference.
+        self.assertTrue(loaded.lastTextBox is loaded.elements[-1])
+        self.assertEqual(loaded.lastTextBox.fs, [(u'Chapter 2', {})])
+
+    def test_notASnapshot(self):
+        f = open(self.path, 'wb')
+        f.write('Not a snapshot')
+        f.close()
+        self.assertRaises(ValueError, Document.loadSnapshot, self.path)
+
+if __name__ == '__main__':
+    unittest.main()
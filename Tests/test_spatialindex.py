@@ -0,0 +1,96 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     test_spatialindex.py
+#
+#     The float sides of elements in a container with a spatial index are the
+#     same as the float sides found by scanning all siblings, after changes of
+#     the elements and of the container.
+#
+import random
+import unittest
+
+from pagebot.document import Document
+from pagebot.elements import newRect
+from pagebot.toolbox.spatialindex import SpatialIndex
+
+def getFloatSides(e, previousOnly, tolerance):
+    return (e.getFloatTopSide(previousOnly, tolerance), e.getFloatBottomSide(previousOnly, tolerance),
+        e.getFloatLeftSide(previousOnly, tolerance), e.getFloatRightSide(previousOnly, tolerance))
+
+class SpatialIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.doc = Document(w=1000, h=1000, autoPages=1)
+        self.page = self.doc[0]
+        self.page.spatialIndex = SpatialIndex(cellSize=50)
+        self.random = random.Random(7)
+        for index in range(40):
+            self.newRect(index)
+
+    def newRect(self, index):
+        r = self.random
+        return newRect(parent=self.page, name='Rect%d' % index, x=r.randint(-100, 1000), y=r.randint(-100, 1000),
+            z=r.choice((0, 0, 1)), w=r.randint(10, 300), h=r.randint(10, 300), margin=r.choice((0, 5)))
+
+    def assertFloatSides(self):
+        u"""Compare the float sides with the index against the float sides of a scan of all siblings."""
+        index = self.page._spatialIndex
+        for e in self.page.elements:
+            for previousOnly, tolerance in ((True, 0), (False, 0), (True, 1)):
+                indexed = getFloatSides(e, previousOnly, tolerance)
+                self.page._spatialIndex = None
+                scanned = getFloatSides(e, previousOnly, tolerance)
+                self.page._spatialIndex = index
+                self.assertEqual(indexed, scanned, '%s previousOnly=%s tolerance=%s' % (e.name, previousOnly, tolerance))
+
+    def test_sameSides(self):
+        self.assertEqual(len(self.page.spatialIndex), 40)
+        self.assertFloatSides()
+
+    def test_elementChanges(self):
+        self.assertFloatSides()
+        for e in self.page.elements[::3]:
+            e.x += 120
+            e.y -= 80
+        for e in self.page.elements[1::5]:
+            e.w = 2000 # Wider than the maximum span of cells.
+            e.z = 1
+        for e in self.page.elements[2::7]:
+            e.style['mt'] = 40
+        self.assertFloatSides()
+
+    def test_containerChanges(self):
+        self.assertFloatSides()
+        self.page.w = 600
+        self.page.h = 700
+        self.assertFloatSides()
+        self.page.style['originTop'] = True
+        self.assertFloatSides()
+        self.page.style['xAlign'] = 'center' # Inherited alignment moves the margin boxes.
+        self.assertFloatSides()
+
+    def test_appendRemove(self):
+        self.assertFloatSides()
+        elements = self.page.elements
+        for e in elements[::4]:
+            self.page.removeElement(e)
+        self.assertEqual(len(self.page.spatialIndex), len(self.page.elements))
+        self.assertFloatSides()
+        self.page.appendElement(elements[1]) # Moves to the end of the order.
+        for index in range(40, 50):
+            self.newRect(index)
+        self.page.setElementByIndex(self.newRect(50), 3)
+        self.assertEqual(len(self.page.spatialIndex), len(self.page.elements))
+        self.assertFloatSides()
+
+if __name__ == '__main__':
+    unittest.main()
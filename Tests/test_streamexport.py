@@ -0,0 +1,60 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     test_streamexport.py
+#
+#     Pages that are written by View.exportStream(release=True) release their
+#     elements, also from the element index of the document, and the image
+#     page writer numbers the files by page. Drawing the pages needs DrawBot.
+#
+import gc
+import unittest
+import weakref
+
+from pagebot.document import Document
+from pagebot.elements import newRect
+from pagebot.builders.pagewriter import newPageWriter, ImagePageWriter
+
+class StreamExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.doc = Document(w=500, h=800, autoPages=3)
+        for pn in self.doc.pages:
+            parent = newRect(parent=self.doc[pn], name='Parent', w=200, h=200)
+            newRect(parent=parent, name='Child', w=100, h=100)
+
+    def test_releaseElements(self):
+        doc = self.doc
+        page = doc[0]
+        parent = page.getElementByName('Parent')
+        child = parent.elements[0]
+        released = weakref.ref(child)
+        page.releaseElements()
+        self.assertEqual(page.elements, [])
+        self.assertEqual(parent.parent, None)
+        self.assertEqual(doc.getElementByEId(parent.eId), None)
+        self.assertEqual(doc.getElementByEId(child.eId), None)
+        self.assertEqual(len(doc.findElements('Child')), 2) # Elements of the other pages stay.
+        self.assertEqual(len(doc.findElements('Parent')), 2)
+        del parent, child
+        gc.collect()
+        self.assertEqual(released(), None) # Nothing refers to the released elements anymore.
+        self.assertEqual(doc.nextPage(page, makeNew=False), doc[1]) # The page itself stays in the document.
+
+    def test_imagePageWriter(self):
+        writer = newPageWriter('_export/Doc.png')
+        self.assertTrue(isinstance(writer, ImagePageWriter))
+        self.assertEqual([writer.getPagePath(index) for index in (0, 1, 99)],
+            ['_export/Doc-0001.png', '_export/Doc-0002.png', '_export/Doc-0100.png'])
+        self.assertEqual(writer.pageCount, 0)
+
+if __name__ == '__main__':
+    unittest.main()
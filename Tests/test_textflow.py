@@ -0,0 +1,115 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     test_textflow.py
+#
+#     TextFlow.fill answers the same lines in a text box as the layout of the
+#     complete text, for every chunk size.
+#
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from pagebot.document import Document
+from pagebot.elements import newTextBox
+from pagebot.toolbox.textflow import TextFlow
+from pagebot.toolbox.textlayout import getTextLayout, getFontMetrics, fsLength, FONTTOOLS_LAYOUT, \
+    TOTAL_FIT_LAYOUT, HYPHENATED_LAYOUT
+from pagebot.toolbox.hyphenation import registerHyphenationPatterns
+
+FONT_PATH = os.path.join(os.path.dirname(__file__), '..', 'Fonts', 'fontbureau', 'AmstelvarAlpha-VF.ttf')
+
+def newRuns(seed, paragraphs=1):
+    random.seed(seed)
+    words = u'a longer text with some words of differing lengths, that will be broken into lines by total fit'.split()
+    text = u'\n'.join([u' '.join([random.choice(words) for _ in range(400)]) for _ in range(paragraphs)])
+    return [(text, dict(font=FONT_PATH, fontSize=12, align='justified'))]
+
+class TextFlowTest(unittest.TestCase):
+
+    def newTextBox(self, layoutName):
+        self.doc = Document(w=500, h=800, autoPages=1) # Keep the document, pages refer to it weakly.
+        return newTextBox([], parent=self.doc[0], w=200, h=300, textLayout=layoutName)
+
+    def assertSameEnd(self, layoutName, runs):
+        tb = self.newTextBox(layoutName)
+        layout = getTextLayout(layoutName)
+        end = fsLength(runs) - fsLength(layout.getOverflow(runs, tb.w, tb.h))
+        self.assertTrue(0 < end < fsLength(runs))
+        for chunkSize in (16, 64, 100, 700, 100000):
+            flow = TextFlow(runs, chunkSize=chunkSize)
+            self.assertEqual(flow.fill(tb, 0), end)
+            self.assertEqual(fsLength(tb.fs), end)
+
+    def test_greedy(self):
+        for seed in range(3):
+            self.assertSameEnd(FONTTOOLS_LAYOUT, newRuns(seed))
+
+    def test_totalFit(self):
+        # Total-fit breaks depend on the end of the paragraph, so chunks are not cut inside a paragraph.
+        for seed in range(3):
+            self.assertSameEnd(TOTAL_FIT_LAYOUT, newRuns(seed))
+            self.assertSameEnd(TOTAL_FIT_LAYOUT, newRuns(seed, 3))
+
+    def test_drawRuns(self):
+        runs = newRuns(0, 2)
+        runs[0][1]['align'] = 'left'
+        layout = getTextLayout(TOTAL_FIT_LAYOUT)
+        lines = layout.getTextLines(runs, 200, 300)
+        drawRuns = layout.getDrawRuns(runs, 200, 300)
+        self.assertEqual([(x, y) for x, y, _, _ in drawRuns], [(line.x, line.y) for line in lines])
+        self.assertEqual([s for _, _, s, _ in drawRuns], [line.string.rstrip(u'\n') for line in lines])
+        self.assertEqual(drawRuns[0][3], dict(font=FONT_PATH, fontSize=12))
+
+    def test_drawJustifiedRuns(self):
+        runs = newRuns(0, 2)
+        layout = getTextLayout(TOTAL_FIT_LAYOUT)
+        lines = layout.getTextLines(runs, 200, 300)
+        drawRuns = layout.getDrawRuns(runs, 200, 300)
+        self.assertEqual(u''.join([s for _, _, s, _ in drawRuns]), u''.join([line.string.rstrip(u'\n') for line in lines]))
+        # Every word of a justified line is drawn at its stretched or shrunk position in the line.
+        line = lines[0]
+        self.assertTrue(line.width != line.naturalWidth)
+        words = [(x, s) for x, y, s, _ in drawRuns if y == line.y]
+        self.assertEqual(len(words), len(line.string.split()))
+        index = 0
+        for x, s in words:
+            self.assertEqual(x, line.x + line.getOffsetForStringIndex(line.iStart + index))
+            index += len(s)
+
+    def test_drawHyphens(self):
+        folder = tempfile.mkdtemp()
+        try:
+            path = os.path.join(folder, 'hyph-test.pat.txt')
+            f = open(path, 'wb')
+            f.write('f1f r1i o1k n1g e1n') # dif-fer-ing, bro-ken, lon-ger, len-gths
+            f.close()
+            registerHyphenationPatterns('test', path)
+            runs = newRuns(0, 2)
+            runs[0][1]['language'] = 'test'
+            layout = getTextLayout(HYPHENATED_LAYOUT)
+            lines = layout.getTextLines(runs, 120, 300)
+            drawRuns = layout.getDrawRuns(runs, 120, 300)
+        finally:
+            shutil.rmtree(folder)
+        hyphens = [(x, y) for x, y, s, _ in drawRuns if s == u'-']
+        hyphenated = [line for line in lines if line.hyphenated]
+        self.assertTrue(hyphenated)
+        self.assertEqual(len(hyphens), len(hyphenated))
+        hyphenWidth = getFontMetrics(FONT_PATH).getAdvance(u'-', 12)
+        for (x, y), line in zip(hyphens, hyphenated): # The hyphen ends at the measured width of the line.
+            self.assertEqual(y, line.y)
+            self.assertAlmostEqual(x + hyphenWidth, line.x + line.width)
+
+if __name__ == '__main__':
+    unittest.main()
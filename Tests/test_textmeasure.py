@@ -0,0 +1,90 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     test_textmeasure.py
+#
+#     The TextMeasureCache answers the same measurements as the text layout,
+#     from a cache of limited size.
+#
+import unittest
+
+from pagebot.document import Document
+from pagebot.elements import newTextBox
+from pagebot.toolbox.textmeasure import TextMeasureCache, fsHash
+from pagebot.toolbox.textlayout import getTextLayout, fsLength, FONTTOOLS_LAYOUT, TOTAL_FIT_LAYOUT
+from test_textflow import newRuns
+
+class TextMeasureTest(unittest.TestCase):
+
+    def setUp(self):
+        self.layout = getTextLayout(FONTTOOLS_LAYOUT)
+        self.runs = newRuns(1)
+
+    def test_overflow(self):
+        cache = TextMeasureCache()
+        overflow = self.layout.getOverflow(self.runs, 200, 300)
+        self.assertTrue(overflow)
+        self.assertEqual(cache.textOverflow(self.runs, 200, 300, layout=self.layout), overflow)
+        self.assertEqual([type(value) for value in cache._values.values()], [int]) # Only the index is cached.
+        answered = cache.textOverflow(self.runs, 200, 300, layout=self.layout)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(answered, overflow)
+        answered.append((u'More', {})) # Answered as new slice, the caller can change it.
+        self.assertEqual(cache.textOverflow(self.runs, 200, 300, layout=self.layout), overflow)
+        # Everything fits, the overflow is empty.
+        self.assertEqual(cache.textOverflow(self.runs, 2000, 30000, layout=self.layout), [])
+
+    def test_eviction(self):
+        cache = TextMeasureCache(maxSize=3)
+        for w in (100, 200, 300):
+            cache.textSize(self.runs, w, layout=self.layout)
+        cache.textSize(self.runs, 100, layout=self.layout) # Now the most recently used.
+        cache.textSize(self.runs, 400, layout=self.layout) # Evicts the least recently used width 200.
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.getStats(), dict(size=3, maxSize=3, hits=1, misses=4, evictions=1))
+        cache.resetStats()
+        cache.textSize(self.runs, 100, layout=self.layout)
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+        self.assertEqual(cache.textSize(self.runs, 200, layout=self.layout), self.layout.getTextSize(self.runs, 200))
+        self.assertEqual((cache.hits, cache.misses, cache.evictions), (1, 1, 1))
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    def test_layoutKeys(self):
+        u"""Measurements by different layouts are cached separately."""
+        cache = TextMeasureCache()
+        totalFit = getTextLayout(TOTAL_FIT_LAYOUT)
+        for layout in (self.layout, totalFit, self.layout, totalFit):
+            self.assertEqual(cache.textSize(self.runs, 200, layout=layout), layout.getTextSize(self.runs, 200))
+            self.assertEqual(cache.textOverflow(self.runs, 200, 300, layout=layout), layout.getOverflow(self.runs, 200, 300))
+        self.assertEqual(len(cache), 4)
+        self.assertEqual((cache.hits, cache.misses), (4, 4))
+
+    def test_textBoxChanges(self):
+        u"""Text boxes measure again after their text or their text layout changed."""
+        doc = Document(w=500, h=800, autoPages=1) # Keep the document, pages refer to it weakly.
+        tb = newTextBox(self.runs, parent=doc[0], w=200, h=300, textLayout=FONTTOOLS_LAYOUT)
+        self.assertEqual(tb.getOverflow(), self.layout.getOverflow(self.runs, 200, 300))
+        runs = newRuns(2)
+        tb.fs = runs
+        self.assertEqual(tb.getOverflow(), self.layout.getOverflow(runs, 200, 300))
+        self.assertEqual(tb.getTextSize(), self.layout.getTextSize(runs, 200))
+        tb.fs = [(u'Short text', dict(runs[0][1]))]
+        self.assertEqual(tb.getOverflow(), [])
+        tb.appendString(runs)
+        self.assertEqual(fsLength(tb.getOverflow()), fsLength(self.layout.getOverflow(tb.fs, 200, 300)))
+        tb.style['textLayout'] = TOTAL_FIT_LAYOUT
+        totalFit = getTextLayout(TOTAL_FIT_LAYOUT)
+        self.assertEqual(tb.getTextSize(), totalFit.getTextSize(tb.fs, 200))
+        self.assertEqual(tb.getOverflow(), totalFit.getOverflow(tb.fs, 200, 300))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     test_textstyle.py
+#
+#     getTextStyle answers the cached TextStyle of an element and a style, as
+#     long as the style and the cascading values of the element did not change.
+#
+import unittest
+
+from pagebot import getTextStyle
+from pagebot.document import Document
+from pagebot.elements import newRect
+
+class TextStyleTest(unittest.TestCase):
+
+    def test_cached(self):
+        style = dict(fontSize=12)
+        textStyle = getTextStyle(None, style)
+        self.assertTrue(getTextStyle(None, style) is textStyle)
+        self.assertTrue(getTextStyle(None, [style]) is textStyle) # Same stack of one style.
+        style['fontSize'] = 14
+        self.assertFalse(getTextStyle(None, style) is textStyle)
+
+    def test_nestedValues(self):
+        style = dict(fontSize=12, tabs=[(10, 'left')], openTypeFeatures=dict(liga=True))
+        textStyle = getTextStyle(None, style)
+        style['tabs'].append((20, 'left')) # Changed in place.
+        changed = getTextStyle(None, style)
+        self.assertFalse(changed is textStyle)
+        self.assertTrue(getTextStyle(None, style) is changed)
+        style['openTypeFeatures']['liga'] = False
+        self.assertFalse(getTextStyle(None, style) is changed)
+
+    def test_elementChanged(self):
+        doc = Document(w=500, h=800, autoPages=1)
+        e = newRect(parent=doc[0], w=100, h=100)
+        style = dict(fontSize=12)
+        e.css('textFill') # Cascading value is cached, so changes in doc invalidate it.
+        textStyle = getTextStyle(e, style)
+        self.assertTrue(getTextStyle(e, style) is textStyle)
+        doc.rootStyle['textFill'] = 0.5
+        self.assertFalse(getTextStyle(e, style) is textStyle)
+
+if __name__ == '__main__':
+    unittest.main()
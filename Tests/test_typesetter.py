@@ -0,0 +1,161 @@
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens & Font Bureau
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#     Made for usage in DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#     test_typesetter.py
+#
+#     The Typesetter merges the styles of the document for the tag path of the
+#     nodes, and merges them again after the styles of the document changed.
+#     Typesetting a node tree or a file as stream of events answers the same
+#     galley as typesetting the tree recursively.
+#
+import os
+import shutil
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+from pagebot import typesetter
+from pagebot.document import Document
+from pagebot.typesetter import Typesetter
+from pagebot.elements import newGalley
+
+XML = u"""<?xml version="1.0" encoding="utf-8"?>
+<document><h1>Title with <em>emphasis</em> and tail</h1>
+<p>Text with a footnote<sup id="fnref:1">1</sup> after the sup and a reference
+<literatureref id="litref:book">[1]</literatureref> after the reference.</p>
+<ul><li>One <strong>strong</strong> item<ul><li>Nested <em>item</em> end</li>
+<li>Second nested</li></ul> tail of the nested list</li><li>Two</li></ul>
+<p>Last <em>em <strong>in em</strong> tail of strong</em> tail of em</p>
+<div class="footnote"><ol><li><p>The footnote text.</p></li></ol></div>
+</document>"""
+
+STYLE_NAMES = ('name', 'fontSize', 'textFill')
+
+def recordFS(s, e=None, style=None):
+    u"""Answer the string *s* as list of runs, with the style values that tell which style was used."""
+    return [(s, dict([(name, (style or {}).get(name)) for name in STYLE_NAMES]))]
+
+class RecursiveTypesetter(Typesetter):
+    u"""Typesetter with the recursive typesetNode, that typesetEvents replaced."""
+    def typesetNode(self, node, e=None):
+        if self.peekStyle() is None and e is not None:
+            self.pushStyle({})
+        startHook = getattr(self, 'start_%s' % node.tag, None)
+        if startHook is not None:
+            startHook(node, e)
+        self.addHistory(node.tag)
+        nodeStyle = self.getNodeStyle(node.tag)
+        self.pushStyle(nodeStyle)
+        self.tagStack.append(node.tag)
+        nodeText = self._strip(node.text)
+        if nodeText:
+            self.galley.appendString(typesetter.newFS(nodeText, e, nodeStyle))
+        for child in node:
+            if not isinstance(child.tag, basestring): # Comment, only the tail is typeset.
+                pass
+            elif hasattr(self, 'node_' + child.tag):
+                getattr(self, 'node_' + child.tag)(child, e)
+            else:
+                self.typesetNode(child, e)
+            if child.tail:
+                self.galley.appendString(typesetter.newFS(child.tail, e, nodeStyle))
+        self.popStyle()
+        self.tagStack.pop()
+
+class TypesetterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.doc = Document(w=500, h=800, autoPages=1)
+        self.doc.newStyle(name='h1', fontSize=20)
+        self.doc.newStyle(name='h1 em', fontSize=16)
+        self.typesetter = Typesetter(self.doc, newGalley())
+
+    def test_nodeStyles(self):
+        t = self.typesetter
+        style = t.getNodeStyle('h1')
+        self.assertEqual(style['fontSize'], 20)
+        self.assertTrue(t.getNodeStyle('h1') is style) # Memoized
+        t.tagStack.append('h1')
+        self.assertEqual(t.getNodeStyle('em')['fontSize'], 16)
+
+    def test_changedStyles(self):
+        t = self.typesetter
+        doc = self.doc
+        self.assertEqual(t.getNodeStyle('h1')['fontSize'], 20)
+        doc.styles['h1']['fontSize'] = 30 # Changed in place.
+        self.assertEqual(t.getNodeStyle('h1')['fontSize'], 30)
+        doc.add2Style('h1', dict(fontSize=32))
+        self.assertEqual(t.getNodeStyle('h1')['fontSize'], 32)
+        doc.newStyle(name='h1', fontSize=34) # Replaced
+        self.assertEqual(t.getNodeStyle('h1')['fontSize'], 34)
+        doc.rootStyle['textFill'] = 0.5 # Inherited from the root style.
+        self.assertEqual(t.getNodeStyle('h1')['textFill'], 0.5)
+        doc.removeStyle('h1')
+        self.assertEqual(t.getNodeStyle('h1')['fontSize'], doc.rootStyle['fontSize'])
+
+class TypesetEventsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.newFS = typesetter.newFS
+        typesetter.newFS = recordFS # Compare the text and styles of the galleys, also without DrawBot.
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        typesetter.newFS = self.newFS
+        shutil.rmtree(self.folder)
+
+    def newDocument(self):
+        doc = Document(w=500, h=800, autoPages=1)
+        doc.newStyle(name='h1', fontSize=20)
+        doc.newStyle(name='em', textFill=0.5)
+        doc.newStyle(name='h1 em', fontSize=18)
+        doc.newStyle(name='strong', fontSize=11)
+        doc.newStyle(name='li', fontSize=9)
+        doc.newStyle(name='li li', fontSize=8)
+        doc.newStyle(name='sup', fontSize=6)
+        return doc
+
+    def getResult(self, typesetterClass, typeset):
+        u"""Answer the runs and markers of the galley and the footnotes, typeset by typeset(typesetter)."""
+        doc = self.newDocument()
+        t = typesetterClass(doc, newGalley())
+        typeset(t)
+        boxes = [(tb.fs, tb.markers) for tb in t.galley.elements]
+        footnotes = sorted([(index, footnote['nodeId'], ET.tostring(footnote['p']))
+            for index, footnote in doc.lib['footnotes'].items()])
+        return boxes, footnotes
+
+    def getRoot(self):
+        root = ET.fromstring(XML.encode('utf-8'))
+        comment = ET.Comment(u'Comment that is not typeset')
+        comment.tail = u'Tail of the comment'
+        root.insert(2, comment)
+        return root
+
+    def test_typesetNode(self):
+        expected = self.getResult(RecursiveTypesetter, lambda t: t.typesetNode(self.getRoot()))
+        self.assertTrue(expected[0][0][1]) # Markers of the footnote.
+        self.assertEqual(len(expected[1]), 1)
+        self.assertTrue(u'Tail of the comment' in [text for text, style in expected[0][0][0]])
+        self.assertEqual(self.getResult(Typesetter, lambda t: t.typesetNode(self.getRoot())), expected)
+
+    def test_typesetFile(self):
+        path = os.path.join(self.folder, 'chapter.xml')
+        f = open(path, 'wb')
+        f.write(XML.replace(u'<p>Last', u'<!-- Comment -->Tail of the comment<p>Last').encode('utf-8'))
+        f.close()
+        root = ET.fromstring(XML.encode('utf-8')) # Same tree, the parser skips the comment.
+        root[2].tail = (root[2].tail or u'') + u'Tail of the comment'
+        expected = self.getResult(RecursiveTypesetter, lambda t: t.typesetNode(root))
+        self.assertEqual(self.getResult(Typesetter, lambda t: t.typesetFile(path)), expected)
+
+if __name__ == '__main__':
+    unittest.main()